@@ -10,6 +10,7 @@ class CollectionAdminBase(ResourceAdminBase):
     create_collection_view_class = views.collection.CreateCollectionView
     delete_collection_view_class = views.collection.DeleteCollectionView
     upload_item_view_class = views.collection.UploadFileView
+    upload_item_status_view_class = views.base.UploadStatusView
     delete_item_view_class = views.collection.DeleteFileView
     change_item_view_class = views.collection.ChangeFileView
     sort_items_view_class = views.collection.SortItemsView
@@ -32,6 +33,11 @@ class CollectionAdminBase(ResourceAdminBase):
                 self.admin_site.admin_view(self.upload_item_view_class.as_view()),
                 name="%s_%s_upload_item" % info,
             ),
+            path(
+                "upload-item-status/",
+                self.admin_site.admin_view(self.upload_item_status_view_class.as_view()),
+                name="%s_%s_upload_item_status" % info,
+            ),
             path(
                 "delete-item/",
                 self.admin_site.admin_view(self.delete_item_view_class.as_view()),
@@ -8,6 +8,7 @@ from .base import ResourceAdminBase
 
 class UploadedFileAdminBase(ResourceAdminBase):
     upload_view_class = views.file.UploadFileView
+    upload_status_view_class = views.base.UploadStatusView
     delete_view_class = views.file.DeleteFileView
     change_view_class = views.file.ChangeFileView
 
@@ -19,6 +20,11 @@ class UploadedFileAdminBase(ResourceAdminBase):
                 self.admin_site.admin_view(self.upload_view_class.as_view()),
                 name="%s_%s_upload" % info,
             ),
+            path(
+                "upload-status/",
+                self.admin_site.admin_view(self.upload_status_view_class.as_view()),
+                name="%s_%s_upload_status" % info,
+            ),
             path(
                 "delete/",
                 self.admin_site.admin_view(self.delete_view_class.as_view()),
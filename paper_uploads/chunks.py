@@ -0,0 +1,279 @@
+"""
+Сборка загружаемого файла из частей.
+
+Части могут поступать в произвольном порядке и параллельно. Каждая часть
+записывается по своему смещению в общий временный файл, после чего рядом
+с ним, в каталоге `<uuid>.parts`, создаётся файл-отметка с именем
+`<начало>-<конец>`. Отметка создаётся атомарно и только после записи данных,
+поэтому по списку отметок всегда можно определить полученные диапазоны.
+
+Контрольная сумма рассчитывается по мере поступления частей: после записи
+каждой части хэшируются завершённые 4-мегабайтные блоки непрерывного начала
+файла. Хэши блоков сохраняются в файле `<uuid>.checksum`. Состояние зависит
+только от содержимого файла, поэтому одновременное обновление из разных
+запросов не требует блокировок.
+
+Незавершённые загрузки сохраняются, чтобы клиент мог продолжить загрузку
+с недостающих частей, и удаляются по истечении времени `UPLOAD_TTL`
+с момента получения последней части. Запрос удаляет просроченные загрузки
+только своей сессии; загрузки остальных сессий удаляет команда
+`remove_expired_uploads`.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+from .utils import ContentHash
+
+__all__ = ["ChunkedUpload", "remove_all_expired_uploads", "remove_expired_uploads"]
+
+
+class ChunkedUpload:
+    def __init__(self, tempdir: str, uid: str):
+        self.path = os.path.join(tempdir, uid)
+        self.parts_dir = self.path + ".parts"
+        self.checksum_path = self.path + ".checksum"
+        self.done_path = self.path + ".done"
+
+    def write(self, chunks: Iterable[bytes], offset: Optional[int] = None, total_size: Optional[int] = None):
+        """
+        Запись части файла по смещению `offset`.
+        Если смещение не указано, часть дописывается в конец файла
+        (клиент отправляет части строго по порядку). Иначе, если указан
+        полный размер файла `total_size`, место под файл выделяется заранее.
+        """
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+b") as fp:
+            if offset is None:
+                offset = fp.seek(0, os.SEEK_END)
+            elif total_size and os.fstat(fp.fileno()).st_size < total_size:
+                fp.truncate(total_size)
+
+            fp.seek(offset)
+            for data in chunks:
+                fp.write(data)
+            end = fp.tell()
+
+        self._mark_received(offset, end)
+        self._update_checksum()
+
+    def _mark_received(self, start: int, end: int):
+        name = "{}-{}".format(start, end)
+        marker = os.path.join(self.parts_dir, name)
+        tmp_marker = os.path.join(self.parts_dir, ".{}.{}".format(name, uuid.uuid4().hex))
+        with open(tmp_marker, "wb"):
+            pass
+        os.replace(tmp_marker, marker)
+
+    def get_received_ranges(self) -> List[Tuple[int, int]]:
+        """
+        Полученные диапазоны байт, отсортированные по началу диапазона.
+        """
+        try:
+            names = os.listdir(self.parts_dir)
+        except FileNotFoundError:
+            return []
+
+        ranges = []
+        for name in names:
+            if name.startswith("."):
+                continue
+            start, end = name.split("-", 1)
+            ranges.append((int(start), int(end)))
+        return sorted(ranges)
+
+    def get_contiguous_size(self) -> int:
+        """
+        Размер непрерывного начала файла, все части которого получены.
+        """
+        size = 0
+        for start, end in self.get_received_ranges():
+            if start > size:
+                break
+            size = max(size, end)
+        return size
+
+    def get_size(self) -> int:
+        """
+        Текущий размер временного файла.
+        """
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def get_modified_time(self) -> Optional[float]:
+        """
+        Время получения последней части.
+        """
+        try:
+            return os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return None
+
+    def is_complete(self, total_chunks: int, total_size: int = 0) -> bool:
+        """
+        Проверка получения всех частей файла.
+
+        Если размер файла известен, полученные диапазоны должны покрывать
+        его целиком - повторно полученные или пересекающиеся части
+        не считаются лишний раз. Иначе (только при дозаписи частей в конец
+        файла) сравнивается количество полученных частей.
+        """
+        if total_size:
+            try:
+                file_size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                return False
+            return file_size == total_size and self.get_contiguous_size() == total_size
+        return len(self.get_received_ranges()) >= total_chunks
+
+    def claim(self) -> bool:
+        """
+        Захват права на завершение загрузки.
+        Если последние части поступили одновременно, завершение загрузки
+        выполняет только один из запросов.
+        """
+        try:
+            fd = os.open(self.done_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def _load_content_hash(self) -> ContentHash:
+        try:
+            with open(self.checksum_path, "r") as fp:
+                blocks = json.load(fp)
+        except (OSError, ValueError):
+            return ContentHash()
+        return ContentHash(bytes.fromhex(block) for block in blocks)
+
+    def _save_content_hash(self, content_hash: ContentHash):
+        tmp_path = "{}.{}".format(self.checksum_path, uuid.uuid4().hex)
+        with open(tmp_path, "w") as fp:
+            json.dump([block.hex() for block in content_hash.blocks], fp)
+        os.replace(tmp_path, self.checksum_path)
+
+    def _update_checksum(self):
+        """
+        Хэширование завершённых блоков непрерывного начала файла.
+        Только что записанные данные читаются из кэша страниц ОС.
+        """
+        content_hash = self._load_content_hash()
+        available = self.get_contiguous_size() - content_hash.offset
+        block_count = available // ContentHash.block_size
+        if block_count <= 0:
+            return
+
+        with open(self.path, "rb") as fp:
+            fp.seek(content_hash.offset)
+            for _ in range(block_count):
+                content_hash.update(fp.read(ContentHash.block_size))
+
+        self._save_content_hash(content_hash)
+
+    def get_checksum(self) -> str:
+        """
+        Контрольная сумма собранного файла.
+        Дочитывается только то, что не было захэшировано при получении частей.
+        """
+        content_hash = self._load_content_hash()
+        with open(self.path, "rb") as fp:
+            fp.seek(content_hash.offset)
+            while True:
+                data = fp.read(ContentHash.block_size)
+                if not data:
+                    break
+                content_hash.update(data)
+        return content_hash.hexdigest()
+
+    def cleanup(self):
+        """
+        Удаление служебных файлов. Сам временный файл не удаляется.
+        """
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        for path in (self.checksum_path, self.done_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def discard(self):
+        """
+        Удаление временного файла и служебных файлов.
+        """
+        self.cleanup()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_expired_uploads(tempdir: str, ttl: int) -> int:
+    """
+    Удаление незавершённых загрузок, части которых не поступали
+    дольше `ttl` секунд. Возвращает количество удалённых загрузок.
+    """
+    try:
+        names = os.listdir(tempdir)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    expiration_time = time.time() - ttl
+    for name in names:
+        try:
+            uuid.UUID(name)
+        except ValueError:
+            continue
+
+        upload = ChunkedUpload(tempdir, name)
+        modified_time = upload.get_modified_time()
+        if modified_time is not None and modified_time < expiration_time:
+            upload.discard()
+            removed += 1
+    return removed
+
+
+def remove_all_expired_uploads(root: str, ttl: int) -> int:
+    """
+    Удаление просроченных загрузок из каталогов всех сессий
+    (`paper_uploads.*`) внутри каталога `root`. Опустевшие каталоги,
+    которые не изменялись дольше `ttl` секунд, также удаляются.
+    Возвращает количество удалённых загрузок.
+    """
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    expiration_time = time.time() - ttl
+    for name in names:
+        tempdir = os.path.join(root, name)
+        if not name.startswith("paper_uploads.") or not os.path.isdir(tempdir):
+            continue
+
+        # время изменения каталога до удаления из него загрузок
+        try:
+            modified_time = os.path.getmtime(tempdir)
+        except FileNotFoundError:
+            continue
+
+        removed += remove_expired_uploads(tempdir, ttl)
+
+        if modified_time < expiration_time:
+            try:
+                # Удаляется только пустой каталог. Сессия, которая
+                # на него ссылается, создаст новый каталог.
+                os.rmdir(tempdir)
+            except OSError:
+                pass
+    return removed
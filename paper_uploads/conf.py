@@ -5,7 +5,7 @@ from django import conf
 from django.utils.module_loading import import_string
 
 DEFAULTS = {
-    "STORAGE": "django.core.files.storage.FileSystemStorage",
+    "STORAGE": "paper_uploads.storage.FileSystemStorage",
     "STORAGE_OPTIONS": {},
     "FILES_UPLOAD_TO": "files/%Y/%m/%d",
     "IMAGES_UPLOAD_TO": "images/%Y/%m/%d",
@@ -14,9 +14,22 @@ DEFAULTS = {
     "COLLECTION_ITEM_PREVIEW_WIDTH": 180,
     "COLLECTION_ITEM_PREVIEW_HEIGHT": 135,
 
+    "MAX_IMAGE_PIXELS": None,
+    "UPLOAD_TTL": 86400,
+    "UPLOAD_MAX_SIZE": 4294967296,
+    "RESERVATION_STORAGE_CHECK": False,
+
     "RQ_ENABLED": False,
     "RQ_QUEUE_NAME": "default",
+    "TASK_BACKEND": None,
+    "TASK_BACKEND_OPTIONS": {},
     "VARIATION_DEFAULTS": None,
+
+    "RECUT_EXECUTOR": "concurrent.futures.ThreadPoolExecutor",
+    "RECUT_WORKERS": None,
+    "RECUT_CASCADE": True,
+    "RECUT_SPOOL_MAX_SIZE": 2621440,
+    "RECUT_MAX_PIXELS_IN_MEMORY": None,
 }
 
 # Иконки для файлов в галерее
@@ -152,7 +165,7 @@ class Settings:
 settings = Settings(
     user_settings=getattr(conf.settings, "PAPER_UPLOADS", {}),
     defaults=DEFAULTS,
-    import_strings={"STORAGE"}
+    import_strings={"STORAGE", "RECUT_EXECUTOR", "TASK_BACKEND"}
 )
 
 
@@ -164,6 +177,7 @@ IMAGE_ITEM_VARIATIONS = dict(
         ),
         format="jpeg",
         versions={"webp", "2x"},
+        priority="high",
         jpeg=dict(
             quality=75
         ),
@@ -1,6 +1,7 @@
 import operator
 import os
 from decimal import Decimal
+from typing import Any, Dict, Optional
 
 from django.core.files import File
 from django.core.files.uploadedfile import UploadedFile
@@ -17,8 +18,14 @@ class TemporaryUploadedFile(UploadedFile):
     В отличие от django.core.files.uploadedfile.TemporaryUploadedFile, не создает
     новый временный файл, а оборачивает уже существующий. Используется для передачи
     загруженного файла в функцию сохранения.
+
+    Наличие метода `temporary_file_path()` позволяет файловому хранилищу
+    переместить файл на место назначения, а не копировать его содержимое.
     """
 
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
     def close(self):
         super().close()
         try:
@@ -30,13 +37,24 @@ class TemporaryUploadedFile(UploadedFile):
 class VariationFile(File):
     """
     Файл вариации изображения.
+
+    Размер файла, габариты и факт существования определяются по манифесту
+    вариаций экземпляра. К хранилищу происходит обращение только в том случае,
+    если в манифесте нет записи для данной вариации.
+
+    Вариация и габариты вычисляются один раз за время жизни объекта.
+    URL запоминается, только если у хранилища установлен атрибут
+    `cache_urls = True`: хранилище может выдавать подписанные
+    или ограниченные по времени ссылки.
     """
 
     def __init__(self, instance, variation_name):
         self.instance = instance
         self.variation_name = variation_name
         self.storage = instance.get_file().storage
-        filename = self.variation.get_output_filename(instance.name)
+        self._variation = instance.get_variations()[variation_name]
+        self._url_cache = None
+        filename = self._variation.get_output_filename(instance.name)
         super().__init__(None, filename)
 
     def __eq__(self, other):
@@ -69,8 +87,20 @@ class VariationFile(File):
 
     @property
     def variation(self) -> PaperVariation:
-        variations = self.instance.get_variations()
-        return variations[self.variation_name]
+        return self._variation
+
+    @property
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Запись манифеста вариаций, соответствующая файлу.
+        """
+        if not self:
+            return None
+
+        entry = self.instance.variations_manifest.get(self.variation_name)
+        if not entry or entry.get("name") != self.name:
+            return None
+        return entry
 
     @property
     def path(self) -> str:
@@ -80,16 +110,27 @@ class VariationFile(File):
     @property
     def url(self) -> str:
         self._require_file()
-        return self.storage.url(self.name)
+        if not getattr(self.storage, "cache_urls", False):
+            return self.storage.url(self.name)
+
+        # URL запоминается вместе с именем файла, для которого он получен
+        if self._url_cache is None or self._url_cache[0] != self.name:
+            self._url_cache = (self.name, self.storage.url(self.name))
+        return self._url_cache[1]
 
     @property
     def size(self) -> int:
         self._require_file()
+        manifest = self.manifest
+        if manifest is not None:
+            return manifest["size"]
         return self.storage.size(self.name)
 
     def exists(self) -> bool:
         if not self:
             return False
+        if self.manifest is not None:
+            return True
         return self.storage.exists(self.name)
 
     def open(self, mode: str = "rb"):
@@ -112,6 +153,7 @@ class VariationFile(File):
             del self.file
 
         self.storage.delete(self.name)
+        self.instance.variations_manifest.pop(self.variation_name, None)
         self.name = None
 
     delete.alters_data = True
@@ -161,6 +203,10 @@ class VariationFile(File):
 
     @cached_method("_dimensions_cache")
     def _get_image_dimensions(self):
+        manifest = self.manifest
+        if manifest is not None:
+            return manifest["width"], manifest["height"]
+
         return self.variation.get_output_size(
             (self.instance.width, self.instance.height)
         )
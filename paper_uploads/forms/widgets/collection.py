@@ -58,6 +58,7 @@ class CollectionWidget(DisplayFileLimitationsMixin, FileResourceWidgetBase):
             "create_collection_url": reverse_lazy("admin:%s_%s_create" % info),
             "delete_collection_url": reverse_lazy("admin:%s_%s_delete" % info),
             "upload_item_url": reverse_lazy("admin:%s_%s_upload_item" % info),
+            "upload_item_status_url": reverse_lazy("admin:%s_%s_upload_item_status" % info),
             "change_item_url": reverse_lazy("admin:%s_%s_change_item" % info),
             "delete_item_url": reverse_lazy("admin:%s_%s_delete_item" % info),
             "sort_items_url": reverse_lazy("admin:%s_%s_sort_items" % info),
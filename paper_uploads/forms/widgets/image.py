@@ -36,6 +36,7 @@ class ImageWidget(DisplayFileLimitationsMixin, FileResourceWidgetBase):
         info = model._meta.app_label, model._meta.model_name
         return {
             "upload_url": reverse_lazy("admin:%s_%s_upload" % info),
+            "upload_status_url": reverse_lazy("admin:%s_%s_upload_status" % info),
             "change_url": reverse_lazy("admin:%s_%s_change" % info),
             "delete_url": reverse_lazy("admin:%s_%s_delete" % info),
         }
@@ -1,29 +1,29 @@
 import os
-import time
+import threading
+from collections import OrderedDict
 from functools import lru_cache
 from typing import Any, Dict, Generator, Iterable, Iterator, List, Set, Tuple, Type
 
 from anytree import Node
 from django.apps import apps
 from django.core import exceptions
-from django.core.exceptions import ObjectDoesNotExist
 from django.db import DEFAULT_DB_ALIAS, models
+from django.utils.hashable import make_hashable
 
 from .conf import settings
-from .logging import logger
 from .typing import VariationConfig
 from .utils import lowercased_dict_keys
-from .variations import PaperVariation
+from .variations import PRIORITY_LOW, PaperVariation
 
 # Перечень допустимых версий вариаций
 ALLOWED_VERSIONS = {"webp", "2x", "3x", "4x"}
 
-# Максимальное количество попыток чтения из БД при получении
-# экземпляра модели. Сделано потому, что каждый запрос оборачивается
-# в транзакцию. Из-за этого вызов `recut()` (даже после метода `save()`)
-# не гарантирует, что данные уже попали в БД.
-# TODO: поискать альтернативные решения
-MAX_DB_READ_ATTEMPTS = 3
+# Максимальное количество различных конфигураций вариаций,
+# результаты для которых хранятся в кэше `build_variations()`.
+VARIATIONS_CACHE_SIZE = 256
+
+_variations_cache = OrderedDict()  # type: OrderedDict
+_variations_cache_lock = threading.Lock()
 
 
 def get_filename(filename: str) -> str:
@@ -71,6 +71,10 @@ def generate_scaled_versions(
     if scale_factor > 1:
         variation_config["upscale"] = True
 
+    # Retina-версии большой кратности по умолчанию нарезаются в последнюю очередь
+    if scale_factor > 2:
+        variation_config.setdefault("priority", PRIORITY_LOW)
+
     yield PaperVariation(**variation_config)
 
     if webp:
@@ -86,6 +90,9 @@ def generate_scaled_versions(
         if scale_factor > 1:
             variation_config["upscale"] = True
 
+        # WebP-версии по умолчанию нарезаются в последнюю очередь
+        variation_config.setdefault("priority", PRIORITY_LOW)
+
         yield PaperVariation(**variation_config)
 
 
@@ -108,7 +115,43 @@ def generate_variation_versions(
 def build_variations(options: Dict[str, VariationConfig]) -> Dict[str, PaperVariation]:
     """
     Создание объектов вариаций из словаря конфигураций.
+
+    Результат кэшируется на уровне процесса: экземпляры с одинаковой
+    конфигурацией вариаций (например, все изображения одного поля)
+    получают одни и те же объекты `PaperVariation`. Поэтому изменять
+    полученные вариации нельзя. Сам словарь — новый при каждом вызове.
+    """
+    try:
+        key = make_hashable((options, settings.VARIATION_DEFAULTS))
+    except TypeError:
+        # в конфигурации есть нехэшируемые значения
+        return _build_variations(options)
+
+    with _variations_cache_lock:
+        variations = _variations_cache.get(key)
+        if variations is not None:
+            _variations_cache.move_to_end(key)
+            return dict(variations)
+
+    variations = _build_variations(options)
+
+    with _variations_cache_lock:
+        _variations_cache[key] = variations
+        while len(_variations_cache) > VARIATIONS_CACHE_SIZE:
+            _variations_cache.popitem(last=False)
+
+    return dict(variations)
+
+
+def clear_variations_cache():
+    """
+    Очистка кэша функции `build_variations()`.
     """
+    with _variations_cache_lock:
+        _variations_cache.clear()
+
+
+def _build_variations(options: Dict[str, VariationConfig]) -> Dict[str, PaperVariation]:
     variations = {}
     for name, config in options.items():
         new_config = lowercased_dict_keys(settings.VARIATION_DEFAULTS or {})
@@ -277,18 +320,7 @@ def get_instance(
     Получение экземпляра модели по названию приложения, модели и ID.
     """
     model_class = apps.get_model(app_label, model_name)
-    attempts = 1
-    while True:
-        try:
-            return model_class._base_manager.using(using).get(pk=object_id)
-        except ObjectDoesNotExist:
-            # delay recheck if transaction not committed yet
-            attempts += 1
-            if attempts > MAX_DB_READ_ATTEMPTS:
-                logger.exception("Instance #%s not found" % object_id)
-                raise
-            else:
-                time.sleep(1)
+    return model_class._base_manager.using(using).get(pk=object_id)
 
 
 def run_validators(value: Any, validators: Iterable[Any]):
@@ -11,6 +11,7 @@ from ... import exceptions, helpers
 from ...models.base import FileFieldResource, FileResource, VersatileImageResourceMixin
 from ...models.collection import Collection, CollectionItemBase
 from ...models.mixins import BacklinkModelMixin
+from .. import utils
 
 
 class Command(BaseCommand):
@@ -20,6 +21,7 @@ class Command(BaseCommand):
     options = None
     verbosity = None
     database = DEFAULT_DB_ALIAS
+    _listing = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -58,6 +60,7 @@ class Command(BaseCommand):
         self.options = options
         self.verbosity = options["verbosity"]
         self.database = options["database"]
+        self._listing = utils.StorageListing()
         self.run_steps()
 
     def run_steps(self):
@@ -246,7 +249,7 @@ class Command(BaseCommand):
         queryset = queryset.only(*query_fields)
 
         for instance in queryset.iterator():
-            if not instance.file_exists():
+            if not utils.resource_file_exists(instance, self._listing):
                 print(
                     "\033[31mERROR\033[0m: "
                     "\033[92m{}.{}\033[0m #{} references a file that does not exist".format(
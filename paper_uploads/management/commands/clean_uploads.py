@@ -12,6 +12,7 @@ from ... import helpers
 from ...models.base import FileResource
 from ...models.collection import Collection, CollectionBase, CollectionItemBase
 from ...models.mixins import BacklinkModelMixin
+from .. import utils
 from ..prompt import prompt_action
 
 
@@ -46,6 +47,7 @@ class Command(BaseCommand):
     _check_content_types = False
     _check_ownership = False
     _check_file_existence = False
+    _listing = None
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -84,6 +86,7 @@ class Command(BaseCommand):
         self.options = options
         self.verbosity = options["verbosity"]
         self.database = options["database"]
+        self._listing = utils.StorageListing()
 
         check_content_types = self.options["check_content_types"]
         check_ownership = self.options["check_ownership"]
@@ -348,7 +351,7 @@ class Command(BaseCommand):
 
         objects = set()
         for instance in queryset.iterator():
-            if not instance.file_exists():
+            if not utils.resource_file_exists(instance, self._listing):
                 objects.add(instance)
 
         if not objects:
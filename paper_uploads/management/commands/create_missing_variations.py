@@ -1,4 +1,4 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.db import DEFAULT_DB_ALIAS
 
 from .. import helpers
@@ -21,11 +21,32 @@ class Command(BaseCommand):
         parser.add_argument(
             "--async",
             action="store_true",
-            help="Use django-rq to create variation files",
+            help="Use the background task backend to create variation files",
+        )
+        parser.add_argument(
+            "--changed-only",
+            action="store_true",
+            help="Also recreate variations whose configuration has changed "
+                 "since the files were generated",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            metavar="N",
+            help="Create variations in N processes. Errors are collected "
+                 "into a summary instead of aborting the command",
         )
 
     def handle(self, *args, **options):
+        if options["jobs"] is not None:
+            if options["jobs"] < 1:
+                raise CommandError("--jobs must be a positive integer")
+            if options["async"]:
+                raise CommandError("--jobs cannot be used together with --async")
+
         helpers.create_missing_variations(
             async_=options["async"],
-            database=options["database"]
+            database=options["database"],
+            changed_only=options["changed_only"],
+            jobs=options["jobs"]
         )
@@ -3,12 +3,12 @@ from enum import Enum, auto
 
 from django.apps import apps
 from django.core.exceptions import FieldDoesNotExist
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.db import DEFAULT_DB_ALIAS
 
 from paper_uploads.management import helpers
 
-from .. import utils
+from .. import parallel, utils
 from ..conf import ALL_VARIATIONS
 
 
@@ -78,7 +78,20 @@ class Command(BaseCommand):
         parser.add_argument(
             "--async",
             action="store_true",
-            help="Use django-rq to create variation files",
+            help="Use the background task backend to create variation files",
+        )
+        parser.add_argument(
+            "--changed-only",
+            action="store_true",
+            help="Only recreate variations whose configuration has changed "
+                 "since the files were generated",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            metavar="N",
+            help="Recreate variations in N processes. Errors are collected "
+                 "into a summary instead of aborting the command",
         )
         parser.add_argument(
             "--database",
@@ -94,6 +107,12 @@ class Command(BaseCommand):
         self.verbosity = options["verbosity"]
         self.database = options["database"]
 
+        if options["jobs"] is not None:
+            if options["jobs"] < 1:
+                raise CommandError("--jobs must be a positive integer")
+            if options["async"]:
+                raise CommandError("--jobs cannot be used together with --async")
+
         try:
             self.loop()
         except ExitException:
@@ -268,6 +287,17 @@ class Command(BaseCommand):
 
         queryset = self._model.objects.using(self.database)
 
+        if self.options["jobs"] is not None:
+            item_model = self._model.item_types[self._field_name].model
+            tasks = (
+                self._create_task(item_model, pk)
+                for collection in queryset.iterator()
+                for pk in collection.get_items(self._field_name).values_list("pk", flat=True)
+            )
+            parallel.recut_parallel(tasks, jobs=self.options["jobs"])
+            self._step = Step.END
+            return
+
         total = queryset.count()
         for index, collection in enumerate(queryset.iterator(), start=1):
             collection_items = collection.get_items(self._field_name)
@@ -292,11 +322,15 @@ class Command(BaseCommand):
             async_ = self.options["async"]
 
             for item in collection_items.iterator():
+                names = self._get_variation_names(item)
+                if names is None:
+                    continue
+
                 if async_:
-                    item.recut_async(names=self._variation_names)
+                    item.recut_async(names=names)
                 else:
                     try:
-                        item.recut(names=self._variation_names)
+                        item.recut(names=names)
                     except FileNotFoundError:
                         print(
                             "\n"
@@ -322,8 +356,23 @@ class Command(BaseCommand):
 
         queryset = self._model.objects.using(self.database).exclude((self._field_name, None))
 
+        if self.options["jobs"] is not None:
+            resource_model = self._model._meta.get_field(self._field_name).related_model
+            tasks = (
+                self._create_task(resource_model, pk)
+                for pk in queryset.values_list(self._field_name, flat=True).iterator()
+            )
+            parallel.recut_parallel(tasks, jobs=self.options["jobs"], total=queryset.count())
+            self._step = Step.END
+            return
+
         total = queryset.count()
         for index, instance in enumerate(queryset.iterator(), start=1):
+            field = getattr(instance, self._field_name)
+            names = self._get_variation_names(field)
+            if names is None:
+                continue
+
             print(
                 "Processing \033[92m'{}.{}'\033[0m (ID: {}) ({}/{}) ... ".format(
                     type(instance)._meta.app_label,
@@ -337,13 +386,12 @@ class Command(BaseCommand):
             sys.stdout.flush()
 
             async_ = self.options["async"]
-            field = getattr(instance, self._field_name)
 
             if async_:
-                field.recut_async(names=self._variation_names)
+                field.recut_async(names=names)
             else:
                 try:
-                    field.recut(names=self._variation_names)
+                    field.recut(names=names)
                 except FileNotFoundError:
                     print(
                         "\n"
@@ -359,3 +407,22 @@ class Command(BaseCommand):
             sys.stdout.flush()
 
         self._step = Step.END
+
+    def _get_variation_names(self, resource):
+        """
+        Получение имён вариаций, которые нужно пересоздать для ресурса.
+        Возвращает None, если пересоздавать нечего.
+        """
+        if not self.options["changed_only"]:
+            return self._variation_names
+
+        return resource.get_stale_variations(self._variation_names) or None
+
+    def _create_task(self, model, pk) -> parallel.RecutTask:
+        return parallel.RecutTask(
+            model_label=model._meta.label,
+            pk=pk,
+            names=tuple(self._variation_names),
+            select=parallel.SELECT_CHANGED if self.options["changed_only"] else parallel.SELECT_GIVEN,
+            database=self.database,
+        )
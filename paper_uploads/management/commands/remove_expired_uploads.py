@@ -0,0 +1,34 @@
+import tempfile
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from ...chunks import remove_all_expired_uploads
+from ...conf import settings as paper_settings
+
+
+class Command(BaseCommand):
+    help = """
+    Удаляет незавершённые загрузки, части которых не поступали дольше
+    `UPLOAD_TTL` секунд, из временных каталогов всех сессий.
+    """
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            metavar="SECONDS",
+            help="Remove uploads that have not been updated for SECONDS. "
+                 "Defaults to the UPLOAD_TTL setting",
+        )
+
+    def handle(self, *args, **options):
+        ttl = options["ttl"]
+        if ttl is None:
+            ttl = paper_settings.UPLOAD_TTL
+
+        root = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+        removed = remove_all_expired_uploads(root, ttl)
+        if options["verbosity"] >= 1:
+            self.stdout.write("Removed {} expired uploads".format(removed))
@@ -285,12 +285,16 @@ class Command(BaseCommand):
             sys.stdout.flush()
 
             for item in collection_items.iterator():
+                removed = []
                 for variation_name in item.get_variations():
                     if self._variation_names and variation_name not in self._variation_names:
                         continue
 
                     variation_file = item.get_variation_file(variation_name)
                     variation_file.delete()
+                    removed.append(variation_name)
+
+                item.update_variations_manifest(removed=removed)
 
             print("done")
             sys.stdout.flush()
@@ -324,12 +328,16 @@ class Command(BaseCommand):
             )
             sys.stdout.flush()
 
+            removed = []
             for variation_name in field.get_variations():
                 if self._variation_names and variation_name not in self._variation_names:
                     continue
 
                 variation_file = field.get_variation_file(variation_name)
                 variation_file.delete()
+                removed.append(variation_name)
+
+            field.update_variations_manifest(removed=removed)
 
             print("done")
             sys.stdout.flush()
@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from .. import helpers
+
+
+class Command(BaseCommand):
+    help = """
+    Бронирование имён изображений и их вариаций, загруженных
+    до появления таблицы FileNameReservation.
+    """
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="store",
+            dest="database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates the database to use. Defaults to the 'default' database.",
+        )
+
+    def handle(self, *args, **options):
+        for instance, conflicts in helpers.reserve_file_names(database=options["database"]):
+            self.stderr.write(
+                "%s.%s #%s: names %s are reserved by other files" % (
+                    type(instance)._meta.app_label,
+                    type(instance).__name__,
+                    instance.pk,
+                    ", ".join("'%s'" % name for name in conflicts)
+                )
+            )
@@ -3,7 +3,7 @@ import sys
 from collections import namedtuple
 from datetime import timedelta
 from itertools import groupby
-from typing import Any, Callable, Generator, List, Tuple, Type, Union
+from typing import Any, Callable, Generator, Iterator, List, Optional, Tuple, Type, Union
 
 from anytree import LevelOrderIter
 from django.apps import apps
@@ -14,7 +14,9 @@ from django.utils.timezone import now
 from .. import helpers
 from ..models.base import Resource
 from ..models.collection import Collection, CollectionBase, CollectionItemBase
-from . import utils
+from ..models.fields import VariationalFileField
+from ..models.reservation import FileNameReservation
+from . import parallel, utils
 from .prompt import prompt_action, prompt_variants
 
 ModelChoice = namedtuple("ModelChoice", ["name", "type"])
@@ -123,42 +125,79 @@ def remove_empty_collections(
 
 
 def find_missing_variations(
-    database: str = DEFAULT_DB_ALIAS
+    database: str = DEFAULT_DB_ALIAS,
+    changed_only: bool = False
 ) -> Generator[Tuple[Resource, List[str]], Any, None]:
     """
     Поиск экземпляров изображений, для которых отсутствует хотя бы один
     файл вариации.
 
+    Существование файлов проверяется по содержимому каталогов хранилища
+    (см. `StorageListing`), а не по манифесту: файл мог быть удалён
+    из хранилища в обход библиотеки.
+
     :param database: алиас базы данных для поиска коллекций.
+    :param changed_only: считать отсутствующими также вариации, созданные
+                         по устаревшей конфигурации (по отпечатку в манифесте).
     """
-    for root in helpers.get_resource_model_trees():
-        for node in reversed(tuple(LevelOrderIter(root))):
-            model = node.model
+    listing = utils.StorageListing()
+    for model in _iterate_variation_models():
+        for instance in model.objects.using(database).iterator():
+            stale_variations = set(instance.get_stale_variations()) if changed_only else set()
+            missing_variations = [
+                vname
+                for vname, vfile in instance.variation_files()
+                if vname in stale_variations or not listing.exists(vfile.storage, vfile.name)
+            ]
 
-            if not utils.is_variations_allowed(model):
-                continue
+            if missing_variations and utils.resource_file_exists(instance, listing):
+                yield instance, missing_variations
 
-            for instance in model.objects.using(database).iterator():
-                missing_variations = []
-                for vname, vfile in instance.variation_files():
-                    if not vfile.exists():
-                        missing_variations.append(vname)
 
-                if missing_variations and instance.file_exists():
-                    yield instance, missing_variations
+def _iterate_variation_models() -> Iterator[Type[models.Model]]:
+    """
+    Перебор моделей изображений, поддерживающих вариации.
+    """
+    for root in helpers.get_resource_model_trees():
+        for node in reversed(tuple(LevelOrderIter(root))):
+            if utils.is_variations_allowed(node.model):
+                yield node.model
 
 
 def create_missing_variations(
     async_: bool = False,
-    database: str = DEFAULT_DB_ALIAS
+    database: str = DEFAULT_DB_ALIAS,
+    changed_only: bool = False,
+    jobs: Optional[int] = None
 ):
     """
     Создание отсутствующих файлов вариаций.
 
-    :param async_: использовать django-rq для создания файлов вариаций.
+    :param async_: создавать файлы вариаций через бэкенд фоновых задач.
     :param database: алиас базы данных для поиска файлов.
+    :param changed_only: пересоздавать также устаревшие вариации.
+    :param jobs: количество процессов для параллельной нарезки.
+                 Проверка и нарезка вариаций выполняются в процессах-исполнителях.
     """
-    for instance, missing_variations in find_missing_variations(database):
+    if jobs is not None:
+        tasks = (
+            parallel.RecutTask(
+                model_label=model._meta.label,
+                pk=pk,
+                select=parallel.SELECT_MISSING_OR_CHANGED if changed_only else parallel.SELECT_MISSING,
+                database=database,
+            )
+            for model in _iterate_variation_models()
+            for pk in model.objects.using(database).values_list("pk", flat=True).iterator()
+        )
+        total = sum(
+            model.objects.using(database).count()
+            for model in _iterate_variation_models()
+        )
+        parallel.recut_parallel(tasks, jobs=jobs, total=total)
+        return
+
+    for instance, missing_variations in find_missing_variations(database, changed_only=changed_only):
         count = len(missing_variations)
 
         print(
@@ -183,6 +222,37 @@ def create_missing_variations(
         sys.stdout.flush()
 
 
+def reserve_file_names(
+    database: str = DEFAULT_DB_ALIAS
+) -> Generator[Tuple[Resource, List[str]], Any, None]:
+    """
+    Бронирование имён файлов изображений и их вариаций, загруженных
+    до появления таблицы `FileNameReservation`.
+
+    Уже забронированные имена пропускаются, поэтому команду можно
+    запускать повторно. Возвращаются экземпляры, имена которых
+    забронированы для других файлов, и сами эти имена.
+
+    :param database: алиас базы данных для поиска файлов.
+    """
+    for model in _iterate_variation_models():
+        field = model.get_file_field()
+        if not isinstance(field, VariationalFileField):
+            continue
+
+        for instance in model.objects.using(database).iterator():
+            file = instance.get_file()
+            if not file:
+                continue
+
+            conflicts = FileNameReservation.reserve_existing(
+                field.get_reservation_root(file.name),
+                field.get_reserved_names(instance, file.name)
+            )
+            if conflicts:
+                yield instance, conflicts
+
+
 def select_resource_model(
     message: str = None,
     multiple: bool = False,
@@ -0,0 +1,187 @@
+"""
+Параллельная нарезка вариаций в нескольких процессах.
+
+Каждая задача описывает один экземпляр изображения (модель и первичный ключ).
+Экземпляр загружается из БД внутри процесса-исполнителя, поэтому
+между процессами передаются только идентификаторы.
+"""
+
+import itertools
+import multiprocessing
+import sys
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import django
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .. import helpers
+from ..conf import settings
+
+# Режимы выбора вариаций для нарезки
+SELECT_GIVEN = "given"      # вариации, переданные в задаче
+SELECT_CHANGED = "changed"  # устаревшие вариации (см. `get_stale_variations()`)
+SELECT_MISSING = "missing"  # отсутствующие файлы вариаций
+SELECT_MISSING_OR_CHANGED = "missing_or_changed"  # отсутствующие и устаревшие вариации
+
+# Кэш содержимого каталогов хранилища (см. `StorageListing`).
+# Создаётся в каждом процессе отдельно.
+_listing = None
+
+
+class RecutTask(NamedTuple):
+    model_label: str
+    pk: int
+    names: Tuple[str, ...] = ()
+    select: str = SELECT_GIVEN
+    database: str = DEFAULT_DB_ALIAS
+
+
+class RecutResult(NamedTuple):
+    task: RecutTask
+    recut: bool                 # были ли нарезаны вариации
+    error: Optional[str] = None
+
+
+def _get_listing():
+    global _listing
+    if _listing is None:
+        # модели доступны только после django.setup()
+        from .utils import StorageListing
+        _listing = StorageListing()
+    return _listing
+
+
+def _init_worker():
+    # При запуске через "spawn" процесс-исполнитель стартует с чистого листа
+    django.setup()
+
+    # кэш, унаследованный при "fork", может быть устаревшим
+    _get_listing().clear()
+
+    # Процессы уже распараллеливают работу, поэтому внутри каждого из них
+    # вариации нарезаются последовательно, если не задано иное.
+    if settings.RECUT_WORKERS is None:
+        settings.RECUT_WORKERS = 1
+
+
+def recut_instance(task: RecutTask) -> RecutResult:
+    """
+    Нарезка вариаций одного экземпляра.
+    Исключения не пробрасываются, а возвращаются в виде текста ошибки.
+    """
+    app_label, model_name = task.model_label.split(".")
+    try:
+        instance = helpers.get_instance(app_label, model_name, task.pk, using=task.database)
+
+        if task.select == SELECT_CHANGED:
+            names = instance.get_stale_variations(task.names)
+        elif task.select in (SELECT_MISSING, SELECT_MISSING_OR_CHANGED):
+            from .utils import resource_file_exists
+
+            if task.select == SELECT_MISSING_OR_CHANGED:
+                stale = set(instance.get_stale_variations(task.names))
+            else:
+                stale = set()
+
+            # Манифест не гарантирует наличие файла в хранилище
+            listing = _get_listing()
+            names = [
+                vname
+                for vname, vfile in instance.variation_files()
+                if vname in stale or not listing.exists(vfile.storage, vfile.name)
+            ]
+            if names and not resource_file_exists(instance, listing):
+                names = []
+        else:
+            names = task.names
+
+        if task.select != SELECT_GIVEN and not names:
+            return RecutResult(task, recut=False)
+
+        instance.recut(names=names)
+    except Exception as exc:
+        return RecutResult(task, recut=False, error="{}: {}".format(type(exc).__name__, exc))
+
+    return RecutResult(task, recut=True)
+
+
+def recut_parallel(
+    tasks: Iterable[RecutTask],
+    jobs: int = 1,
+    total: Optional[int] = None,
+    batch_size: int = 1000
+) -> List[RecutResult]:
+    """
+    Нарезка вариаций для всех задач в пуле из `jobs` процессов.
+
+    Задачи читаются из `tasks` порциями по `batch_size` штук, поэтому
+    итератор может лениво загружать идентификаторы из БД. Общее количество
+    задач `total` используется только для вывода прогресса.
+
+    Ошибки не прерывают обработку — они собираются и выводятся в конце
+    вместе со статистикой.
+    """
+    if total is None and hasattr(tasks, "__len__"):
+        total = len(tasks)
+
+    tasks = iter(tasks)
+    _get_listing().clear()
+    results = []  # type: List[RecutResult]
+    failed = 0
+    start = time.monotonic()
+
+    def report(result: RecutResult):
+        nonlocal failed
+        results.append(result)
+        if result.error:
+            failed += 1
+
+        print(
+            "\rProcessed \033[92m{}\033[0m images ({} failed) ".format(
+                len(results) if total is None else "{}/{}".format(len(results), total),
+                failed
+            ),
+            end=""
+        )
+        sys.stdout.flush()
+
+    if jobs <= 1:
+        for task in tasks:
+            report(recut_instance(task))
+    else:
+        # Соединения с БД не должны наследоваться процессами-исполнителями.
+        connections.close_all()
+
+        with multiprocessing.Pool(jobs, initializer=_init_worker) as pool:
+            # Порции формируются в основном потоке: пул перебирает задачи
+            # в служебном потоке, у которого нет своего соединения с БД.
+            while True:
+                batch = list(itertools.islice(tasks, batch_size))
+                if not batch:
+                    break
+
+                chunksize = max(1, min(64, len(batch) // (jobs * 4)))
+                for result in pool.imap_unordered(recut_instance, batch, chunksize=chunksize):
+                    report(result)
+
+    elapsed = time.monotonic() - start
+    recut_count = sum(1 for result in results if result.recut)
+    print()
+    print(
+        "Recut \033[92m{}\033[0m of {} images in {:.1f}s ({:.2f} images/s)".format(
+            recut_count,
+            len(results),
+            elapsed,
+            recut_count / elapsed if elapsed else 0,
+        )
+    )
+
+    if failed:
+        print("\033[91m{} failed:\033[0m".format(failed))
+        for result in results:
+            if result.error:
+                print("  {} #{}: {}".format(result.task.model_label, result.task.pk, result.error))
+
+    sys.stdout.flush()
+    return results
@@ -1,14 +1,21 @@
-from typing import Dict, Type
+import posixpath
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple, Type
 
+from django.core.files.storage import Storage
 from django.db import models
 from django.db.models.fields import Field
 
 from ..helpers import build_variations
-from ..models.base import Resource, VersatileImageResourceMixin
+from ..models.base import FileFieldResource, Resource, VersatileImageResourceMixin
 from ..models.collection import CollectionBase, CollectionItemBase
 from ..models.fields.collection import CollectionItem
 from ..variations import PaperVariation
 
+# Максимальное количество каталогов, содержимое которых
+# хранится в кэше `StorageListing`.
+STORAGE_LISTING_CACHE_SIZE = 1024
+
 
 def is_variations_allowed(model: Type[models.Model]) -> bool:
     """
@@ -75,3 +82,77 @@ def includes_variations(model: Type[models.Model]) -> bool:
             is_resource_field(field) and is_variations_allowed(field.related_model)
             for field in model._meta.get_fields(include_hidden=True)
         )
+
+
+class StorageListing:
+    """
+    Проверка существования файлов по содержимому каталогов хранилища.
+
+    Вместо запроса к хранилищу для каждого файла, содержимое каталога
+    запрашивается методом `listdir()` один раз и кэшируется.
+    Для хранилищ, не поддерживающих `listdir()`, используется `exists()`.
+
+    В кэше хранится не более `maxsize` каталогов: при переполнении
+    удаляются те, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, maxsize: int = STORAGE_LISTING_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._listings = OrderedDict()  # type: Dict[Tuple[Hashable, str], Optional[Set[str]]]
+
+    def exists(self, storage: Storage, name: str) -> bool:
+        dirname, filename = posixpath.split(name)
+        files = self._get_listing(storage, dirname)
+        if files is None:
+            return storage.exists(name)
+        return filename in files
+
+    def clear(self):
+        self._listings.clear()
+
+    @staticmethod
+    def get_storage_key(storage: Storage) -> Hashable:
+        """
+        Ключ хранилища в кэше. Разные экземпляры одного класса хранилища
+        с одинаковыми параметрами и каталогом разделяют кэш.
+        """
+        storage_class = type(storage)
+        deconstruct = getattr(storage, "deconstruct", None)
+        params = repr(deconstruct()[1:]) if deconstruct is not None else None
+        return (
+            "%s.%s" % (storage_class.__module__, storage_class.__qualname__),
+            getattr(storage, "location", None),
+            params
+        )
+
+    def _get_listing(self, storage: Storage, dirname: str) -> Optional[Set[str]]:
+        key = (self.get_storage_key(storage), dirname)
+        if key in self._listings:
+            self._listings.move_to_end(key)
+            return self._listings[key]
+
+        try:
+            _, files = storage.listdir(dirname)
+        except NotImplementedError:
+            files = None
+        except FileNotFoundError:
+            files = ()
+
+        listing = None if files is None else set(files)
+        self._listings[key] = listing
+        while len(self._listings) > self.maxsize:
+            self._listings.popitem(last=False)
+        return listing
+
+
+def resource_file_exists(instance: Resource, listing: StorageListing) -> bool:
+    """
+    Аналог `instance.file_exists()`, использующий кэш содержимого каталогов.
+    """
+    if not isinstance(instance, FileFieldResource):
+        return instance.file_exists()
+
+    file = instance.get_file()
+    if not file:
+        return False
+    return listing.exists(file.storage, file.name)
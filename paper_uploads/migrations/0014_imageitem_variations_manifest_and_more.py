@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper_uploads', '0013_configurableimageitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageitem',
+            name='variations_manifest',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variations manifest'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='variations_manifest',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variations manifest'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paper_uploads', '0014_imageitem_variations_manifest_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileNameReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=512, unique=True, verbose_name='name')),
+                ('root', models.CharField(db_index=True, max_length=512, verbose_name='root')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'file name reservation',
+                'verbose_name_plural': 'file name reservations',
+                'default_permissions': (),
+            },
+        ),
+    ]
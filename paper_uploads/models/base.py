@@ -1,38 +1,34 @@
 import datetime
-import decimal
-import io
 import os
 import pathlib
 import posixpath
 import warnings
+from concurrent.futures import Executor
 from decimal import Decimal
-from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional, Tuple, Union
-from xml.dom.minidom import parse
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
-import magic
-from django.core.exceptions import SuspiciousFileOperation
+from django.core.exceptions import ObjectDoesNotExist, SuspiciousFileOperation
 from django.core.files import File
 from django.core.files.storage import FileSystemStorage, Storage
-from django.db import models
+from django.db import models, router, transaction
 from django.db.models.base import ModelBase
 from django.db.models.fields.files import FieldFile
 from django.db.models.utils import make_model_tuple
-from django.utils.functional import SimpleLazyObject
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from PIL import Image
-from pyexpat import ExpatError
 from variations.typing import Size
 from variations.utils import prepare_image, replace_extension
 
-from .. import exceptions, helpers, signals
+from .. import exceptions, helpers, processing, signals, tasks
 from ..conf import settings
 from ..files import VariationFile
+from ..logging import logger
+from ..probe import probe_file
 from ..typing import FileLike
-from ..utils import cached_method, checksum
-from ..variations import PaperVariation
+from ..utils import InlineExecutor, SpooledTemporaryFile, cached_method, checksum
+from ..variations import PRIORITY_HIGH, PaperVariation
 from .mixins import FileFieldProxyMixin, FileProxyMixin
 from .query import ResourceQuerySet
 
@@ -329,9 +325,14 @@ class FileResource(FileProxyMixin, Resource):
             "uploaded": self.uploaded_at.isoformat() if self.uploaded_at else None
         }
 
-    def update_checksum(self, file: FileLike = None) -> bool:
+    def update_checksum(self, file: FileLike = None, value: str = None) -> bool:
+        """
+        Обновление контрольной суммы файла.
+        Если контрольная сумма уже известна, её можно передать
+        в параметре `value` - тогда файл не будет прочитан.
+        """
         old_checksum = self.checksum
-        new_checksum = checksum(file)
+        new_checksum = value or checksum(file)
         if new_checksum and new_checksum != old_checksum:
             signals.checksum_update.send(
                 sender=type(self),
@@ -341,7 +342,13 @@ class FileResource(FileProxyMixin, Resource):
             self.checksum = new_checksum
         return old_checksum != new_checksum
 
-    def attach(self, file: Union[str, Path, FileLike], name: str = None, **options):
+    def attach(
+        self,
+        file: Union[str, Path, FileLike],
+        name: str = None,
+        validators: Iterable[Any] = (),
+        **options
+    ):
         """
         Присоединение файла к экземпляру ресурса.
         Этот метод является обёрткой. Фактическое сохранение файла
@@ -350,6 +357,10 @@ class FileResource(FileProxyMixin, Resource):
         Если на данном этапе обнаруживается, что переданный файл не может
         быть представлен этой моделью, необходимо вызвать исключение
         UnsupportedResource.
+
+        Валидаторы `validators` вызываются для подготовленного файла
+        до того, как он будет передан в хранилище. Если файл не проходит
+        проверку, вызывается ValidationError, а хранилище не затрагивается.
         """
         if not name:
             if isinstance(file, str):
@@ -379,6 +390,9 @@ class FileResource(FileProxyMixin, Resource):
 
         prepared_file = self._prepare_file(file, **options)
 
+        # проверка файла до передачи в хранилище
+        helpers.run_validators(prepared_file, validators)
+
         signals.pre_attach_file.send(
             sender=type(self), instance=self, file=prepared_file, options=options
         )
@@ -393,17 +407,16 @@ class FileResource(FileProxyMixin, Resource):
         self.uploaded_at = now()
         self.modified_at = now()
 
-        # reset file position before MIME detection
+        # MIME detection
         if prepared_file.seekable() and prepared_file.readable():
-            prepared_file.seek(0)
-            self.mimetype = magic.from_buffer(prepared_file.read(2048), mime=True)
+            self.mimetype = probe_file(prepared_file).mimetype
 
         # Рассчет хэша от входного файла, а не от загруженного,
         # т.к. в случае Cloudinary, это приведет к избыточному
         # скачиванию файла из облачного хранилища.
         if prepared_file.seekable():
             prepared_file.seek(0)
-            self.update_checksum(prepared_file)
+            self.update_checksum(prepared_file, value=probe_file(prepared_file).checksum)
         else:
             self.update_checksum(self.get_file())
 
@@ -646,40 +659,13 @@ class SVGFileResourceMixin(models.Model):
         }
 
     def _prepare_file(self, file: File, **options) -> File:
-        try:
-            dom = parse(file)
-        except ExpatError:
+        svg_size = probe_file(file).svg_size
+        if svg_size is None:
             raise exceptions.UnsupportedResource(
                 _("File `%s` is not an svg image") % file.name
             )
 
-        root = dom.documentElement
-        if root.tagName.lower() != "svg":
-            raise exceptions.UnsupportedResource(
-                _("File `%s` is not an svg image") % file.name
-            )
-
-        width = root.getAttribute("width")
-        height = root.getAttribute("height")
-        view_box = root.getAttribute("viewBox")
-        view_box = view_box.split(" ") if view_box else []
-
-        if not width and len(view_box) == 4:
-            width = view_box[2]
-
-        if not height and len(view_box) == 4:
-            height = view_box[3]
-
-        try:
-            self.width = round(decimal.Decimal(width), 4)
-        except decimal.InvalidOperation:
-            self.width = 0
-
-        try:
-            self.height = round(decimal.Decimal(height), 4)
-        except decimal.InvalidOperation:
-            self.height = 0
-
+        self.width, self.height = svg_size
         return super()._prepare_file(file, **options)  # noqa: F821
 
 
@@ -756,16 +742,28 @@ class ImageFileResourceMixin(models.Model):
 
     def _prepare_file(self, file: File, **options) -> File:
         try:
-            image = Image.open(file)
+            image_format, image_size = probe_file(file).image_info
+        except Image.DecompressionBombError:
+            raise exceptions.UnsupportedResource(
+                _("Image `%s` is too large") % file.name
+            )
         except OSError:
             raise exceptions.UnsupportedResource(
                 _("File `%s` is not an image") % file.name
             )
         else:
-            self.width, self.height = image.size
+            # Размеры известны из заголовка файла, поэтому слишком большие
+            # изображения отклоняются до декодирования.
+            max_pixels = settings.MAX_IMAGE_PIXELS
+            if max_pixels and image_size[0] * image_size[1] > max_pixels:
+                raise exceptions.UnsupportedResource(
+                    _("Image `%s` is too large") % file.name
+                )
+
+            self.width, self.height = image_size
 
             # format extension
-            file.name = replace_extension(file.name, format=image.format)
+            file.name = replace_extension(file.name, format=image_format)
             root, ext = os.path.splitext(file.name)
             ext = ext.lstrip(".").lower()
             file.name = ".".join([root, ext])
@@ -784,15 +782,38 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
     # флаг, запускающий нарезку вариаций после сохранения экземпляра модели в БД
     need_recut = False
 
+    # Сведения о нарезанных файлах вариаций: имя файла, размер, габариты,
+    # отпечаток конфигурации и время создания. Позволяют получать информацию
+    # о вариациях без обращения к файловому хранилищу.
+    variations_manifest = models.JSONField(
+        _("variations manifest"),
+        default=dict,
+        blank=True,
+        editable=False
+    )
+
     class Meta(ImageFileResourceMixin.Meta):
         abstract = True
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._reset_variation_files()
-
     def __getattr__(self, item):
-        # реализация-заглушка, чтобы PyCharm не ругался на атрибуты-вариации
+        """
+        Доступ к файлам вариаций как к атрибутам экземпляра.
+
+        Файл вариации создаётся при первом обращении и сохраняется
+        в `__dict__`, поэтому последующие обращения к нему не доходят
+        до этого метода. Создание экземпляра модели не зависит
+        от количества вариаций.
+        """
+        if not item.startswith("_"):
+            try:
+                variations = self.get_variations()
+            except exceptions.CollectionModelNotFoundError:
+                variations = {}
+
+            if item in variations:
+                self.__dict__[item] = value = self.get_variation_file(item)
+                return value
+
         raise AttributeError(
             "{!r} object has no attribute {!r}".format(self.__class__.__name__, item)
         )
@@ -801,7 +822,7 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         super().save(*args, **kwargs)
         if self.need_recut:
             self.need_recut = False
-            if settings.RQ_ENABLED:
+            if tasks.get_task_backend().background:
                 self.recut_async()
             else:
                 self.recut()
@@ -812,14 +833,13 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         """
 
         # Очистка кэша метода variation_files()
-        if hasattr(self, self.variation_files.cache_key):
-            delattr(self, self.variation_files.cache_key)
+        self.__dict__.pop(self.variation_files.cache_key, None)
 
-        try:
-            for vname in self.get_variations():
-                self.__dict__[vname] = SimpleLazyObject(partial(self.get_variation_file, vname))
-        except exceptions.CollectionModelNotFoundError:
-            pass
+        # Удаление созданных ранее файлов вариаций.
+        # Они будут созданы заново при обращении (см. `__getattr__`).
+        for key, value in tuple(self.__dict__.items()):
+            if isinstance(value, VariationFile):
+                del self.__dict__[key]
 
     @cached_method("_variation_files_cache")
     def variation_files(self) -> Tuple[Tuple[str, VariationFile]]:
@@ -848,15 +868,110 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         self._reset_variation_files()
 
     def delete_file(self, **options):
+        name = self.get_file().name
+
+        # после удаления файла имена вариаций уже не определить
+        variation_files = self.variation_files()
         super().delete_file(**options)  # noqa: F821
-        self.delete_variations()
+        self.delete_variations(variation_files)
+
+        # снятие брони с имён файлов вариаций
+        file_field = self.get_file_field()
+        if name and hasattr(file_field, "release_name"):
+            file_field.release_name(name)
 
-    def delete_variations(self):
-        for vname, vfile in self.variation_files():
+    def delete_variations(self, variation_files: Iterable[Tuple[str, VariationFile]] = None):
+        if variation_files is None:
+            variation_files = self.variation_files()
+
+        for vname, vfile in variation_files:
             vfile.delete()
 
+        self.variations_manifest = {}
+        self.save_variations_manifest()
         self._reset_variation_files()
 
+    def get_variation_manifest(self, variation_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Получение записи манифеста для указанной вариации.
+        Запись, не соответствующая текущему имени файла, игнорируется.
+        """
+        entry = self.variations_manifest.get(variation_name)
+        if not entry:
+            return None
+
+        variation = self.get_variations().get(variation_name)
+        if variation is None or entry.get("name") != variation.get_output_filename(self.name):
+            return None
+
+        return entry
+
+    def get_stale_variations(self, names: Iterable[str] = ()) -> List[str]:
+        """
+        Получение имён вариаций, файлы которых отсутствуют в манифесте
+        или были созданы по конфигурации, отличающейся от текущей.
+        Можно ограничить проверку вариациями из параметра `names`.
+        """
+        stale = []
+        for vname, variation in self.get_variations().items():
+            if names and vname not in names:
+                continue
+
+            entry = self.get_variation_manifest(vname)
+            if entry is None or entry.get("fingerprint") != variation.fingerprint:
+                stale.append(vname)
+        return stale
+
+    def save_variations_manifest(self):
+        """
+        Запись манифеста вариаций в БД без сохранения остальных полей.
+        """
+        if self.pk is None:
+            return
+
+        type(self)._base_manager.using(self._state.db).filter(pk=self.pk).update(
+            variations_manifest=self.variations_manifest
+        )
+
+    def update_variations_manifest(
+        self,
+        entries: Dict[str, Dict[str, Any]] = None,
+        removed: Iterable[str] = ()
+    ):
+        """
+        Изменение отдельных записей манифеста вариаций в БД.
+
+        Манифест перечитывается из БД с блокировкой строки, после чего
+        в него вносятся только переданные изменения. Это позволяет
+        нескольким процессам одновременно нарезать разные вариации
+        одного изображения, не затирая записи друг друга.
+        """
+        removed = set(removed)
+
+        def merge(manifest: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+            manifest = {
+                vname: entry
+                for vname, entry in manifest.items()
+                if vname not in removed
+            }
+            manifest.update(entries or {})
+            return manifest
+
+        if self.pk is None:
+            self.variations_manifest = merge(self.variations_manifest)
+            return
+
+        using = self._state.db or router.db_for_write(type(self), instance=self)
+        queryset = type(self)._base_manager.using(using).filter(pk=self.pk)
+        with transaction.atomic(using=using):
+            stored = queryset.select_for_update().values_list(
+                "variations_manifest", flat=True
+            ).first()
+            manifest = merge(self.variations_manifest if stored is None else stored)
+            queryset.update(variations_manifest=manifest)
+
+        self.variations_manifest = manifest
+
     def recut(self, names: Iterable[str] = ()):
         """
         Нарезка вариаций.
@@ -865,25 +980,119 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         if not self.file_exists():
             raise FileNotFoundError(self.name)
 
+        variations = [
+            (vname, variation)
+            for vname, variation in self.get_variations().items()
+            if not names or vname in names
+        ]
+        if not variations:
+            return
+
         file = self.get_file()
         with file.open() as source:
             img = Image.open(source)
             draft_size = self.calculate_max_size(img.size)
             img = prepare_image(img, draft_size=draft_size)
 
-            for vname, variation in self.get_variations().items():
-                if names and vname not in names:
-                    continue
-
-                image = variation.process(img)
-                self._save_variation(vname, variation, image)
+            # Декодирование изображения до передачи в потоки, чтобы
+            # все вариации работали с уже загруженными пикселями.
+            img.load()
+
+        # Уменьшение слишком больших исходников до начала обработки,
+        # чтобы потоки не создавали копии изображения в полном размере.
+        max_pixels = settings.RECUT_MAX_PIXELS_IN_MEMORY
+        if max_pixels:
+            factor = processing.get_reduce_factor(variations, img.size, max_pixels)
+            if factor > 1:
+                # усреднение индексов палитры не имеет смысла
+                if img.palette is not None:
+                    img = img.convert(img.palette.mode)
+                img = img.reduce(factor)
+
+        # Промежуточные изображения для каскадного уменьшения строятся
+        # последовательно, т.к. зависят друг от друга.
+        bases = {}
+        if settings.RECUT_CASCADE:
+            steps, sizes = processing.plan_cascade(variations, img.size)
+            intermediates = processing.build_intermediates(img, steps)
+            bases = {
+                vname: intermediates[size]
+                for vname, size in sizes.items()
+                if size is not None
+            }
+
+        # Вариации, отличающиеся только форматом, обрабатываются один раз.
+        groups = processing.group_by_geometry(variations)
+
+        manifest = {}
+        with self.get_recut_executor(len(groups)) as executor:
+            futures = {}
+            for group in groups:
+                leader_name = group[0][0]
+                future = executor.submit(
+                    self._process_variations,
+                    group,
+                    bases.get(leader_name, img),
+                    img.size
+                )
+                futures.update((vname, future) for vname, _ in group)
 
+            # Сигналы отправляются в порядке объявления вариаций,
+            # независимо от порядка завершения задач.
+            for vname, variation in variations:
+                manifest[vname] = futures[vname].result()[vname]
                 signals.variation_created.send(
                     sender=type(self),
                     instance=self,
                     name=vname
                 )
 
+        # записи необъявленных вариаций удаляются
+        all_variations = self.get_variations()
+        self.update_variations_manifest(
+            manifest,
+            removed=[vname for vname in self.variations_manifest if vname not in all_variations]
+        )
+
+    def get_recut_executor(self, task_count: int) -> Executor:
+        """
+        Получение исполнителя, который нарежет вариации изображения.
+        Количество потоков задаётся настройкой `RECUT_WORKERS`.
+        """
+        max_workers = settings.RECUT_WORKERS
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        max_workers = min(max_workers, task_count)
+        if max_workers <= 1:
+            return InlineExecutor()
+
+        return settings.RECUT_EXECUTOR(max_workers=max_workers)
+
+    def _process_variations(
+        self,
+        group: Iterable[Tuple[str, PaperVariation]],
+        img: Image,
+        source_size: Size
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Обработка группы вариаций с одинаковой геометрией.
+        Изображение обрабатывается по первой вариации группы и сохраняется
+        в формате каждой из них.
+
+        Возвращает записи манифеста для сохранённых вариаций.
+        """
+        group = list(group)
+        _, leader = group[0]
+
+        # Размеры холста вычисляются по исходнику, даже если
+        # обрабатывается уменьшенное промежуточное изображение.
+        image = leader.get_processor(source_size).process(img)
+        return {
+            name: self._save_variation(name, variation, image)
+            for name, variation in group
+        }
+
     def calculate_max_size(self, source_size: Size) -> Optional[Tuple[int, int]]:
         """
         Вычисление максимально возможных значений ширины и высоты изображения
@@ -898,39 +1107,138 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         if max_width and max_height:
             return max_width, max_height
 
-    def _save_variation(self, name: str, variation: PaperVariation, image: Image):
+    def _save_variation(self, name: str, variation: PaperVariation, image: Image) -> Dict[str, Any]:
         """
-        Запись изображения в файловое хранилище
+        Запись изображения в файловое хранилище.
+        Возвращает запись манифеста для сохранённого файла.
         """
         variation_file = self.get_variation_file(name)
 
         if isinstance(variation_file.storage, FileSystemStorage):
             with variation_file.open("wb") as fp:
                 variation.save(image, fp)
+            size = variation_file.storage.size(variation_file.name)
         else:
             # Не все Storage-классы позволяют записывать контент с помощью вызовов
-            # `open()` и `write()`. Для них нужно использовать метод `_save()`.
-            with io.BytesIO() as buffer:
+            # `open()` и `write()`. Поэтому вариация кодируется во временный файл,
+            # который хранится в памяти, пока его размер не превысит
+            # `RECUT_SPOOL_MAX_SIZE`, после чего переносится на диск.
+            with SpooledTemporaryFile(max_size=settings.RECUT_SPOOL_MAX_SIZE) as buffer:
                 variation.save(image, buffer)
-                content = File(buffer, name=variation_file.name)
-                variation_file.storage._save(variation_file.name, content)
+                size = buffer.seek(0, os.SEEK_END)
+                buffer.seek(0)
+                self._upload_variation(variation_file, File(buffer, name=variation_file.name))
+
+        return {
+            "name": variation_file.name,
+            "size": size,
+            "width": image.width,
+            "height": image.height,
+            "fingerprint": variation.fingerprint,
+            "created_at": now().isoformat(),
+        }
+
+    def _upload_variation(self, variation_file: VariationFile, content: File):
+        """
+        Загрузка файла вариации в хранилище с перезаписью существующего файла.
+
+        Если хранилище сохранило файл под другим именем, значит, файл
+        с требуемым именем уже существует. В этом случае старый файл удаляется,
+        а загрузка повторяется. Копия, сохранённая под другим именем, удаляется.
+        """
+        storage = variation_file.storage
+        saved_name = storage.save(variation_file.name, content)
+        if saved_name == variation_file.name:
+            return
+
+        try:
+            storage.delete(variation_file.name)
+            content.seek(0)
+            retry_name = storage.save(variation_file.name, content)
+        finally:
+            storage.delete(saved_name)
+
+        if retry_name != variation_file.name:
+            # Файл с таким именем успел появиться повторно
+            storage.delete(retry_name)
+            raise SuspiciousFileOperation(
+                "Storage can not save the variation under the name '%s'." % variation_file.name
+            )
 
     def recut_async(self, names: Iterable[str] = ()):
         """
-        Добавление задачи нарезки вариаций в django-rq.
+        Постановка задачи нарезки вариаций в бэкенд фоновых задач
+        (см. настройку `TASK_BACKEND`).
+
+        Вариации с приоритетом `high` нарезаются сразу же. Остальные
+        ставятся в очередь отдельными задачами для каждого приоритета.
         """
-        from django_rq.queues import get_queue
+        lanes = {}  # type: Dict[str, List[str]]
+        for vname, variation in self.get_variations().items():
+            if names and vname not in names:
+                continue
+            lanes.setdefault(variation.priority, []).append(vname)
+
+        high_priority_names = lanes.pop(PRIORITY_HIGH, None)
+        if high_priority_names:
+            self.recut(names=high_priority_names)
+
+        for priority, lane_names in lanes.items():
+            self._enqueue_recut_task(lane_names, priority)
+
+    def _enqueue_recut_task(self, names: Iterable[str], priority: str):
+        names = tuple(names)
+        variations = self.get_variations()
+        kwargs = {
+            "app_label": self._meta.app_label,
+            "model_name": self._meta.model_name,
+            "object_id": self.pk,
+            "using": self._state.db,
+            "names": names,
+            "file_name": self.name,
+            "fingerprints": {
+                vname: variations[vname].fingerprint
+                for vname in names
+            },
+        }
+
+        # Пока задача для экземпляра ожидает выполнения,
+        # новые запросы того же приоритета объединяются с ней.
+        key = "paper_uploads-recut-{}-{}-{}-{}".format(
+            self._meta.app_label,
+            self._meta.model_name,
+            self.pk,
+            priority
+        )
 
-        queue = get_queue(settings.RQ_QUEUE_NAME)
-        queue.enqueue_call(
+        backend = tasks.get_task_backend()
+        backend.enqueue(
             self._recut_task,
-            kwargs={
-                "app_label": self._meta.app_label,
-                "model_name": self._meta.model_name,
-                "object_id": self.pk,
-                "using": self._state.db,
-                "names": names,
-            },
+            kwargs=kwargs,
+            using=self._state.db,
+            key=key,
+            merge=self._merge_recut_tasks,
+            priority=priority
+        )
+
+    @staticmethod
+    def _merge_recut_tasks(pending: Dict[str, Any], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Объединение аргументов ожидающей задачи нарезки с аргументами новой.
+        """
+        if pending.get("file_name") != kwargs["file_name"]:
+            # файл был заменён - ожидающая задача устарела
+            return kwargs
+
+        if not pending["names"] or not kwargs["names"]:
+            names = ()
+        else:
+            names = tuple(dict.fromkeys(tuple(pending["names"]) + kwargs["names"]))
+
+        return dict(
+            kwargs,
+            names=names,
+            fingerprints=dict(pending.get("fingerprints") or {}, **kwargs["fingerprints"])
         )
 
     @classmethod
@@ -941,10 +1249,45 @@ class VersatileImageResourceMixin(ImageFileResourceMixin):
         object_id: int,
         using: str,
         names: Iterable[str],
+        file_name: Optional[str] = None,
+        fingerprints: Optional[Dict[str, str]] = None,
     ):
         """
-        Задача для django-rq.
-        Вызывает `recut()` экземпляра в отдельном процессе.
+        Фоновая задача, вызывающая `recut()` экземпляра.
+
+        Задача считается устаревшей и пропускается, если экземпляр был удалён
+        или к нему был прикреплён другой файл. Вариации, конфигурация которых
+        изменилась с момента постановки задачи, пропускаются, если они уже
+        нарезаны по текущей конфигурации.
         """
-        instance = helpers.get_instance(app_label, model_name, object_id, using=using)
+        try:
+            instance = helpers.get_instance(app_label, model_name, object_id, using=using)
+        except ObjectDoesNotExist:
+            logger.warning(
+                "Skipping stale recut job: %s.%s #%s no longer exists",
+                app_label, model_name, object_id
+            )
+            return
+
+        if file_name is not None and instance.name != file_name:
+            logger.info(
+                "Skipping stale recut job: file of %s.%s #%s has been replaced",
+                app_label, model_name, object_id
+            )
+            return
+
+        if fingerprints:
+            variations = instance.get_variations()
+            stale_names = set(instance.get_stale_variations(fingerprints.keys()))
+            names = [
+                vname
+                for vname, fingerprint in fingerprints.items()
+                if vname in variations and (
+                    fingerprint == variations[vname].fingerprint
+                    or vname in stale_names
+                )
+            ]
+            if not names:
+                return
+
         instance.recut(names)
@@ -1,9 +1,8 @@
 import datetime
 import posixpath
 from collections import OrderedDict
-from typing import Any, ClassVar, Dict, Iterable, Optional, Type
+from typing import Any, ClassVar, Dict, Optional, Type
 
-import magic
 from django.apps import apps
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -24,15 +23,11 @@ from polymorphic.models import PolymorphicModel
 
 from .. import exceptions
 from ..conf import FILE_ICON_DEFAULT, FILE_ICON_OVERRIDES, IMAGE_ITEM_VARIATIONS, settings
-from ..helpers import (
-    _get_item_types,
-    _set_item_types,
-    build_variations,
-    iterate_variation_names,
-)
+from ..helpers import _get_item_types, _set_item_types, build_variations
+from ..probe import probe_file
 from ..storage import default_storage
 from ..utils import cached_method
-from ..variations import PaperVariation
+from ..variations import PRIORITY_HIGH, PaperVariation
 from .base import (
     FileFieldResource,
     NoPermissionsMetaBase,
@@ -664,19 +659,6 @@ class ImageItemBase(VersatileImageResourceMixin, CollectionFileItemBase):
     def get_file_field(cls) -> VariationalFileField:
         return cls._meta.get_field("file")
 
-    def recut_async(self, names: Iterable[str] = ()):
-        """
-        Превью для админки режутся сразу, а остальное — потом.
-        """
-        preview_variations = tuple(iterate_variation_names(self.PREVIEW_VARIATIONS))
-        self.recut(names=preview_variations)
-
-        if not names:
-            names = self.get_variations().keys()
-
-        rest_variations = tuple(set(names).difference(preview_variations))
-        super().recut_async(rest_variations)
-
     @cached_method("_variations_cache")
     def get_variations(self) -> Dict[str, PaperVariation]:
         """
@@ -696,8 +678,7 @@ class ImageItemBase(VersatileImageResourceMixin, CollectionFileItemBase):
 
     @classmethod
     def accept(cls, file: File) -> bool:
-        mimetype = magic.from_buffer(file.read(1024), mime=True)
-        file.seek(0)  # reset file position after mimetype detection
+        mimetype = probe_file(file).mimetype
         basetype, subtype = mimetype.split("/", 1)
         return basetype == "image"
 
@@ -710,8 +691,16 @@ class ImageItemBase(VersatileImageResourceMixin, CollectionFileItemBase):
         else:
             variations = getattr(collection_cls, "VARIATIONS", None)
 
+        # Превью для админки нарезаются сразу же, если для них
+        # явно не задан другой приоритет.
+        preview_variations = {}
+        for name, config in cls.PREVIEW_VARIATIONS.items():
+            if isinstance(config, dict):
+                config = dict({"priority": PRIORITY_HIGH}, **config)
+            preview_variations[name] = config
+
         variations = variations or {}
-        variations = dict(cls.PREVIEW_VARIATIONS, **variations)
+        variations = dict(preview_variations, **variations)
         return variations
 
 
@@ -1,16 +1,48 @@
-import io
 import os
-import tempfile
+import posixpath
+import time
+from typing import List
 
 from django.core import checks
 from django.core.exceptions import SuspiciousFileOperation
-from django.core.files import File
 from django.utils.crypto import get_random_string
-from filelock import FileLock, Timeout
 
 from ... import forms
+from ...conf import settings
+from ...logging import logger
 from ...typing import VariationConfig
-from .base import DynamicStorageFileField, FileResourceFieldBase
+from ..reservation import FileNameReservation
+from .base import DynamicStorageFieldFile, DynamicStorageFileField, FileResourceFieldBase
+
+
+class VariationalFieldFile(DynamicStorageFieldFile):
+    def save(self, name, content, save=True):
+        name = self.field.generate_filename(self.instance, name)
+        try:
+            stored_name = self.storage.save(name, content, max_length=self.field.max_length)
+        except Exception:
+            self.field.release_name(name)
+            raise
+
+        # Хранилище может сохранить файл под другим именем.
+        # В этом случае бронь переносится на фактическое имя файла.
+        if stored_name != name:
+            self.field.release_name(name)
+            if not self.field.reserve_name(self.instance, stored_name):
+                self.storage.delete(stored_name)
+                raise SuspiciousFileOperation(
+                    "Storage saved the file as '%s', but its variation names "
+                    "are already reserved." % stored_name
+                )
+
+        self.name = stored_name
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
 
 
 class VariationalFileField(DynamicStorageFileField):
@@ -18,12 +50,46 @@ class VariationalFileField(DynamicStorageFileField):
     Из-за того, что вариация может самостоятельно установить свой формат,
     возможна ситуация, когда вариации одного изображения перезапишут вариации
     другого. Например, когда загружаются файлы, отличающиеся только расширением.
-    Поэтому мы проверяем все имена будущих вариаций на существование, чтобы
-    не допустить перезапись.
+
+    Поэтому имена изображения и всех его будущих вариаций (без расширений)
+    бронируются в таблице `FileNameReservation`. Бронирование выполняется
+    одним запросом, а уникальный индекс разрешает ситуацию, когда файлы
+    с одинаковыми именами загружаются одновременно в разных процессах.
+
+    Файлы, загруженные до появления таблицы, брони не имеют. Их имена
+    бронируются командой `reserve_file_names`. Если это невозможно,
+    можно включить настройку `RESERVATION_STORAGE_CHECK` - тогда перед
+    бронированием имена проверяются на существование в хранилище.
     """
+    attr_class = VariationalFieldFile
 
     @staticmethod
-    def _variations_collapsed(instance, name, storage):
+    def get_reservation_root(name: str) -> str:
+        return posixpath.splitext(name)[0]
+
+    def get_reserved_names(self, instance, name: str) -> List[str]:
+        """
+        Имена (без расширений), которые необходимо забронировать
+        для файла с именем `name`.
+        """
+        names = [self.get_reservation_root(name)]
+        for variation in instance.get_variations().values():
+            variation_filename = variation.get_output_filename(name)
+            names.append(self.get_reservation_root(variation_filename))
+        return list(dict.fromkeys(names))
+
+    def reserve_name(self, instance, name: str) -> bool:
+        return FileNameReservation.reserve(
+            self.get_reservation_root(name),
+            self.get_reserved_names(instance, name)
+        )
+
+    def release_name(self, name: str):
+        FileNameReservation.release(self.get_reservation_root(name))
+
+    @staticmethod
+    def _variations_collapsed(instance, name: str) -> bool:
+        storage = instance.get_file_storage()
         if storage.exists(name):
             return True
 
@@ -33,13 +99,21 @@ class VariationalFileField(DynamicStorageFileField):
                 return True
         return False
 
-    def _find_available_name(self, instance, name, storage):
+    def _is_available_name(self, instance, name: str) -> bool:
+        if self.max_length and len(name) > self.max_length:
+            return False
+        if settings.RESERVATION_STORAGE_CHECK and self._variations_collapsed(instance, name):
+            return False
+        return self.reserve_name(instance, name)
+
+    def _find_available_name(self, instance, name):
         max_length = self.max_length
         dir_name, file_name = os.path.split(name)
         file_root, file_ext = os.path.splitext(file_name)
-        while self._variations_collapsed(instance, name, storage) or (
-            max_length and len(name) > max_length
-        ):
+        started = time.perf_counter()
+        retries = 0
+        while not self._is_available_name(instance, name):
+            retries += 1
             name = os.path.join(
                 dir_name, "%s_%s%s" % (file_root, get_random_string(7), file_ext)
             )
@@ -58,32 +132,17 @@ class VariationalFileField(DynamicStorageFileField):
                 name = os.path.join(
                     dir_name, "%s_%s%s" % (file_root, get_random_string(7), file_ext)
                 )
-        return name
-
-    def _create_placeholder_files(self, instance, name, storage):
-        """
-        Создаем файлы-заглушки, которые "забронируют" имена
-        итоговых файлов вариаций.
 
-        Разрешает ситуацию, когда два или более файлов с одинаковым
-        именем, но разными расширением загружаются одновременно
-        в разных процессах / потоках.
-        """
-        for variation in instance.get_variations().values():
-            variation_filename = variation.get_output_filename(name)
-            storage.save(variation_filename, File(io.BytesIO(b"dummy")))
+        elapsed = time.perf_counter() - started
+        logger.debug(
+            "Reserved name '%s' after %d retries in %.3f s", name, retries, elapsed,
+            extra={"reservation_retries": retries, "reservation_time": elapsed}
+        )
+        return name
 
     def generate_filename(self, instance, filename):
         name = super().generate_filename(instance, filename)
-        storage = instance.get_file_storage()
-        lock = FileLock(os.path.join(tempfile.gettempdir(), "paper_uploads.lock"))
-        try:
-            with lock.acquire(timeout=5):
-                available_name = self._find_available_name(instance, name, storage)
-                self._create_placeholder_files(instance, available_name, storage)
-        except Timeout:
-            available_name = self._find_available_name(instance, name, storage)
-        return available_name
+        return self._find_available_name(instance, name)
 
 
 class ImageField(FileResourceFieldBase):
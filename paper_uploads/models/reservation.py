@@ -0,0 +1,69 @@
+from typing import Iterable, List
+
+from django.db import IntegrityError, models, router, transaction
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
+
+
+class FileNameReservation(models.Model):
+    """
+    Бронь имени файла изображения и имён файлов его вариаций.
+
+    Имена хранятся без расширений, т.к. вариации могут менять формат
+    файла. Уникальный индекс по полю `name` гарантирует, что два процесса
+    не смогут одновременно забронировать одно и то же имя.
+    """
+    name = models.CharField(_("name"), max_length=512, unique=True)
+    root = models.CharField(_("root"), max_length=512, db_index=True)
+    created_at = models.DateTimeField(_("created at"), default=now, editable=False)
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = _("file name reservation")
+        verbose_name_plural = _("file name reservations")
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def reserve(cls, root: str, names: Iterable[str]) -> bool:
+        """
+        Бронирование всех имён одним запросом.
+        Возвращает False, если хотя бы одно из имён уже занято.
+        """
+        using = router.db_for_write(cls)
+        try:
+            with transaction.atomic(using=using):
+                cls._default_manager.using(using).bulk_create([
+                    cls(name=name, root=root)
+                    for name in names
+                ])
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def release(cls, root: str):
+        """
+        Снятие брони с имени файла и имён его вариаций.
+        """
+        using = router.db_for_write(cls)
+        cls._default_manager.using(using).filter(root=root).delete()
+
+    @classmethod
+    def reserve_existing(cls, root: str, names: Iterable[str]) -> List[str]:
+        """
+        Бронирование имён уже сохранённого файла. В отличие от `reserve()`,
+        уже занятые имена пропускаются, а остальные бронируются.
+        Возвращает имена, забронированные для других файлов.
+        """
+        names = list(names)
+        using = router.db_for_write(cls)
+        manager = cls._default_manager.using(using)
+        manager.bulk_create([
+            cls(name=name, root=root)
+            for name in names
+        ], ignore_conflicts=True)
+        return list(
+            manager.filter(name__in=names).exclude(root=root).values_list("name", flat=True)
+        )
@@ -0,0 +1,150 @@
+"""
+Однократный анализ загружаемого файла.
+
+При загрузке файл проверяется в нескольких местах: при выборе модели элемента
+коллекции (`accept()`), при подготовке файла (`_prepare_file()`), при определении
+MIME-типа в `attach()` и в валидаторах. Чтобы файл не читался и не разбирался
+каждый раз заново, результаты анализа хранятся в объекте `FileProbe`,
+который прикрепляется к самому файлу.
+
+Каждое свойство вычисляется при первом обращении, после чего запоминается.
+Позиция в файле при этом не меняется.
+"""
+
+import decimal
+from typing import Optional, Tuple
+from xml.dom.minidom import parse
+
+import magic
+from django.utils.functional import cached_property
+from PIL import Image
+from pyexpat import ExpatError
+from variations.typing import Size
+
+from .typing import FileLike
+
+__all__ = ["FileProbe", "probe_file"]
+
+PROBE_ATTRIBUTE = "_paper_uploads_probe"
+
+
+class FileProbe:
+    # количество байт из начала файла, по которым определяется MIME-тип
+    header_size = 2048
+
+    def __init__(self, file: FileLike):
+        self.file = file
+
+        # Контрольная сумма, рассчитанная заранее - например,
+        # при сборке файла из частей. Если задана, `attach()`
+        # не перечитывает файл для её расчёта.
+        self.checksum = None  # type: Optional[str]
+
+    def _read(self, func):
+        """
+        Вызов функции `func(file)` с начала файла
+        с последующим восстановлением позиции.
+        """
+        position = self.file.tell()
+        self.file.seek(0)
+        try:
+            return func(self.file)
+        finally:
+            self.file.seek(position)
+
+    @cached_property
+    def header(self) -> bytes:
+        return self._read(lambda fp: fp.read(self.header_size))
+
+    @cached_property
+    def mimetype(self) -> str:
+        return magic.from_buffer(self.header, mime=True)
+
+    @cached_property
+    def size(self) -> int:
+        return self.file.size
+
+    @cached_property
+    def _image_info(self):
+        def inspect(fp):
+            try:
+                image = Image.open(fp)
+            except Exception as exc:
+                return exc
+            return image.format, image.size
+
+        return self._read(inspect)
+
+    @property
+    def image_info(self) -> Tuple[str, Size]:
+        """
+        Формат и размеры изображения, прочитанные из заголовка файла.
+        Если файл не является изображением, вызывается то же исключение,
+        что и при вызове `Image.open()`.
+        """
+        info = self._image_info
+        if isinstance(info, Exception):
+            raise info
+        return info
+
+    @property
+    def image_format(self) -> str:
+        return self.image_info[0]
+
+    @property
+    def image_size(self) -> Size:
+        return self.image_info[1]
+
+    @cached_property
+    def svg_size(self) -> Optional[Tuple[decimal.Decimal, decimal.Decimal]]:
+        """
+        Размеры SVG-изображения. Если размер не указан, соответствующее
+        значение равно 0. Если файл не является SVG-изображением,
+        возвращается None.
+        """
+        try:
+            dom = self._read(parse)
+        except ExpatError:
+            return None
+
+        root = dom.documentElement
+        if root.tagName.lower() != "svg":
+            return None
+
+        width = root.getAttribute("width")
+        height = root.getAttribute("height")
+        view_box = root.getAttribute("viewBox")
+        view_box = view_box.split(" ") if view_box else []
+
+        if not width and len(view_box) == 4:
+            width = view_box[2]
+
+        if not height and len(view_box) == 4:
+            height = view_box[3]
+
+        try:
+            width = round(decimal.Decimal(width), 4)
+        except decimal.InvalidOperation:
+            width = 0
+
+        try:
+            height = round(decimal.Decimal(height), 4)
+        except decimal.InvalidOperation:
+            height = 0
+
+        return width, height
+
+
+def probe_file(file: FileLike) -> FileProbe:
+    """
+    Получение результатов анализа файла.
+    Объект `FileProbe` создаётся один раз и сохраняется в атрибуте файла.
+    """
+    probe = getattr(file, PROBE_ATTRIBUTE, None)
+    if probe is None:
+        probe = FileProbe(file)
+        try:
+            setattr(file, PROBE_ATTRIBUTE, probe)
+        except AttributeError:
+            pass
+    return probe
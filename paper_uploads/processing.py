@@ -0,0 +1,160 @@
+"""
+Планирование обработки изображений при нарезке вариаций.
+
+Вариации, отличающиеся только форматом сохранения (например, WebP-версии),
+группируются, чтобы изменение размера выполнялось один раз на группу.
+
+Кроме того, вместо уменьшения исходника для каждой вариации отдельно
+используется каскадное уменьшение: вариации сортируются по убыванию
+размера, а каждая следующая строится из наименьшего уже готового
+промежуточного изображения, которое не меньше требуемого.
+Промежуточное изображение никогда не увеличивается — если подходящего
+нет, используется исходник.
+"""
+
+import math
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+from variations import processors
+from variations.typing import Size
+
+from .variations import PaperVariation
+
+
+def get_geometry_key(variation: PaperVariation) -> Tuple:
+    """
+    Ключ, совпадающий у вариаций, которые дают одинаковые пиксели
+    и отличаются лишь форматом и параметрами сохранения.
+    """
+    return (
+        variation.size,
+        variation.clip,
+        variation.upscale,
+        variation.anchor,
+        variation.max_width,
+        variation.max_height,
+        variation.face_detection,
+        tuple(map(id, variation.preprocessors)),
+        tuple(map(id, variation.postprocessors)),
+    )
+
+
+def group_by_geometry(
+    variations: Iterable[Tuple[str, PaperVariation]]
+) -> List[List[Tuple[str, PaperVariation]]]:
+    """
+    Группировка вариаций с одинаковой геометрией.
+    Порядок групп и вариаций внутри групп соответствует порядку объявления.
+    """
+    groups = {}  # type: Dict[Tuple, List[Tuple[str, PaperVariation]]]
+    for name, variation in variations:
+        key = get_geometry_key(variation)
+        groups.setdefault(key, []).append((name, variation))
+    return list(groups.values())
+
+
+class CascadeStep(NamedTuple):
+    size: Size                # размер промежуточного изображения
+    parent: Optional[Size]    # из чего оно строится (None - из исходника)
+
+
+def get_resize_size(variation: PaperVariation, source_size: Size) -> Optional[Size]:
+    """
+    Размер, до которого основной процессор вариации уменьшит исходник
+    перед обрезкой или дополнением холста.
+
+    Возвращает None, если вариацию нельзя строить из промежуточного
+    изображения: исходник не уменьшается, либо у вариации есть
+    препроцессоры, результат которых зависит от исходных пикселей.
+    """
+    if variation.preprocessors:
+        return None
+
+    source_width, source_height = source_size
+    canvas_width, canvas_height = variation.get_output_size(source_size)
+    if not canvas_width or not canvas_height:
+        return None
+
+    # та же арифметика, что и в ResizeToCover / ResizeToFit
+    aggregate = max if variation.clip else min
+    ratio = aggregate(canvas_width / source_width, canvas_height / source_height)
+    width = int(round(source_width * ratio))
+    height = int(round(source_height * ratio))
+
+    # Resize уменьшает изображение, только если уменьшаются обе стороны
+    if width >= source_width or height >= source_height:
+        return None
+
+    return width, height
+
+
+def plan_cascade(
+    variations: Iterable[Tuple[str, PaperVariation]],
+    source_size: Size
+) -> Tuple[List[CascadeStep], Dict[str, Optional[Size]]]:
+    """
+    Построение плана каскадного уменьшения.
+
+    Возвращает список шагов построения промежуточных изображений
+    (в порядке выполнения) и словарь, сопоставляющий имени вариации
+    размер промежуточного изображения, из которого она строится.
+    """
+    sizes = {
+        name: get_resize_size(variation, source_size)
+        for name, variation in variations
+    }
+
+    steps = []  # type: List[CascadeStep]
+    unique_sizes = {size for size in sizes.values() if size is not None}
+    for size in sorted(unique_sizes, key=lambda s: s[0] * s[1], reverse=True):
+        # Уменьшение допускается только из изображения, которое не меньше
+        # требуемого по обеим сторонам. Иначе — строим из исходника.
+        candidates = [
+            step.size
+            for step in steps
+            if step.size[0] >= size[0] and step.size[1] >= size[1]
+        ]
+        parent = min(candidates, key=lambda s: s[0] * s[1], default=None)
+        steps.append(CascadeStep(size, parent))
+
+    return steps, sizes
+
+
+def build_intermediates(img: Image.Image, steps: Iterable[CascadeStep]) -> Dict[Size, Image.Image]:
+    """
+    Построение промежуточных изображений по плану.
+    """
+    images = {}  # type: Dict[Size, Image.Image]
+    for step in steps:
+        base = img if step.parent is None else images[step.parent]
+        images[step.size] = processors.Resize(*step.size, upscale=False).process(base)
+    return images
+
+
+def get_reduce_factor(
+    variations: Iterable[Tuple[str, PaperVariation]],
+    source_size: Size,
+    max_pixels: int
+) -> int:
+    """
+    Целочисленный коэффициент для `Image.reduce()`, при котором исходник
+    укладывается в `max_pixels` пикселей.
+
+    Коэффициент ограничивается так, чтобы уменьшенное изображение оставалось
+    не меньше размеров, необходимых каждой из вариаций. Если хотя бы одной
+    вариации нужен исходник в полном размере, уменьшение не производится.
+    """
+    width, height = source_size
+    if width * height <= max_pixels:
+        return 1
+
+    factor = math.ceil(math.sqrt(width * height / max_pixels))
+    for name, variation in variations:
+        size = get_resize_size(variation, source_size)
+        if size is None:
+            return 1
+
+        factor = min(factor, width // size[0], height // size[1])
+
+    return max(factor, 1)
@@ -1,11 +1,12 @@
 from django.apps import apps as global_apps
+from django.core.signals import setting_changed
 from django.db import DEFAULT_DB_ALIAS, migrations, transaction
 from django.db.migrations.operations.base import Operation
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils.timezone import now
 
-from .. import exceptions
+from .. import exceptions, helpers
 from ..models import CollectionItemBase
 from ..models.fields.base import ResourceFieldBase
 from .classes import ExtendableMigration
@@ -30,6 +31,15 @@ def on_delete_collection_item(sender, instance, **kwargs):
         )
 
 
+@receiver(setting_changed)
+def on_setting_changed(setting, **kwargs):
+    """
+    Сброс кэша вариаций при изменении настроек в тестах.
+    """
+    if setting == "PAPER_UPLOADS":
+        helpers.clear_variations_cache()
+
+
 def inject_operations(
     plan=None, apps=global_apps, using=DEFAULT_DB_ALIAS, **kwargs
 ):
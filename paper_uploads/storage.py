@@ -1,8 +1,174 @@
+import errno
+import os
+
+from django.core.files import storage
+from django.core.files.move import file_move_safe
 from django.utils.functional import LazyObject
 
 from .conf import settings
 from .utils import lowercased_dict_keys
 
+__all__ = ["FileSystemStorage", "UploadStorage", "default_storage", "move_file"]
+
+
+def _copy_file_range(src: int, dst: int, offset: int, size: int) -> int:
+    while offset < size:
+        copied = os.copy_file_range(src, dst, size - offset, offset, offset)
+        if not copied:
+            break
+        offset += copied
+    return offset
+
+
+def _sendfile(src: int, dst: int, offset: int, size: int) -> int:
+    os.lseek(dst, offset, os.SEEK_SET)
+    while offset < size:
+        copied = os.sendfile(dst, src, offset, size - offset)
+        if not copied:
+            break
+        offset += copied
+    return offset
+
+
+def _stream_copy(src: int, dst: int, offset: int, size: int, chunk_size: int = 1024 * 1024) -> int:
+    os.lseek(src, offset, os.SEEK_SET)
+    os.lseek(dst, offset, os.SEEK_SET)
+    while True:
+        data = os.read(src, chunk_size)
+        if not data:
+            break
+        os.write(dst, data)
+        offset += len(data)
+    return offset
+
+
+def copy_file(old_file_name: str, new_file_name: str):
+    """
+    Копирование файла средствами ядра ОС: `copy_file_range()`,
+    а если он недоступен - `sendfile()`. Если не работает ни один
+    из этих способов, файл копируется обычным чтением и записью.
+
+    Если файл `new_file_name` уже существует, вызывается FileExistsError.
+    """
+    with open(old_file_name, "rb") as old_file:
+        src = old_file.fileno()
+        size = os.fstat(src).st_size
+        dst = os.open(
+            new_file_name,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0),
+            0o666
+        )
+        try:
+            copiers = []
+            if hasattr(os, "copy_file_range"):
+                copiers.append(_copy_file_range)
+            if hasattr(os, "sendfile"):
+                copiers.append(_sendfile)
+
+            offset = 0
+            for func in copiers:
+                # Данные пишутся по явно заданным смещениям, поэтому
+                # при ошибке копирование можно начать заново другим способом.
+                try:
+                    offset = func(src, dst, 0, size)
+                except OSError:
+                    continue
+
+                if offset >= size:
+                    break
+
+            _stream_copy(src, dst, offset, size)
+        except Exception:
+            os.close(dst)
+            os.unlink(new_file_name)
+            raise
+        else:
+            os.close(dst)
+
+
+def move_file(old_file_name: str, new_file_name: str):
+    """
+    Перемещение файла без копирования данных, если это возможно.
+
+    В пределах одной файловой системы на файл создаётся жёсткая ссылка,
+    после чего исходное имя удаляется. В отличие от `os.rename()`,
+    создание ссылки не перезаписывает существующий файл. Если жёсткие
+    ссылки не поддерживаются, используется `file_move_safe()` из Django.
+
+    Между файловыми системами данные копируются функцией `copy_file()`.
+
+    Если файл `new_file_name` уже существует, вызывается FileExistsError.
+    """
+    try:
+        os.link(old_file_name, new_file_name)
+    except FileExistsError:
+        raise
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            file_move_safe(old_file_name, new_file_name)
+            return
+        copy_file(old_file_name, new_file_name)
+
+    try:
+        os.unlink(old_file_name)
+    except PermissionError:
+        # Некоторые ОС не позволяют удалить открытый файл.
+        # Временный файл будет удалён при его закрытии.
+        pass
+
+
+class FileSystemStorage(storage.FileSystemStorage):
+    """
+    Файловое хранилище, которое перемещает загруженные файлы, расположенные
+    во временном каталоге, вместо копирования их содержимого.
+
+    Стандартный FileSystemStorage тоже перемещает такие файлы, но между
+    файловыми системами копирует данные через Python. Здесь в этом случае
+    используются `copy_file_range()` и `sendfile()`.
+
+    URL файла зависит только от его имени, поэтому файлы вариаций
+    запоминают полученный URL (см. `VariationFile.url`).
+    """
+
+    cache_urls = True
+
+    def _save(self, name, content):
+        if not hasattr(content, "temporary_file_path"):
+            return super()._save(name, content)
+
+        full_path = self.path(name)
+
+        directory = os.path.dirname(full_path)
+        try:
+            if self.directory_permissions_mode is not None:
+                # os.makedirs() не применяет `mode` к промежуточным каталогам
+                old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory, exist_ok=True)
+        except FileExistsError:
+            raise FileExistsError("%s exists and is not a directory." % directory)
+
+        while True:
+            try:
+                move_file(content.temporary_file_path(), full_path)
+            except FileExistsError:
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+            else:
+                break
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+        name = os.path.relpath(full_path, self.location)
+        if hasattr(self, "_ensure_location_group_id"):
+            self._ensure_location_group_id(full_path)
+        return str(name).replace("\\", "/")
+
 
 class UploadStorage(LazyObject):
     def _setup(self):
@@ -0,0 +1,226 @@
+"""
+Бэкенды фоновых задач для нарезки вариаций.
+
+Бэкенд задаётся настройкой `TASK_BACKEND`, а его параметры — настройкой
+`TASK_BACKEND_OPTIONS`. Задача описывается функцией и словарём именованных
+аргументов, которые должны быть сериализуемыми, т.к. бэкенд может передавать
+их в другой процесс.
+
+Задаче можно назначить ключ. Пока задача с таким ключом ожидает выполнения,
+новая задача не создаётся — вместо этого аргументы новой задачи объединяются
+с аргументами ожидающей.
+
+Задачи с приоритетом `low` выполняются отдельно от остальных
+(в отдельной очереди или пуле потоков), поэтому не задерживают их.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .conf import settings
+from .logging import logger
+from .variations import PRIORITY_LOW, PRIORITY_NORMAL
+
+# Функция объединения аргументов ожидающей и новой задачи
+MergeFunc = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+class BaseTaskBackend:
+    # Выполняются ли задачи в фоне. Если нет, то вариации
+    # после сохранения изображения нарезаются без постановки задачи.
+    background = True
+
+    # Откладывать ли постановку задачи до фиксации транзакции.
+    # Нужно для бэкендов, исполнители которых читают экземпляр
+    # из БД через отдельное соединение.
+    defer_until_commit = True
+
+    def __init__(self, **options):
+        self.options = options
+
+    def enqueue(
+        self,
+        func: Callable,
+        kwargs: Dict[str, Any],
+        using: str = DEFAULT_DB_ALIAS,
+        key: Optional[str] = None,
+        merge: Optional[MergeFunc] = None,
+        priority: str = PRIORITY_NORMAL,
+    ):
+        """
+        Постановка задачи в очередь.
+
+        Если задан ключ `key` и задача с этим ключом ещё ожидает выполнения,
+        её аргументы заменяются результатом `merge(pending_kwargs, kwargs)`,
+        либо, если функция `merge` не задана, — аргументами новой задачи.
+        Ключ может содержать только латинские буквы, цифры, "_" и "-".
+        """
+        enqueue = partial(self._enqueue, func, kwargs, key=key, merge=merge, priority=priority)
+        if self.defer_until_commit:
+            transaction.on_commit(enqueue, using=using)
+        else:
+            enqueue()
+
+    def _enqueue(
+        self,
+        func: Callable,
+        kwargs: Dict[str, Any],
+        key: Optional[str] = None,
+        merge: Optional[MergeFunc] = None,
+        priority: str = PRIORITY_NORMAL,
+    ):
+        raise NotImplementedError
+
+
+class SyncBackend(BaseTaskBackend):
+    """
+    Выполнение задач сразу же, в текущем потоке.
+    Используется по умолчанию, а также удобен в тестах.
+    """
+    background = False
+    defer_until_commit = False
+
+    def _enqueue(self, func, kwargs, key=None, merge=None, priority=PRIORITY_NORMAL):
+        func(**kwargs)
+
+
+class RQBackend(BaseTaskBackend):
+    """
+    Выполнение задач через django-rq.
+
+    Параметры:
+        queue_name - имя очереди. По умолчанию - значение настройки `RQ_QUEUE_NAME`.
+        low_priority_queue_name - имя очереди для задач с приоритетом `low`.
+                                  По умолчанию - та же очередь, что и для остальных.
+
+    Каждая задача получает собственный ID. ID ожидающей задачи с ключом
+    хранится в Redis. Новая задача с тем же ключом извлекает ожидающую
+    из очереди (LREM), объединяет её аргументы со своими и встаёт в очередь
+    вместо неё. Извлечение атомарно по отношению к воркерам: если воркер уже
+    забрал задачу, она не будет найдена в очереди и её аргументы не изменятся.
+    Одновременные постановки задач с одним ключом выполняются под блокировкой.
+    """
+
+    # время хранения ID ожидающей задачи
+    pending_key_ttl = 24 * 3600
+
+    # время, на которое захватывается блокировка ключа
+    lock_timeout = 10
+
+    def _enqueue(self, func, kwargs, key=None, merge=None, priority=PRIORITY_NORMAL):
+        from django_rq.queues import get_queue
+
+        queue_name = self.options.get("queue_name") or settings.RQ_QUEUE_NAME
+        if priority == PRIORITY_LOW:
+            queue_name = self.options.get("low_priority_queue_name") or queue_name
+        queue = get_queue(queue_name)
+
+        if key is None:
+            queue.enqueue_call(func, kwargs=kwargs)
+            return
+
+        connection = queue.connection
+        pending_key = "paper_uploads:pending:{}".format(key)
+        with connection.lock("paper_uploads:lock:{}".format(key), timeout=self.lock_timeout):
+            pending_id = connection.get(pending_key)
+            if isinstance(pending_id, bytes):
+                pending_id = pending_id.decode()
+
+            if pending_id and queue.remove(pending_id):
+                pending_job = queue.fetch_job(pending_id)
+                if pending_job is not None:
+                    kwargs = merge(pending_job.kwargs, kwargs) if merge else kwargs
+                    pending_job.delete(remove_from_queue=False)
+
+            job = queue.enqueue_call(func, kwargs=kwargs)
+            connection.set(pending_key, job.id, ex=self.pending_key_ttl)
+
+
+class ThreadBackend(BaseTaskBackend):
+    """
+    Выполнение задач в пуле потоков текущего процесса.
+    Не требует Redis, но задачи, не выполненные к моменту
+    остановки процесса, будут потеряны.
+
+    Параметры:
+        max_workers - количество потоков. По умолчанию - 1.
+        low_priority_workers - количество потоков для задач с приоритетом `low`.
+                               По умолчанию - 1.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.options.get("max_workers") or 1,
+            thread_name_prefix="paper_uploads"
+        )
+        self.low_priority_executor = ThreadPoolExecutor(
+            max_workers=self.options.get("low_priority_workers") or 1,
+            thread_name_prefix="paper_uploads_low"
+        )
+        self._pending = {}  # type: Dict[str, List]
+        self._lock = threading.Lock()
+
+    def get_executor(self, priority: str) -> ThreadPoolExecutor:
+        if priority == PRIORITY_LOW:
+            return self.low_priority_executor
+        return self.executor
+
+    def _enqueue(self, func, kwargs, key=None, merge=None, priority=PRIORITY_NORMAL):
+        executor = self.get_executor(priority)
+        if key is None:
+            executor.submit(self._run, func, kwargs)
+            return
+
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending[1] = merge(pending[1], kwargs) if merge else kwargs
+                return
+
+            self._pending[key] = [func, kwargs]
+
+        executor.submit(self._run_pending, key)
+
+    def _run_pending(self, key: str):
+        # после извлечения задачи новые запросы с тем же ключом
+        # создают новую задачу
+        with self._lock:
+            func, kwargs = self._pending.pop(key)
+        self._run(func, kwargs)
+
+    @staticmethod
+    def _run(func: Callable, kwargs: Dict[str, Any]):
+        try:
+            func(**kwargs)
+        except Exception:
+            logger.exception("Background task failed")
+        finally:
+            # соединения с БД привязаны к потоку и сами не закрываются
+            connections.close_all()
+
+
+_backend = None  # type: Optional[BaseTaskBackend]
+
+
+def get_task_backend() -> BaseTaskBackend:
+    """
+    Получение экземпляра бэкенда фоновых задач.
+
+    Если настройка `TASK_BACKEND` не задана, то используется
+    `RQBackend` при включённой настройке `RQ_ENABLED`
+    и `SyncBackend` — в противном случае.
+    """
+    global _backend
+
+    backend_class = settings.TASK_BACKEND
+    if backend_class is None:
+        backend_class = RQBackend if settings.RQ_ENABLED else SyncBackend
+
+    if type(_backend) is not backend_class:
+        _backend = backend_class(**settings.TASK_BACKEND_OPTIONS)
+    return _backend
@@ -1,6 +1,9 @@
 import hashlib
+import io
 import re
-from typing import Any, Dict, Iterable, Set, Tuple
+import tempfile
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterable, Set, Tuple
 
 from django.utils import formats
 from django.utils.html import avoid_wrapping
@@ -70,6 +73,84 @@ class cached_method:  # noqa: N801
         return inner
 
 
+class InlineExecutor(Executor):
+    """
+    Исполнитель, выполняющий задачи синхронно в вызывающем потоке.
+    Используется там, где запуск пула потоков не оправдан.
+    """
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+        return future
+
+
+class SpooledTemporaryFile(tempfile.SpooledTemporaryFile):
+    """
+    Временный файл, который хранится в памяти, пока его размер
+    не превысит `max_size`.
+
+    Стандартный SpooledTemporaryFile переносится на диск при вызове `fileno()`.
+    Pillow вызывает этот метод при записи JPEG, поэтому здесь, пока файл
+    находится в памяти, `fileno()` вызывает io.UnsupportedOperation,
+    и Pillow пишет данные через `write()`.
+    """
+
+    def fileno(self):
+        if not self._rolled:
+            raise io.UnsupportedOperation("fileno")
+        return super().fileno()
+
+
+class ContentHash:
+    """
+    Инкрементальный расчёт контрольной суммы в формате DropBox.
+    https://www.dropbox.com/developers/reference/content-hash
+
+    Данные разбиваются на блоки по 4 МБ, хэши которых вычисляются по мере
+    поступления данных. Хэши завершённых блоков (`blocks`) можно сохранить
+    и позже продолжить расчёт, передав их в конструктор и дописав данные,
+    начиная с позиции `offset`.
+    """
+    block_size = 4 * 1024 * 1024
+
+    def __init__(self, blocks: Iterable[bytes] = ()):
+        self.blocks = list(blocks)
+        self._block = hashlib.sha256()
+        self._block_length = 0
+
+    @property
+    def offset(self) -> int:
+        """
+        Количество байт, вошедших в завершённые блоки.
+        """
+        return len(self.blocks) * self.block_size
+
+    def update(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            length = min(len(view), self.block_size - self._block_length)
+            self._block.update(view[:length])
+            self._block_length += length
+            view = view[length:]
+
+            if self._block_length == self.block_size:
+                self.blocks.append(self._block.digest())
+                self._block = hashlib.sha256()
+                self._block_length = 0
+
+    def hexdigest(self) -> str:
+        blocks = self.blocks
+        if self._block_length:
+            blocks = blocks + [self._block.digest()]
+        return hashlib.sha256(b"".join(blocks)).hexdigest()
+
+
 def checksum(file: FileLike) -> str:
     """
     DropBox checksum realization.
@@ -80,13 +161,13 @@ def checksum(file: FileLike) -> str:
     elif file.seekable():
         file.seek(0)
 
-    blocks = []
+    content_hash = ContentHash()
     while True:
-        data = file.read(4 * 1024 * 1024)
+        data = file.read(ContentHash.block_size)
         if not data:
             break
-        blocks.append(hashlib.sha256(data).digest())
-    return hashlib.sha256(b"".join(blocks)).hexdigest()
+        content_hash.update(data)
+    return content_hash.hexdigest()
 
 
 def remove_dulpicates(seq: Iterable) -> Tuple:
@@ -2,12 +2,11 @@ import os
 import warnings
 from typing import Sequence, Union
 
-import magic
 from django.core.exceptions import ValidationError
 from django.utils.deconstruct import deconstructible
 from django.utils.translation import gettext_lazy as _
-from PIL import Image
 
+from .probe import probe_file
 from .typing import FileLike
 from .utils import filesizeformat, parse_filesize, remove_dulpicates
 
@@ -56,9 +55,7 @@ class MimeTypeValidator:
             self.message = message
 
     def __call__(self, file: FileLike):
-        file.seek(0)  # ensure read from the start
-        mimetype = magic.from_buffer(file.read(1024), mime=True)
-        file.seek(0)  # correct file position after mimetype detection
+        mimetype = probe_file(file).mimetype
         basetype, subtype = mimetype.split("/", 1)
         params = {
             "name": file.name,
@@ -122,8 +119,7 @@ class ImageMinSizeValidator:
             raise ValidationError("File `%(name)s` is closed" % {"name": os.path.basename(file.name)})
 
         try:
-            img = Image.open(file)
-            image_size = img.size
+            image_size = probe_file(file).image_size
         except OSError:
             raise ValidationError("File `%(name)s` is not an image" % {"name": os.path.basename(file.name)})
 
@@ -187,8 +183,7 @@ class ImageMaxSizeValidator:
             raise ValidationError("File `%(name)s` is closed" % {"name": os.path.basename(file.name)})
 
         try:
-            img = Image.open(file)
-            image_size = img.size
+            image_size = probe_file(file).image_size
         except OSError:
             raise ValidationError("File `%(name)s` is not an image" % {"name": os.path.basename(file.name)})
 
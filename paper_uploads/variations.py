@@ -1,16 +1,29 @@
+import enum
+import hashlib
+import json
 import posixpath
+import types
 
 from variations.variation import Variation
 
+# Приоритеты нарезки вариаций
+PRIORITY_HIGH = "high"      # нарезаются сразу, без постановки в очередь
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"        # нарезаются в отдельной очереди
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
 
 class PaperVariation(Variation):
     """
     Расширение возможностей вариации:
       * Хранение имени вариации
+      * Отпечаток конфигурации
+      * Приоритет нарезки
     """
 
-    def __init__(self, *args, name: str = "", **kwargs):
+    def __init__(self, *args, name: str = "", priority: str = PRIORITY_NORMAL, **kwargs):
         self.name = name
+        self.priority = priority
         super().__init__(*args, **kwargs)
 
     @property
@@ -23,6 +36,16 @@ class PaperVariation(Variation):
             raise TypeError(value)
         self._name = value
 
+    @property
+    def priority(self) -> str:
+        return self._priority
+
+    @priority.setter
+    def priority(self, value: str):
+        if value not in PRIORITIES:
+            raise ValueError("unknown variation priority: {}".format(value))
+        self._priority = value
+
     def get_output_filename(self, input_filename: str) -> str:
         """
         Конструирует имя файла для вариации по имени файла исходника.
@@ -37,3 +60,74 @@ class PaperVariation(Variation):
         file_name = "".join((new_file_root, file_ext))
         name = posixpath.join(dir_name, file_name)
         return self.replace_extension(name)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Отпечаток параметров вариации, влияющих на содержимое итогового файла.
+        Позволяет определить, что файл вариации был создан по устаревшей
+        конфигурации.
+        """
+        config = [
+            self.size,
+            self.clip,
+            self.upscale,
+            self.anchor,
+            self.max_width,
+            self.max_height,
+            self.face_detection,
+            self.format,
+            self.extra_context,
+            [_describe_processor(proc) for proc in self.preprocessors],
+            [_describe_processor(proc) for proc in self.postprocessors],
+        ]
+        data = json.dumps(_serialize(config), sort_keys=True)
+        return hashlib.md5(data.encode()).hexdigest()
+
+
+def _qualified_name(obj) -> str:
+    return "{}.{}".format(obj.__module__, obj.__qualname__)
+
+
+def _describe_processor(processor) -> list:
+    return [_qualified_name(type(processor)), getattr(processor, "__dict__", {})]
+
+
+def _serialize(value):
+    """
+    Приведение параметров вариации к виду, пригодному для JSON.
+
+    Множества приводятся к отсортированным спискам. Объекты представляются
+    именем класса и своими атрибутами, функции и классы — полным именем.
+    Для остальных значений
+    вызывается TypeError, т.к. их `repr()` может содержать адрес
+    в памяти и отпечаток будет меняться при каждом запуске.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_serialize(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(
+            (_serialize(item) for item in value),
+            key=lambda item: json.dumps(item, sort_keys=True)
+        )
+    if isinstance(value, dict):
+        for key in value:
+            if not isinstance(key, str):
+                raise TypeError(
+                    "Variation parameters must have string keys, got {!r}".format(key)
+                )
+        return {key: _serialize(item) for key, item in value.items()}
+    if isinstance(value, enum.Enum):
+        return [_qualified_name(type(value)), _serialize(value.value)]
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        return _qualified_name(value)
+    if hasattr(value, "__dict__"):
+        return [_qualified_name(type(value)), _serialize(vars(value))]
+
+    raise TypeError(
+        "Object of type {} can not be used in a variation fingerprint".format(
+            type(value).__name__
+        )
+    )
@@ -1 +1 @@
-from . import collection, file, image  # noqa: 401
+from . import base, collection, file, image  # noqa: 401
@@ -1,5 +1,5 @@
 import os
-import shutil
+import sys
 import tempfile
 from typing import Any, Dict, Iterable, List, Optional, Union
 from uuid import UUID
@@ -12,6 +12,7 @@ from django.core.exceptions import (
     ObjectDoesNotExist,
     ValidationError,
 )
+from django.core.files import File
 from django.core.files.uploadedfile import UploadedFile
 from django.core.handlers.wsgi import WSGIRequest
 from django.http import HttpResponse, JsonResponse
@@ -24,9 +25,16 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.edit import FormMixin
 
 from .. import exceptions
+from ..chunks import ChunkedUpload, remove_expired_uploads
+from ..conf import settings as paper_settings
 from ..files import TemporaryUploadedFile
 from ..logging import logger
 from ..models.base import Resource
+from ..models.mixins import BacklinkModelMixin
+from ..probe import probe_file
+from ..utils import filesizeformat
+from ..validators import MaxSizeValidator
+from . import helpers
 
 
 class AjaxView(View):
@@ -102,6 +110,29 @@ class AjaxView(View):
         return inner
 
 
+def get_upload_tempdir(request: WSGIRequest, create: bool = True) -> Optional[str]:
+    """
+    Каталог для временных файлов загрузок текущей сессии.
+    """
+    tempdir = request.session.get("paper_uploads_tempdir")
+    if tempdir is None or not os.path.isdir(tempdir):
+        if not create:
+            return None
+
+        if request.user.pk is not None:
+            tempdir_suffix = ".user_{}".format(request.user.pk)
+        else:
+            tempdir_suffix = None
+
+        tempdir = tempfile.mkdtemp(
+            prefix="paper_uploads.",
+            suffix=tempdir_suffix,
+            dir=settings.FILE_UPLOAD_TEMP_DIR
+        )
+        request.session["paper_uploads_tempdir"] = tempdir
+    return tempdir
+
+
 class UploadFileViewBase(AjaxView):
     http_method_names = ["post"]
 
@@ -125,6 +156,10 @@ class UploadFileViewBase(AjaxView):
         except exceptions.InvalidChunking:
             logger.exception("Error")
             return self.error_response(_("Invalid chunking"), preventRetry=True)
+        except ValidationError as e:
+            messages = self.get_exception_messages(e)
+            logger.debug(messages)
+            return self.error_response(messages, preventRetry=True)
 
         try:
             return self.wrap(self.handle)(file)
@@ -144,52 +179,228 @@ class UploadFileViewBase(AjaxView):
         except (ValueError, TypeError):
             raise exceptions.InvalidChunking
 
+        if total_chunks < 1 or not 0 <= chunk_index < total_chunks:
+            raise exceptions.InvalidChunking
+
+        offset = self.get_chunk_offset(request, chunk_index)
+        try:
+            total_size = int(request.POST.get("paperTotalFileSize") or 0)
+        except (ValueError, TypeError):
+            raise exceptions.InvalidChunking
+
+        # размер должен быть представим смещением в файле
+        if not 0 <= total_size <= sys.maxsize:
+            raise exceptions.InvalidChunking
+
         uuid = request.POST.get("paperUUID")
         try:
             uid = UUID(uuid)
         except (AttributeError, ValueError):
             raise exceptions.InvalidUUID(uuid)
 
-        tempdir = request.session.get("paper_uploads_tempdir")
-        if tempdir is None or not os.path.isdir(tempdir):
-            if request.user.pk is not None:
-                tempdir_suffix = ".user_{}".format(request.user.pk)
-            else:
-                tempdir_suffix = None
-
-            tempdir = tempfile.mkdtemp(
-                prefix="paper_uploads.",
-                suffix=tempdir_suffix,
-                dir=settings.FILE_UPLOAD_TEMP_DIR
-            )
-            request.session["paper_uploads_tempdir"] = tempdir
-
-        tempfilepath = os.path.join(tempdir, str(uid))
+        tempdir = get_upload_tempdir(request)
+        upload = ChunkedUpload(tempdir, str(uid))
         file = request.FILES.get("file")
         if file is None:
-            # случается при отмене загрузки на медленном интернете
-            if os.path.isfile(tempfilepath):
-                os.unlink(tempfilepath)
+            # Случается при отмене загрузки на медленном интернете.
+            # Части со смещением сохраняются, чтобы загрузку можно было
+            # продолжить (см. `UploadStatusView`). Загрузку без смещения
+            # продолжить нельзя, поэтому её части удаляются.
+            if offset is None:
+                upload.discard()
             raise exceptions.UncompleteUpload
 
         if total_chunks > 1:
-            with open(tempfilepath, "a+b") as fp:
-                shutil.copyfileobj(file, fp)
-
-            if chunk_index < total_chunks - 1:
+            if chunk_index == 0:
+                remove_expired_uploads(tempdir, paper_settings.UPLOAD_TTL)
+
+                # При дозаписи частей в конец файла продолжить загрузку
+                # невозможно, поэтому первая часть начинает её заново.
+                if offset is None:
+                    upload.discard()
+
+                if not offset:
+                    try:
+                        self.validate_first_chunk(self.get_first_chunk_file(file, total_size))
+                    except ValidationError:
+                        upload.discard()
+                        raise
+                    except Exception:
+                        # Прочие ошибки (например, неверный ContentType)
+                        # будут обработаны после получения всего файла.
+                        logger.debug("First chunk validation failed", exc_info=True)
+
+            # Часть должна целиком помещаться в файл заявленного размера,
+            # иначе загрузка никогда не будет завершена.
+            start = upload.get_size() if offset is None else offset
+            if total_size and start + file.size > total_size:
+                upload.discard()
+                raise exceptions.InvalidChunking
+
+            self.check_size_limit(file, upload, max(total_size, start + file.size))
+            upload.write(file.chunks(), offset=offset, total_size=total_size)
+
+            # Части могут поступать параллельно, поэтому загрузку завершает
+            # тот запрос, после которого получены все части.
+            if not upload.is_complete(total_chunks, total_size) or not upload.claim():
                 raise exceptions.ContinueUpload
 
+            file_checksum = upload.get_checksum()
+            upload.cleanup()
+
             file = TemporaryUploadedFile(
-                open(tempfilepath, "rb"),
+                open(upload.path, "rb"),
                 name=os.path.basename(file.name),
-                size=os.path.getsize(tempfilepath)
+                size=os.path.getsize(upload.path)
             )
+            probe_file(file).checksum = file_checksum
         return file
 
+    def check_size_limit(self, file: UploadedFile, upload: ChunkedUpload, size: int):
+        """
+        Проверка заявленного размера файла до записи части на диск,
+        чтобы не выделять место под файл, который не пройдёт проверку.
+
+        Помимо ограничения поля, размер ограничен настройкой `UPLOAD_MAX_SIZE`.
+        """
+        try:
+            size_limit = self.get_size_limit()
+        except Exception:
+            # Прочие ошибки (например, неверный ContentType)
+            # будут обработаны после получения всего файла.
+            logger.debug("Failed to get the file size limit", exc_info=True)
+            size_limit = None
+
+        max_size = paper_settings.UPLOAD_MAX_SIZE
+        if max_size is not None:
+            size_limit = max_size if size_limit is None else min(size_limit, max_size)
+
+        if size_limit is not None and size > size_limit:
+            upload.discard()
+            raise ValidationError(
+                MaxSizeValidator.message,
+                code=MaxSizeValidator.code,
+                params={
+                    "name": os.path.basename(file.name),
+                    "size": size,
+                    "limit_value": filesizeformat(size_limit),
+                }
+            )
+
+    def get_size_limit(self) -> Optional[int]:
+        """
+        Максимальный размер загружаемого файла. None - без ограничений.
+        """
+        return None
+
+    @staticmethod
+    def get_first_chunk_file(file: UploadedFile, total_size: int) -> File:
+        """
+        Файл, представляющий загружаемый файл по его первой части.
+        Содержимое файла - начало загружаемого файла, а размер - заявленный
+        клиентом размер всего файла (`paperTotalFileSize`), если он указан.
+        """
+        first_chunk = File(file.file, name=os.path.basename(file.name))
+        if total_size:
+            first_chunk.size = total_size
+        return first_chunk
+
+    def validate_first_chunk(self, file: File):
+        """
+        Проверка файла по первой части, до получения остальных частей.
+        Если файл заведомо не пройдёт проверку после сборки, необходимо
+        вызвать ValidationError - тогда загрузка прерывается.
+
+        По файлу доступны имя, заявленный размер и начало содержимого,
+        по которому определяются MIME-тип и размеры изображения.
+        """
+        pass
+
+    @staticmethod
+    def get_chunk_offset(request: WSGIRequest, chunk_index: int) -> Optional[int]:
+        """
+        Смещение части в файле. Задаётся либо явно (`paperChunkOffset`),
+        либо через размер части (`paperChunkSize`) - тогда смещение равно
+        произведению индекса части на её размер.
+
+        Если смещение не задано, часть дописывается в конец файла.
+        В этом случае части должны отправляться строго по порядку.
+        """
+        try:
+            if "paperChunkOffset" in request.POST:
+                offset = int(request.POST["paperChunkOffset"])
+            elif "paperChunkSize" in request.POST:
+                offset = chunk_index * int(request.POST["paperChunkSize"])
+            else:
+                return None
+        except (ValueError, TypeError):
+            raise exceptions.InvalidChunking
+
+        if not 0 <= offset <= sys.maxsize:
+            raise exceptions.InvalidChunking
+        return offset
+
     def handle(self, file: UploadedFile) -> HttpResponse:
         raise NotImplementedError
 
 
+class OwnerFieldUploadMixin:
+    """
+    Проверка загружаемого файла валидаторами поля модели-владельца.
+    Используется представлениями загрузки файлов, экземпляр которых
+    связан с полем владельца (BacklinkModelMixin).
+    """
+
+    def get_owner_field(self):
+        instance = self.get_instance()
+        if isinstance(instance, BacklinkModelMixin):
+            return instance.get_owner_field()
+        return None
+
+    def get_size_limit(self) -> Optional[int]:
+        owner_field = self.get_owner_field()
+        if owner_field is not None:
+            return helpers.get_size_limit(owner_field.validators)
+        return None
+
+    def validate_first_chunk(self, file: File):
+        owner_field = self.get_owner_field()
+        if owner_field is not None:
+            helpers.run_first_chunk_validators(file, owner_field.validators)
+
+
+class UploadStatusView(AjaxView):
+    """
+    Состояние незавершённой загрузки.
+
+    Возвращает полученные диапазоны байт файла с указанным `paperUUID`,
+    чтобы клиент мог отправить только недостающие части.
+    """
+    http_method_names = ["get"]
+
+    def get(self, request: WSGIRequest, *args, **kwargs) -> HttpResponse:
+        if not request.user.has_perm("paper_uploads.upload"):
+            return self.error_response(_("Access denied"))
+
+        uuid = request.GET.get("paperUUID")
+        try:
+            uid = UUID(uuid)
+        except (AttributeError, ValueError):
+            return self.error_response(_("Invalid UUID: %s") % uuid)
+
+        ranges = []
+        tempdir = get_upload_tempdir(request, create=False)
+        if tempdir is not None:
+            remove_expired_uploads(tempdir, paper_settings.UPLOAD_TTL)
+            upload = ChunkedUpload(tempdir, str(uid))
+            ranges = upload.get_received_ranges()
+
+        return self.success_response({
+            "uuid": str(uid),
+            "ranges": ranges,
+        })
+
+
 class DeleteFileViewBase(AjaxView):
     http_method_names = ["post"]
 
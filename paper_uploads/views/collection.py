@@ -1,8 +1,9 @@
 import os
-from typing import Any, Generator, Tuple, Type, Union, cast
+from typing import Any, Generator, Optional, Tuple, Type, Union, cast
 
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files import File
 from django.core.files.uploadedfile import UploadedFile
 from django.core.handlers.wsgi import WSGIRequest
 from django.db import transaction
@@ -13,7 +14,6 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 
 from .. import exceptions, signals
-from ..helpers import run_validators
 from ..logging import logger
 from ..models.collection import CollectionBase, CollectionFileItemBase, CollectionItemBase
 from ..models.fields.collection import CollectionItem
@@ -130,6 +130,42 @@ class UploadFileView(UploadFileViewBase):
             if issubclass(field.model, CollectionFileItemBase) and field.model.accept(file):
                 yield item_type, field
 
+    def get_size_limit(self) -> Optional[int]:
+        # Тип элемента до сборки файла неизвестен, поэтому
+        # используется наибольшее из ограничений типов элементов.
+        collection_cls = self.get_collection_model()
+        limits = []
+        for item_type, item_type_field in collection_cls.item_types.items():
+            if not issubclass(item_type_field.model, CollectionFileItemBase):
+                continue
+
+            limit = helpers.get_size_limit(item_type_field.validators)
+            if limit is None:
+                return None
+            limits.append(limit)
+        return max(limits) if limits else None
+
+    def validate_first_chunk(self, file: File):
+        collection = self.get_collection_instance()
+
+        # Тип элемента определяется только после получения всего файла,
+        # поэтому загрузка прерывается, если файл не проходит проверку
+        # ни для одного из подходящих типов.
+        error = None
+        for item_type, item_type_field in self.get_accepted_item_types(collection, file):
+            try:
+                helpers.run_first_chunk_validators(file, item_type_field.validators)
+            except ValidationError as e:
+                error = error or e
+            else:
+                return
+
+        if error is not None:
+            raise error
+
+        filename = os.path.basename(file.name)
+        raise ValidationError(_("Unsupported file: %s") % filename)
+
     def handle(self, file: UploadedFile) -> HttpResponse:
         collection = self.get_collection_instance()
 
@@ -143,14 +179,14 @@ class UploadFileView(UploadFileViewBase):
                 order=self.get_order()
             )
 
+            # валидаторы типа элемента вызываются до сохранения файла в хранилище
             try:
-                item.attach(file)
+                item.attach(file, validators=item_type_field.validators)
             except exceptions.UnsupportedResource:
                 continue
 
             try:
                 item.full_clean()
-                run_validators(file, item_type_field.validators)
             except Exception:
                 item.delete_file()
                 raise
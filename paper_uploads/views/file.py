@@ -4,14 +4,18 @@ from django.core.files.uploadedfile import UploadedFile
 from django.http import HttpResponse
 from django.utils.module_loading import import_string
 
-from ..helpers import run_validators
 from ..models.base import FileResource
 from ..models.mixins import BacklinkModelMixin, EditableResourceMixin
 from . import helpers
-from .base import ChangeFileViewBase, DeleteFileViewBase, UploadFileViewBase
+from .base import (
+    ChangeFileViewBase,
+    DeleteFileViewBase,
+    OwnerFieldUploadMixin,
+    UploadFileViewBase,
+)
 
 
-class UploadFileView(UploadFileViewBase):
+class UploadFileView(OwnerFieldUploadMixin, UploadFileViewBase):
     def get_file_model(self) -> Type[FileResource]:
         content_type_id = self.request.POST.get("paperContentType")
         return helpers.get_model_class(content_type_id, FileResource)
@@ -27,16 +31,17 @@ class UploadFileView(UploadFileViewBase):
     def handle(self, file: UploadedFile) -> HttpResponse:
         instance = self.get_instance()
 
-        owner_field = None
+        validators = []
         if isinstance(instance, BacklinkModelMixin):
             owner_field = instance.get_owner_field()
+            if owner_field is not None:
+                validators = owner_field.validators
 
-        instance.attach(file)
+        # валидаторы поля вызываются до сохранения файла в хранилище
+        instance.attach(file, validators=validators)
 
         try:
             instance.full_clean()
-            if owner_field is not None:
-                run_validators(file, owner_field.validators)
         except Exception:
             instance.delete_file()
             raise
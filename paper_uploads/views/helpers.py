@@ -1,9 +1,12 @@
-from typing import Any, Type, TypeVar
+from typing import Any, Iterable, Optional, Type, TypeVar
 
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
-from .. import exceptions
+from .. import exceptions, validators
+from ..helpers import run_validators
+from ..probe import probe_file
+from ..typing import FileLike
 
 T = TypeVar("T")
 
@@ -32,3 +35,51 @@ def get_instance(model_class: Type[models.Model], pk: Any) -> models.Model:
         return model_class._default_manager.get(pk=pk)
     except (ValueError, TypeError):
         raise exceptions.InvalidObjectId(pk)
+
+
+# Валидаторы, результат которых определяется по имени, заявленному
+# размеру и началу файла. Остальные валидаторы поля могут зависеть
+# от всего содержимого, поэтому запускаются только после сборки файла.
+FIRST_CHUNK_VALIDATORS = (
+    validators.MaxSizeValidator,
+    validators.ExtensionValidator,
+    validators.MimeTypeValidator,
+    validators.ImageMinSizeValidator,
+    validators.ImageMaxSizeValidator,
+)
+
+
+def run_first_chunk_validators(file: FileLike, field_validators: Iterable[Any]):
+    """
+    Проверка файла по его первой части.
+
+    Запускаются только валидаторы из FIRST_CHUNK_VALIDATORS.
+    Валидаторы размеров изображения пропускаются, если размеры
+    не удалось прочитать из начала файла. Такой файл будет
+    проверен после получения всех частей.
+    """
+    selected_validators = []
+    for v in field_validators:
+        if not isinstance(v, FIRST_CHUNK_VALIDATORS):
+            continue
+
+        if isinstance(v, (validators.ImageMinSizeValidator, validators.ImageMaxSizeValidator)):
+            try:
+                probe_file(file).image_info
+            except Exception:
+                continue
+        selected_validators.append(v)
+
+    run_validators(file, selected_validators)
+
+
+def get_size_limit(field_validators: Iterable[Any]) -> Optional[int]:
+    """
+    Максимальный размер файла, заданный валидаторами MaxSizeValidator.
+    """
+    limits = [
+        v.limit_value
+        for v in field_validators
+        if isinstance(v, validators.MaxSizeValidator)
+    ]
+    return min(limits) if limits else None
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_dummyfilefieldresource_mimetype_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dummyversatileimageresource',
+            name='variations_manifest',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variations manifest'),
+        ),
+    ]
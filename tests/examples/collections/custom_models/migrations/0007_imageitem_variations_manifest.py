@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_models_collections', '0006_imageitem_mimetype'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageitem',
+            name='variations_manifest',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='variations manifest'),
+        ),
+    ]
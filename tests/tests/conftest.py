@@ -58,3 +58,25 @@ def storage(request, django_db_setup, django_db_blocker):
             next(gen)
         except StopIteration:
             pass
+
+
+@pytest.fixture
+def rq_queues(monkeypatch):
+    """
+    Настоящие очереди RQ поверх fakeredis вместо очередей django-rq.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("django_rq")
+    import django_rq.queues
+    from rq import Queue
+
+    connection = fakeredis.FakeStrictRedis()
+    queues = {}
+
+    def get_queue(name):
+        if name not in queues:
+            queues[name] = Queue(name, connection=connection)
+        return queues[name]
+
+    monkeypatch.setattr(django_rq.queues, "get_queue", get_queue)
+    return queues
@@ -799,6 +799,28 @@ class TestImageItem(CollectionItemTestBase):
         assert ImageItem.PREVIEW_VARIATIONS["admin_preview"]["size"] == (180, 135)
         assert IMAGE_ITEM_VARIATIONS["admin_preview"]["size"] == (180, 135)
 
+    def test_preview_variations_priority(self, storage, monkeypatch):
+        resource = storage.resource
+        monkeypatch.setattr(type(resource), "PREVIEW_VARIATIONS", dict(
+            admin_preview=dict(size=(180, 135), format="jpeg", versions={"webp"}),
+            admin_preview_low=dict(size=(90, 60), priority="low"),
+        ))
+
+        config = type(resource).get_variation_config(
+            resource.get_collection_class(),
+            resource.get_item_type_field()
+        )
+        variations = helpers.build_variations(config)
+
+        # превью нарезаются сразу же, если приоритет не задан явно
+        assert variations["admin_preview"].priority == "high"
+        assert variations["admin_preview_webp"].priority == "high"
+        assert variations["admin_preview_low"].priority == "low"
+        assert variations["desktop"].priority == "normal"
+
+        # класс не изменился
+        assert "priority" not in type(resource).PREVIEW_VARIATIONS["admin_preview"]
+
     def test_get_variations_on_empty_resource(self):
         resource = self.resource_class()
         variations = resource.get_variations()
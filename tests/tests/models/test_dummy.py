@@ -1,15 +1,18 @@
 import io
 import os
+import tracemalloc
 from contextlib import contextmanager
 from decimal import Decimal
 from pathlib import Path
 
 import pytest
+from django.core.exceptions import ValidationError
 from django.core.files import File
+from django.core.files.storage import Storage
 from django.utils.crypto import get_random_string
 
 from app.models import *
-from paper_uploads import helpers, signals
+from paper_uploads import helpers, signals, validators
 from paper_uploads.exceptions import UnsupportedResource
 from paper_uploads.files import VariationFile
 from paper_uploads.storage import default_storage
@@ -371,6 +374,17 @@ class TestFileResourceAttach:
                 resource.attach(fp, name=overriden_name)
                 assert fp.tell() == self.resource_size
 
+    def test_validators(self):
+        resource = self.resource_class()
+        with pytest.raises(ValidationError, match="is too large"):
+            resource.attach(self.resource_attachment, validators=[
+                validators.MaxSizeValidator(1024)
+            ])
+
+        # файл не передан в хранилище
+        assert resource.resource_name == ""
+        assert resource.size == 0
+
 
 class TestFileResourceRename:
     resource_class = DummyFileResource
@@ -972,6 +986,32 @@ class TestImageFieldResource(TestFileFieldResource):
             with open(MEDITATION_FILEPATH, "rb") as fp:
                 obj._prepare_file(File(fp))
 
+    def test_prepare_file_too_large(self, storage):
+        from paper_uploads.conf import settings
+
+        obj = self.resource_class()
+        old_setting = settings.MAX_IMAGE_PIXELS
+        settings.MAX_IMAGE_PIXELS = 804 * 1198 - 1
+        try:
+            with pytest.raises(UnsupportedResource, match="too large"):
+                with open(CALLIPHORA_FILEPATH, "rb") as fp:
+                    obj._prepare_file(File(fp))
+        finally:
+            settings.MAX_IMAGE_PIXELS = old_setting
+
+    def test_prepare_file_decompression_bomb(self, storage):
+        from PIL import Image
+
+        obj = self.resource_class()
+        old_limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 804 * 1198 // 4
+        try:
+            with pytest.raises(UnsupportedResource, match="too large"):
+                with open(CALLIPHORA_FILEPATH, "rb") as fp:
+                    obj._prepare_file(File(fp))
+        finally:
+            Image.MAX_IMAGE_PIXELS = old_limit
+
 
 class TestImageFieldResourceAttach(TestFileFieldResourceAttach):
     resource_class = DummyImageFieldResource
@@ -1158,6 +1198,28 @@ class TestVersatileImageResource(TestImageFieldResource):
         with pytest.raises(AttributeError):
             storage.resource.tablet  # noqa
 
+    def test_lazy_variation_attribute(self, storage, monkeypatch):
+        calls = []
+        get_variations = self.resource_class.get_variations
+
+        def counting_get_variations(instance):
+            calls.append(instance)
+            return get_variations(instance)
+
+        monkeypatch.setattr(self.resource_class, "get_variations", counting_get_variations)
+
+        resource = self.resource_class.objects.get(pk=storage.resource.pk)
+        assert calls == []
+        assert "desktop" not in resource.__dict__
+
+        desktop = resource.desktop
+        assert isinstance(desktop, VariationFile)
+        assert resource.desktop is desktop
+
+        resource._reset_variation_files()
+        assert "desktop" not in resource.__dict__
+        assert resource.desktop is not desktop
+
     def test_variation_files_exists(self, storage):
         assert os.path.exists(storage.resource.path) is True
         assert os.path.exists(storage.resource.desktop.path) is True
@@ -1234,6 +1296,41 @@ class TestVersatileImageEmpty(TestImageFieldResourceEmpty):
             storage.resource.tablet  # noqa
 
 
+class ProxyStorage(Storage):
+    """
+    Хранилище, не являющееся FileSystemStorage.
+    """
+    def __init__(self, inner):
+        self.inner = inner
+        self.saved = []
+        self.rolled = []
+        self.memory = []
+
+    def _open(self, name, mode="rb"):
+        return self.inner._open(name, mode)
+
+    def _save(self, name, content):
+        self.saved.append(name)
+        self.rolled.append(content.file._rolled)
+        self.memory.append(tracemalloc.get_traced_memory()[0])
+        return self.inner._save(name, content)
+
+    def delete(self, name):
+        self.inner.delete(name)
+
+    def exists(self, name):
+        return self.inner.exists(name)
+
+    def size(self, name):
+        return self.inner.size(name)
+
+    def path(self, name):
+        return self.inner.path(name)
+
+    def url(self, name):
+        return self.inner.url(name)
+
+
 @pytest.mark.django_db
 class TestVariations:
     resource_class = DummyVersatileImageResource
@@ -1378,3 +1475,494 @@ class TestVariations:
 
         resource.delete_file()
         resource.delete()
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_variation_created_signal_order(self, workers):
+        from paper_uploads.conf import settings
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+
+        signal_names = []
+
+        def signal_handler(sender, instance, name, **kwargs):
+            signal_names.append(name)
+
+        old_setting = settings.RECUT_WORKERS
+        settings.RECUT_WORKERS = workers
+
+        signals.variation_created.connect(signal_handler)
+        try:
+            resource.save()
+        finally:
+            signals.variation_created.disconnect(signal_handler)
+            settings.RECUT_WORKERS = old_setting
+
+        assert signal_names == ["desktop", "mobile", "square"]
+        assert os.path.exists(resource.desktop.path) is True
+        assert os.path.exists(resource.mobile.path) is True
+        assert os.path.exists(resource.square.path) is True
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_get_recut_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from paper_uploads.conf import settings
+        from paper_uploads.utils import InlineExecutor
+
+        resource = self.resource_class()
+
+        old_setting = settings.RECUT_WORKERS
+        settings.RECUT_WORKERS = 4
+        try:
+            assert isinstance(resource.get_recut_executor(1), InlineExecutor)
+            with resource.get_recut_executor(3) as executor:
+                assert isinstance(executor, ThreadPoolExecutor)
+                assert executor._max_workers == 3
+        finally:
+            settings.RECUT_WORKERS = old_setting
+
+    def test_variations_manifest(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        assert set(resource.variations_manifest) == {"desktop", "mobile", "square"}
+
+        entry = resource.variations_manifest["desktop"]
+        assert entry["name"] == resource.desktop.name
+        assert entry["size"] == os.path.getsize(resource.desktop.path)
+        assert (entry["width"], entry["height"]) == (resource.desktop.width, resource.desktop.height)
+        assert entry["fingerprint"] == resource.get_variations()["desktop"].fingerprint
+
+        resource.refresh_from_db()
+        assert resource.variations_manifest["desktop"] == entry
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_variation_file_uses_manifest(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        resource.refresh_from_db()
+        resource._reset_variation_files()
+        storage = resource.desktop.storage
+
+        def fail(*args, **kwargs):
+            raise AssertionError("storage should not be accessed")
+
+        original_exists, original_size = storage.exists, storage.size
+        storage.exists = storage.size = fail
+        try:
+            assert resource.desktop.exists() is True
+            assert resource.desktop.size == resource.variations_manifest["desktop"]["size"]
+            assert resource.desktop.width == resource.variations_manifest["desktop"]["width"]
+        finally:
+            storage.exists, storage.size = original_exists, original_size
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_delete_variations_clears_manifest(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        resource.delete_variations()
+        assert resource.variations_manifest == {}
+        assert resource.desktop.exists() is False
+
+        resource.refresh_from_db()
+        assert resource.variations_manifest == {}
+
+        resource.recut(["mobile"])
+        assert set(resource.variations_manifest) == {"mobile"}
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_get_stale_variations(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        assert resource.get_stale_variations() == []
+
+        resource.variations_manifest["desktop"]["fingerprint"] = "outdated"
+        del resource.variations_manifest["square"]
+        assert resource.get_stale_variations() == ["desktop", "square"]
+        assert resource.get_stale_variations(["desktop", "mobile"]) == ["desktop"]
+
+        resource.recut(resource.get_stale_variations())
+        assert resource.get_stale_variations() == []
+
+        resource.delete_file()
+        resource.delete()
+
+    @contextmanager
+    def remote_storage(self, resource, spool_size=2621440):
+        from paper_uploads.conf import settings
+
+        file = resource.get_file()
+        storage = ProxyStorage(file.storage)
+        file.storage = storage
+        resource._reset_variation_files()
+
+        old_setting = settings.RECUT_SPOOL_MAX_SIZE
+        settings.RECUT_SPOOL_MAX_SIZE = spool_size
+        try:
+            yield storage
+        finally:
+            settings.RECUT_SPOOL_MAX_SIZE = old_setting
+            file.storage = storage.inner
+            resource._reset_variation_files()
+
+    @pytest.mark.parametrize("spool_size", [1, 2621440])
+    def test_recut_to_remote_storage(self, spool_size):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        with self.remote_storage(resource, spool_size) as storage:
+            resource.recut()
+
+            assert sorted(storage.saved) == sorted([
+                resource.desktop.name,
+                resource.mobile.name,
+                resource.square.name,
+            ])
+            assert set(storage.rolled) == {spool_size == 1}
+            for vname in ("desktop", "mobile", "square"):
+                vfile = resource.get_variation_file(vname)
+                assert resource.variations_manifest[vname]["size"] == os.path.getsize(vfile.path)
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_overwrite_remote_storage(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        with self.remote_storage(resource) as storage:
+            variation_dir = os.path.dirname(resource.desktop.path)
+            files_before = sorted(os.listdir(variation_dir))
+
+            resource.recut(["desktop"])
+
+            # хранилище не перезаписывает файлы, поэтому вариация
+            # сначала сохраняется под другим именем, а затем - повторно
+            assert len(storage.saved) == 2
+            assert storage.saved[0] != resource.desktop.name
+            assert storage.saved[1] == resource.desktop.name
+            assert sorted(os.listdir(variation_dir)) == files_before
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_overwrite_remote_storage_collision(self):
+        from django.core.exceptions import SuspiciousFileOperation
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        with self.remote_storage(resource) as storage:
+            variation_dir = os.path.dirname(resource.desktop.path)
+            files_before = sorted(os.listdir(variation_dir))
+
+            # файл с именем вариации появляется повторно
+            storage.exists = lambda name: True
+            storage.get_available_name = lambda name, max_length=None: name + "_copy"
+
+            with pytest.raises(SuspiciousFileOperation):
+                resource.recut(["desktop"])
+
+            storage.exists = storage.inner.exists
+            assert sorted(os.listdir(variation_dir)) == sorted(set(files_before) - {
+                os.path.basename(resource.desktop.name)
+            })
+
+        resource.delete_file()
+        resource.delete()
+
+    @pytest.mark.parametrize("spool_size", [1, 2621440])
+    def test_recut_to_remote_storage_memory(self, spool_size):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        with self.remote_storage(resource, spool_size) as storage:
+            tracemalloc.start()
+            try:
+                start = tracemalloc.get_traced_memory()[0]
+                resource.recut(["desktop"])
+            finally:
+                tracemalloc.stop()
+
+            # Объём памяти, занятой к моменту загрузки файла в хранилище.
+            # Пиковое значение определяется выходным буфером кодировщика
+            # Pillow и от размера спула не зависит.
+            used = storage.memory[0] - start
+            if spool_size == 1:
+                assert storage.rolled == [True]
+                assert used < resource.desktop.size // 10
+            else:
+                assert storage.rolled == [False]
+                assert used >= resource.desktop.size
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_max_pixels_in_memory(self):
+        from paper_uploads.conf import settings
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        expected = {
+            vname: (entry["width"], entry["height"])
+            for vname, entry in resource.variations_manifest.items()
+        }
+
+        old_setting = settings.RECUT_MAX_PIXELS_IN_MEMORY
+        settings.RECUT_MAX_PIXELS_IN_MEMORY = 1000
+        try:
+            resource.recut()
+        finally:
+            settings.RECUT_MAX_PIXELS_IN_MEMORY = old_setting
+
+        assert {
+            vname: (entry["width"], entry["height"])
+            for vname, entry in resource.variations_manifest.items()
+        } == expected
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_concurrent_recut_manifest(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        # два процесса загрузили один и тот же экземпляр
+        first = self.resource_class.objects.get(pk=resource.pk)
+        second = self.resource_class.objects.get(pk=resource.pk)
+        first.recut(["desktop"])
+        second.recut(["mobile"])
+
+        resource.refresh_from_db()
+        assert set(resource.variations_manifest) == {"desktop", "mobile"}
+        assert set(second.variations_manifest) == {"desktop", "mobile"}
+        assert resource.get_stale_variations() == ["square"]
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_async_waits_for_commit(self, monkeypatch, rq_queues, django_capture_on_commit_callbacks):
+        from paper_uploads import tasks
+        from paper_uploads.conf import settings
+
+        monkeypatch.setattr(settings, "TASK_BACKEND", tasks.RQBackend, raising=False)
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            resource.recut_async(["mobile"])
+            assert rq_queues == {}
+
+        assert len(callbacks) == 1
+        jobs = rq_queues[settings.RQ_QUEUE_NAME].get_jobs()
+        assert len(jobs) == 1
+        assert jobs[0].kwargs["file_name"] == resource.name
+        assert jobs[0].kwargs["fingerprints"] == {
+            "mobile": resource.get_variations()["mobile"].fingerprint
+        }
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_task_skips_stale_jobs(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        job = {
+            "app_label": resource._meta.app_label,
+            "model_name": resource._meta.model_name,
+            "object_id": resource.pk,
+            "using": resource._state.db,
+            "names": ["mobile"],
+            "fingerprints": {
+                "mobile": resource.get_variations()["mobile"].fingerprint
+            },
+        }
+
+        # файл был заменён после постановки задачи
+        self.resource_class._recut_task(file_name="replaced.jpg", **job)
+        assert resource.mobile.exists() is False
+
+        # экземпляр был удалён
+        self.resource_class._recut_task(**dict(job, object_id=resource.pk + 1000))
+
+        self.resource_class._recut_task(file_name=resource.name, **job)
+        assert resource.mobile.exists() is True
+        assert resource.desktop.exists() is False
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_task_outdated_fingerprint(self):
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        job = {
+            "app_label": resource._meta.app_label,
+            "model_name": resource._meta.model_name,
+            "object_id": resource.pk,
+            "using": resource._state.db,
+            "names": ["mobile"],
+            "file_name": resource.name,
+            "fingerprints": {"mobile": "outdated"},
+        }
+
+        # вариация уже нарезана по текущей конфигурации
+        created_at = resource.variations_manifest["mobile"]["created_at"]
+        self.resource_class._recut_task(**job)
+        resource.refresh_from_db()
+        assert resource.variations_manifest["mobile"]["created_at"] == created_at
+
+        resource.variations_manifest["mobile"]["fingerprint"] = "previous"
+        resource.save_variations_manifest()
+        self.resource_class._recut_task(**job)
+        resource.refresh_from_db()
+        assert resource.variations_manifest["mobile"]["fingerprint"] == (
+            resource.get_variations()["mobile"].fingerprint
+        )
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_recut_async_coalesce(self, monkeypatch, django_capture_on_commit_callbacks):
+        from paper_uploads import tasks
+        from paper_uploads.conf import settings
+
+        jobs = []
+
+        class Executor:
+            def submit(self, fn, *args):
+                jobs.append(args)
+
+        class Backend(tasks.ThreadBackend):
+            # задачи не выполняются, а только запоминаются
+            def __init__(self, **options):
+                super().__init__(**options)
+                self.executor.shutdown()
+                self.executor = Executor()
+
+        monkeypatch.setattr(settings, "TASK_BACKEND", Backend, raising=False)
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        backend = tasks.get_task_backend()
+        with django_capture_on_commit_callbacks(execute=True):
+            resource.recut_async(["mobile"])
+            resource.recut_async(["desktop", "mobile"])
+
+        assert len(jobs) == 1
+        func, kwargs = backend._pending[jobs[0][0]]
+        assert kwargs["names"] == ("mobile", "desktop")
+        assert set(kwargs["fingerprints"]) == {"mobile", "desktop"}
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_merge_recut_tasks(self):
+        merge = self.resource_class._merge_recut_tasks
+        pending = {
+            "names": ["mobile"],
+            "file_name": "image.jpg",
+            "fingerprints": {"mobile": "a"},
+        }
+
+        merged = merge(pending, {
+            "names": ("desktop",),
+            "file_name": "image.jpg",
+            "fingerprints": {"desktop": "b"},
+        })
+        assert merged["names"] == ("mobile", "desktop")
+        assert merged["fingerprints"] == {"mobile": "a", "desktop": "b"}
+
+        # пустой список означает все вариации
+        merged = merge(pending, {
+            "names": (),
+            "file_name": "image.jpg",
+            "fingerprints": {"desktop": "b", "mobile": "a"},
+        })
+        assert merged["names"] == ()
+
+        # новый файл заменяет ожидающую задачу
+        replaced = {
+            "names": ("desktop",),
+            "file_name": "other.jpg",
+            "fingerprints": {"desktop": "b"},
+        }
+        assert merge(pending, replaced) == replaced
+
+    def test_recut_async_priority(self, monkeypatch):
+        from paper_uploads import tasks
+        from paper_uploads.conf import settings
+
+        jobs = []
+
+        class Backend(tasks.BaseTaskBackend):
+            defer_until_commit = False
+
+            def _enqueue(self, func, kwargs, key=None, merge=None, priority="normal"):
+                jobs.append((priority, kwargs["names"]))
+
+        monkeypatch.setattr(settings, "TASK_BACKEND", Backend, raising=False)
+
+        resource = self.resource_class()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        variations = helpers.build_variations({
+            "desktop": dict(size=(800, 0), clip=False, versions={"webp"}),
+            "mobile": dict(size=(600, 0), clip=False),
+            "square": dict(size=(200, 200), priority="high"),
+        })
+        monkeypatch.setattr(resource, "get_variations", lambda: variations)
+        resource._reset_variation_files()
+        jobs.clear()
+
+        resource.recut_async()
+        assert jobs == [
+            ("normal", ("desktop", "mobile")),
+            ("low", ("desktop_webp",)),
+        ]
+
+        # вариации с высоким приоритетом нарезаются сразу
+        assert resource.square.exists() is True
+        assert resource.desktop.exists() is False
+
+        jobs.clear()
+        resource.recut_async(["desktop_webp"])
+        assert jobs == [("low", ("desktop_webp",))]
+
+        resource.delete_file()
+        resource.delete()
@@ -1,10 +1,20 @@
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections
 from django.utils.crypto import get_random_string
 from examples.fields.standard.models import Page
 
+from paper_uploads.conf import settings as paper_settings
 from paper_uploads.models import UploadedImage
+from paper_uploads.models.fields.image import VariationalFileField
+from paper_uploads.models.reservation import FileNameReservation
 from paper_uploads.variations import PaperVariation
 
 from .. import utils
@@ -210,3 +220,264 @@ class TestUploadedImageDelete(BacklinkModelTestMixin, BaseTestVersatileImageDele
 
 class TestUploadedImageEmpty(BaseTestVersatileImageEmpty):
     resource_class = UploadedImage
+
+
+@pytest.mark.django_db
+class TestUploadedImageNameReservation:
+    def _create_resource(self, name):
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        resource.attach(CALLIPHORA_FILEPATH, name=name)
+        resource.save()
+        return resource
+
+    def test_reserve_names(self):
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        resource.attach(CALLIPHORA_FILEPATH, name="reserve_{}.jpg".format(get_random_string(6)))
+        try:
+            root = os.path.splitext(resource.name)[0]
+            reserved = set(
+                FileNameReservation.objects.filter(root=root).values_list("name", flat=True)
+            )
+            assert reserved == {
+                os.path.splitext(vfile.name)[0]
+                for vname, vfile in resource.variation_files()
+            } | {root}
+
+            # файлы-заглушки вариаций не создаются
+            storage = resource.get_file_storage()
+            assert all(
+                not storage.exists(vfile.name)
+                for vname, vfile in resource.variation_files()
+            )
+        finally:
+            resource.delete_file()
+
+    def test_collision(self):
+        # файлы, отличающиеся только расширением, дают одинаковые имена вариаций
+        basename = "collision_{}".format(get_random_string(6))
+        first = self._create_resource(basename + ".jpg")
+        second = self._create_resource(basename + ".png")
+        try:
+            first_variations = {vfile.name for vname, vfile in first.variation_files()}
+            second_variations = {vfile.name for vname, vfile in second.variation_files()}
+            assert first_variations.isdisjoint(second_variations)
+        finally:
+            for resource in (first, second):
+                resource.delete_file()
+                resource.delete()
+
+    def test_collision_without_reservation(self, monkeypatch):
+        # файлы, загруженные до появления брони, проверяются по хранилищу
+        monkeypatch.setattr(paper_settings, "RESERVATION_STORAGE_CHECK", True, raising=False)
+        basename = "legacy_{}".format(get_random_string(6))
+        first = self._create_resource(basename + ".jpg")
+        FileNameReservation.objects.filter(root=os.path.splitext(first.name)[0]).delete()
+
+        second = self._create_resource(basename + ".png")
+        try:
+            first_variations = {vfile.name for vname, vfile in first.variation_files()}
+            second_variations = {vfile.name for vname, vfile in second.variation_files()}
+            assert first_variations.isdisjoint(second_variations)
+        finally:
+            for resource in (first, second):
+                resource.delete_file()
+                resource.delete()
+
+    def test_reserve_file_names_command(self):
+        basename = "backfill_{}".format(get_random_string(6))
+        first = self._create_resource(basename + ".jpg")
+        root = os.path.splitext(first.name)[0]
+        reserved_names = first.get_file_field().get_reserved_names(first, first.name)
+        FileNameReservation.objects.filter(root=root).delete()
+
+        second = None
+        try:
+            call_command("reserve_file_names")
+            assert set(
+                FileNameReservation.objects.filter(root=root).values_list("name", flat=True)
+            ) == set(reserved_names)
+
+            # повторный запуск ничего не меняет
+            call_command("reserve_file_names")
+            assert FileNameReservation.objects.filter(root=root).count() == len(reserved_names)
+
+            # вариации нового файла не совпадают с вариациями старого
+            # без проверки имён в хранилище
+            second = self._create_resource(basename + ".png")
+            first_variations = {vfile.name for vname, vfile in first.variation_files()}
+            second_variations = {vfile.name for vname, vfile in second.variation_files()}
+            assert first_variations.isdisjoint(second_variations)
+        finally:
+            for resource in (first, second):
+                if resource is not None:
+                    resource.delete_file()
+                    resource.delete()
+
+    def test_release_on_storage_error(self, monkeypatch):
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        storage = resource.get_file_storage()
+        reserved_roots = []
+
+        reserve_name = VariationalFileField.reserve_name
+
+        def spy_reserve_name(field, instance, name):
+            reserved_roots.append(field.get_reservation_root(name))
+            return reserve_name(field, instance, name)
+
+        def failing_save(name, content, max_length=None):
+            raise OSError("storage is unavailable")
+
+        monkeypatch.setattr(VariationalFileField, "reserve_name", spy_reserve_name)
+        monkeypatch.setattr(storage, "save", failing_save)
+
+        name = "failed_{}.jpg".format(get_random_string(6))
+        with pytest.raises(OSError):
+            resource.attach(CALLIPHORA_FILEPATH, name=name)
+
+        assert reserved_roots
+        assert not FileNameReservation.objects.filter(root__in=reserved_roots).exists()
+
+    def test_reserve_stored_name(self, monkeypatch):
+        # хранилище сохранило файл под другим именем
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        name = "stored_{}.jpg".format(get_random_string(6))
+        generated_name = resource.generate_filename(name)
+
+        storage = resource.get_file_storage()
+        occupied_name = storage.save(generated_name, ContentFile(b"occupied"))
+        monkeypatch.setattr(
+            VariationalFileField, "_variations_collapsed", staticmethod(lambda instance, name: False)
+        )
+
+        resource.attach(CALLIPHORA_FILEPATH, name=name)
+        try:
+            assert resource.name != occupied_name
+            assert not FileNameReservation.objects.filter(
+                root=os.path.splitext(occupied_name)[0]
+            ).exists()
+
+            root = os.path.splitext(resource.name)[0]
+            assert FileNameReservation.objects.filter(root=root).count() == len(
+                resource.get_file_field().get_reserved_names(resource, resource.name)
+            )
+        finally:
+            resource.delete_file()
+            storage.delete(occupied_name)
+
+        assert not FileNameReservation.objects.filter(root=root).exists()
+
+    def test_release_on_delete(self):
+        name = "release_{}.jpg".format(get_random_string(6))
+        resource = self._create_resource(name)
+        root = os.path.splitext(resource.name)[0]
+        resource.delete_file()
+        resource.delete()
+        assert not FileNameReservation.objects.filter(root=root).exists()
+
+        # имя снова свободно
+        resource = self._create_resource(name)
+        try:
+            assert os.path.splitext(resource.name)[0] == root
+        finally:
+            resource.delete_file()
+            resource.delete()
+
+    def test_reservation_collision(self, caplog):
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        field = resource.get_file_field()
+        basename = "collision_{}".format(get_random_string(6))
+        name = field.generate_filename(resource, "%s.jpg" % basename)
+        FileNameReservation.release(os.path.splitext(name)[0])
+
+        # Имя вариации уже забронировано другим процессом, который
+        # ещё не сохранил файл: в хранилище конфликта не видно.
+        reserved_names = field.get_reserved_names(resource, name)
+        conflict = FileNameReservation.objects.create(
+            name=reserved_names[-1],
+            root="other_{}".format(get_random_string(6)),
+        )
+
+        new_name = None
+        try:
+            with caplog.at_level(logging.DEBUG, logger="paper_uploads"):
+                new_name = field.generate_filename(resource, "%s.jpg" % basename)
+
+            assert new_name != name
+            root = os.path.splitext(new_name)[0]
+            assert FileNameReservation.objects.filter(root=root).count() == len(
+                field.get_reserved_names(resource, new_name)
+            )
+
+            # бронь другого процесса не затронута
+            assert FileNameReservation.objects.filter(
+                root=conflict.root
+            ).get().name == conflict.name
+
+            # метрика попыток бронирования
+            records = [
+                record for record in caplog.records
+                if hasattr(record, "reservation_retries")
+            ]
+            assert len(records) == 1
+            assert records[0].reservation_retries == 1
+        finally:
+            FileNameReservation.release(conflict.root)
+            if new_name is not None:
+                FileNameReservation.release(os.path.splitext(new_name)[0])
+
+    def test_concurrent_reservation(self):
+        # Имя тестовой БД известно только после её создания.
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            pytest.skip("in-memory SQLite database does not support concurrent writes")
+
+        resource = UploadedImage()
+        resource.set_owner_field(Page, "image_group")
+        field = resource.get_file_field()
+        basename = "concurrent_{}".format(get_random_string(6))
+        count = 8
+        barrier = threading.Barrier(count)
+
+        # Каждый поток работает через собственное соединение с БД, поэтому
+        # брони, созданные потоками, фиксируются вне транзакции теста.
+        def in_own_connection(func, *args):
+            try:
+                return func(*args)
+            finally:
+                connections.close_all()
+
+        def generate(index):
+            barrier.wait()
+
+            # вариации файлов с разными расширениями совпадают
+            extension = ("jpg", "png", "gif")[index % 3]
+            return field.generate_filename(resource, "%s.%s" % (basename, extension))
+
+        def get_reserved(roots):
+            return list(
+                FileNameReservation.objects.filter(root__in=roots).values_list("name", "root")
+            )
+
+        def release(roots):
+            FileNameReservation.objects.filter(root__in=roots).delete()
+
+        roots = []
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            try:
+                names = list(executor.map(
+                    lambda index: in_own_connection(generate, index),
+                    range(count)
+                ))
+                roots = [os.path.splitext(name)[0] for name in names]
+                assert len(set(roots)) == count
+
+                # ни одна из вариаций не перезапишет вариации другого файла
+                reserved = executor.submit(in_own_connection, get_reserved, roots).result()
+                assert len({name for name, root in reserved}) == len(reserved)
+                assert len(reserved) == count * len(field.get_reserved_names(resource, names[0]))
+            finally:
+                executor.submit(in_own_connection, release, roots).result()
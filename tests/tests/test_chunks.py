@@ -0,0 +1,176 @@
+import io
+import os
+import random
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+
+from paper_uploads.chunks import ChunkedUpload, remove_all_expired_uploads, remove_expired_uploads
+from paper_uploads.utils import ContentHash, checksum
+
+from .dummy import NATURE_FILEPATH
+
+
+def split(content, size):
+    return [(offset, content[offset:offset + size]) for offset in range(0, len(content), size)]
+
+
+class TestChunkedUpload:
+    def setup_method(self):
+        with open(NATURE_FILEPATH, "rb") as fp:
+            self.content = fp.read()
+
+    def get_checksum(self):
+        # с учётом подменённого размера блока
+        return checksum(io.BytesIO(self.content))
+
+    def test_sequential(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "sequential")
+            parts = split(self.content, 300000)
+            for offset, data in parts:
+                upload.write([data])
+
+            assert upload.is_complete(len(parts)) is True
+            assert upload.get_contiguous_size() == len(self.content)
+            assert upload.get_checksum() == self.get_checksum()
+
+            with open(upload.path, "rb") as fp:
+                assert fp.read() == self.content
+
+    def test_out_of_order(self, monkeypatch):
+        monkeypatch.setattr(ContentHash, "block_size", 100000)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "shuffled")
+            parts = split(self.content, 70000)
+            random.Random(0).shuffle(parts)
+
+            for offset, data in parts:
+                assert upload.is_complete(len(parts), len(self.content)) is False
+                upload.write([data], offset=offset, total_size=len(self.content))
+
+            assert upload.is_complete(len(parts), len(self.content)) is True
+            assert upload.get_checksum() == self.get_checksum()
+
+            with open(upload.path, "rb") as fp:
+                assert fp.read() == self.content
+
+    def test_contiguous_size(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "ranges")
+            upload.write([b"c" * 10], offset=20, total_size=30)
+            upload.write([b"a" * 10], offset=0, total_size=30)
+            assert upload.get_received_ranges() == [(0, 10), (20, 30)]
+            assert upload.get_contiguous_size() == 10
+
+            upload.write([b"b" * 10], offset=10, total_size=30)
+            assert upload.get_contiguous_size() == 30
+
+    def test_complete_by_size(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "coverage")
+            upload.write([b"a" * 10], offset=0, total_size=30)
+            upload.write([b"a" * 10], offset=0, total_size=30)
+
+            # повторно полученная часть не покрывает недостающие данные
+            assert upload.is_complete(3, 30) is False
+
+            upload.write([b"b" * 5], offset=10, total_size=30)
+            upload.write([b"c" * 15], offset=15, total_size=30)
+            assert upload.is_complete(3, 30) is True
+
+    def test_parallel(self, monkeypatch):
+        monkeypatch.setattr(ContentHash, "block_size", 100000)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "parallel")
+            parts = split(self.content, 50000)
+
+            def send(part):
+                offset, data = part
+                upload.write([data], offset=offset, total_size=len(self.content))
+                return upload.is_complete(len(parts), len(self.content)) and upload.claim()
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                claims = list(executor.map(send, parts))
+
+            # загрузку завершает ровно один запрос
+            assert claims.count(True) == 1
+            assert upload.get_checksum() == self.get_checksum()
+
+    def test_discard(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            upload = ChunkedUpload(tempdir, "discard")
+            upload.write([b"data"], offset=0)
+            upload.discard()
+            assert upload.get_received_ranges() == []
+            assert upload.claim() is True
+
+
+def test_remove_expired_uploads():
+    with tempfile.TemporaryDirectory() as tempdir:
+        fresh = ChunkedUpload(tempdir, str(uuid.uuid4()))
+        fresh.write([b"fresh"], offset=0)
+
+        stale = ChunkedUpload(tempdir, str(uuid.uuid4()))
+        stale.write([b"stale"], offset=0)
+        old_time = time.time() - 7200
+        os.utime(stale.path, (old_time, old_time))
+
+        remove_expired_uploads(tempdir, ttl=3600)
+        assert fresh.get_received_ranges() == [(0, 5)]
+        assert stale.get_received_ranges() == []
+        assert not os.path.exists(stale.path)
+
+
+def test_remove_all_expired_uploads():
+    old_time = time.time() - 7200
+    with tempfile.TemporaryDirectory() as root:
+        sessions = []
+        for _ in range(2):
+            tempdir = tempfile.mkdtemp(prefix="paper_uploads.", dir=root)
+            stale = ChunkedUpload(tempdir, str(uuid.uuid4()))
+            stale.write([b"stale"], offset=0)
+            os.utime(stale.path, (old_time, old_time))
+            sessions.append((tempdir, stale))
+
+        # сессия с активной загрузкой
+        fresh = ChunkedUpload(sessions[1][0], str(uuid.uuid4()))
+        fresh.write([b"fresh"], offset=0)
+
+        # каталоги других программ не затрагиваются
+        foreign = os.path.join(root, "other")
+        os.mkdir(foreign)
+        os.utime(foreign, (old_time, old_time))
+
+        for tempdir, _ in sessions:
+            os.utime(tempdir, (old_time, old_time))
+
+        assert remove_all_expired_uploads(root, ttl=3600) == 2
+        for _, stale in sessions:
+            assert not os.path.exists(stale.path)
+        assert fresh.get_received_ranges() == [(0, 5)]
+
+        # опустевший каталог сессии удаляется
+        assert not os.path.exists(sessions[0][0])
+        assert os.path.isdir(sessions[1][0])
+        assert os.path.isdir(foreign)
+
+
+def test_remove_expired_uploads_command(settings):
+    with tempfile.TemporaryDirectory() as root:
+        settings.FILE_UPLOAD_TEMP_DIR = root
+        tempdir = tempfile.mkdtemp(prefix="paper_uploads.", dir=root)
+        stale = ChunkedUpload(tempdir, str(uuid.uuid4()))
+        stale.write([b"stale"], offset=0)
+        old_time = time.time() - 7200
+        os.utime(stale.path, (old_time, old_time))
+
+        out = io.StringIO()
+        call_command("remove_expired_uploads", ttl=3600, stdout=out)
+        assert not os.path.exists(stale.path)
+        assert "Removed 1 expired uploads" in out.getvalue()
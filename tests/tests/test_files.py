@@ -133,3 +133,57 @@ class TestVariationFile:
 
         storage.file.name = source_name
         shutil.move(backup_file, source_file)
+
+
+@pytest.mark.django_db
+class TestVariationFileCache:
+    def test_cached_values(self, monkeypatch):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        file = VariationFile(resource, "desktop")
+        storage = file.storage
+
+        calls = []
+        monkeypatch.setattr(resource, "get_variations", lambda: calls.append(1) or {})
+        url = storage.url(file.name)
+        monkeypatch.setattr(storage, "url", lambda name: calls.append(name) or url)
+        monkeypatch.setattr(storage, "cache_urls", True, raising=False)
+
+        assert file.variation.name == "desktop"
+        assert file.url == url
+        assert file.url == url
+        assert file.srcset == "{} {}w".format(url, file.width)
+        assert calls == [file.name]
+
+        # URL пересчитывается при изменении имени файла
+        name = file.name
+        file.name = "other.jpg"
+        assert file.url == url
+        assert calls == [name, "other.jpg"]
+        file.name = name
+
+        monkeypatch.undo()
+        resource.delete_file()
+        resource.delete()
+
+    def test_url_not_cached(self, monkeypatch):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        file = VariationFile(resource, "desktop")
+        storage = file.storage
+
+        # хранилище выдаёт подписанные ссылки
+        urls = iter(["/signed/1", "/signed/2"])
+        monkeypatch.setattr(storage, "url", lambda name: next(urls))
+        monkeypatch.setattr(storage, "cache_urls", False, raising=False)
+
+        assert file.url == "/signed/1"
+        assert file.url == "/signed/2"
+
+        monkeypatch.undo()
+        resource.delete_file()
+        resource.delete()
@@ -159,6 +159,67 @@ class TestBuildVariations:
             ))
 
 
+class TestBuildVariationsCache:
+    def setup_method(self):
+        helpers.clear_variations_cache()
+
+    def teardown_method(self):
+        helpers.clear_variations_cache()
+
+    def test_shared(self):
+        first = helpers.build_variations({"desktop": {"size": (800, 600), "versions": {"webp"}}})
+        second = helpers.build_variations({"desktop": {"size": (800, 600), "versions": {"webp"}}})
+        assert first is not second
+        assert first["desktop"] is second["desktop"]
+        assert first["desktop_webp"] is second["desktop_webp"]
+
+    def test_different_config(self):
+        first = helpers.build_variations({"desktop": {"size": (800, 600)}})
+        second = helpers.build_variations({"desktop": {"size": (800, 601)}})
+        assert second["desktop"].size == (800, 601)
+        assert first["desktop"] is not second["desktop"]
+
+    def test_variation_defaults(self):
+        from paper_uploads.conf import settings
+
+        config = {"desktop": {"size": (800, 600)}}
+        first = helpers.build_variations(config)
+
+        old_setting = settings.VARIATION_DEFAULTS
+        settings.VARIATION_DEFAULTS = dict(format="webp")
+        try:
+            second = helpers.build_variations(config)
+        finally:
+            settings.VARIATION_DEFAULTS = old_setting
+
+        assert first["desktop"].format != "WEBP"
+        assert second["desktop"].format == "WEBP"
+
+    def test_clear(self):
+        config = {"desktop": {"size": (800, 600)}}
+        first = helpers.build_variations(config)
+        helpers.clear_variations_cache()
+        assert helpers.build_variations(config)["desktop"] is not first["desktop"]
+
+    def test_bounded(self, monkeypatch):
+        monkeypatch.setattr(helpers, "VARIATIONS_CACHE_SIZE", 2)
+        for width in range(1, 5):
+            helpers.build_variations({"desktop": {"size": (width, 0)}})
+        assert len(helpers._variations_cache) == 2
+
+    def test_unhashable(self):
+        class Processor:
+            __hash__ = None
+
+            def process(self, img):
+                return img
+
+        config = {"desktop": {"size": (800, 600), "postprocessors": [Processor()]}}
+        first = helpers.build_variations(config)
+        second = helpers.build_variations(config)
+        assert first["desktop"] is not second["desktop"]
+
+
 class TestIterateVariationNames:
     def test_plain(self):
         names = helpers.iterate_variation_names(dict(
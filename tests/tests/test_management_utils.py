@@ -0,0 +1,131 @@
+import os
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+
+from app.models import DummyVersatileImageResource
+from paper_uploads.management import helpers
+from paper_uploads.management.utils import StorageListing
+
+from .dummy import NATURE_FILEPATH
+
+
+class CountingStorage(FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listdir_calls = 0
+        self.exists_calls = 0
+
+    def listdir(self, path):
+        self.listdir_calls += 1
+        return super().listdir(path)
+
+    def exists(self, name):
+        self.exists_calls += 1
+        return super().exists(name)
+
+
+class NoListingStorage(Storage):
+    def exists(self, name):
+        return name == "folder/exists.txt"
+
+
+class TestStorageListing:
+    def test_listdir_once_per_directory(self, tmp_path):
+        storage = CountingStorage(location=str(tmp_path))
+        storage.save("2024/01/01/first.txt", ContentFile(b"1"))
+        storage.save("2024/01/01/second.txt", ContentFile(b"2"))
+        storage.save("2024/01/02/third.txt", ContentFile(b"3"))
+        storage.exists_calls = 0
+
+        listing = StorageListing()
+        assert listing.exists(storage, "2024/01/01/first.txt") is True
+        assert listing.exists(storage, "2024/01/01/second.txt") is True
+        assert listing.exists(storage, "2024/01/01/missing.txt") is False
+        assert listing.exists(storage, "2024/01/02/third.txt") is True
+        assert storage.listdir_calls == 2
+        assert storage.exists_calls == 0
+
+    def test_missing_directory(self, tmp_path):
+        storage = CountingStorage(location=str(tmp_path))
+        listing = StorageListing()
+        assert listing.exists(storage, "missing/file.txt") is False
+        assert listing.exists(storage, "missing/other.txt") is False
+        assert storage.listdir_calls == 1
+
+    def test_storage_key(self, tmp_path):
+        storage = CountingStorage(location=str(tmp_path))
+        storage.save("folder/file.txt", ContentFile(b"1"))
+
+        listing = StorageListing()
+        assert listing.exists(storage, "folder/file.txt") is True
+
+        # экземпляр с теми же параметрами использует кэш
+        same_storage = CountingStorage(location=str(tmp_path))
+        assert listing.exists(same_storage, "folder/file.txt") is True
+        assert same_storage.listdir_calls == 0
+
+        other_storage = CountingStorage(location=str(tmp_path / "other"))
+        assert listing.exists(other_storage, "folder/file.txt") is False
+        assert other_storage.listdir_calls == 1
+
+    def test_lru_eviction(self, tmp_path):
+        storage = CountingStorage(location=str(tmp_path))
+        for dirname in ("a", "b", "c"):
+            storage.save("%s/file.txt" % dirname, ContentFile(b"1"))
+
+        listing = StorageListing(maxsize=2)
+        assert listing.exists(storage, "a/file.txt") is True
+        assert listing.exists(storage, "b/file.txt") is True
+        assert listing.exists(storage, "a/file.txt") is True
+        assert storage.listdir_calls == 2
+
+        # вытесняется каталог "b", к которому дольше не обращались
+        assert listing.exists(storage, "c/file.txt") is True
+        assert listing.exists(storage, "a/file.txt") is True
+        assert storage.listdir_calls == 3
+        assert listing.exists(storage, "b/file.txt") is True
+        assert storage.listdir_calls == 4
+
+    def test_fallback_to_exists(self):
+        storage = NoListingStorage()
+        listing = StorageListing()
+        assert listing.exists(storage, "folder/exists.txt") is True
+        assert listing.exists(storage, "folder/missing.txt") is False
+
+
+@pytest.mark.django_db
+class TestFindMissingVariations:
+    def test_manifest_entry_without_file(self, monkeypatch):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        # файл удалён в обход библиотеки, запись в манифесте осталась
+        os.remove(resource.mobile.path)
+        assert "mobile" in resource.variations_manifest
+
+        monkeypatch.setattr(
+            helpers, "_iterate_variation_models", lambda: iter([DummyVersatileImageResource])
+        )
+        listdir_calls = []
+        listdir = FileSystemStorage.listdir
+
+        def counting_listdir(self, path):
+            listdir_calls.append(path)
+            return listdir(self, path)
+
+        monkeypatch.setattr(FileSystemStorage, "listdir", counting_listdir)
+
+        found = {
+            instance.pk: names
+            for instance, names in helpers.find_missing_variations()
+        }
+        assert found == {resource.pk: ["mobile"]}
+
+        # каталог каждого файла читается один раз
+        assert len(listdir_calls) == len(set(listdir_calls))
+
+        resource.delete_file()
+        resource.delete()
@@ -0,0 +1,231 @@
+import os
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from app.models import DummyVersatileImageResource
+from paper_uploads import signals
+from paper_uploads.conf import settings
+from paper_uploads.management import parallel
+
+from .dummy import NATURE_FILEPATH
+
+
+@pytest.mark.django_db
+class TestRecutParallel:
+    def test_collect_errors(self):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        resource.delete_variations()
+
+        broken = DummyVersatileImageResource()
+        broken.attach(NATURE_FILEPATH)
+        broken.save()
+        os.remove(broken.path)
+
+        label = DummyVersatileImageResource._meta.label
+        results = parallel.recut_parallel([
+            parallel.RecutTask(label, broken.pk, names=("desktop",)),
+            parallel.RecutTask(label, resource.pk, names=("desktop",)),
+        ])
+
+        assert [result.recut for result in results] == [False, True]
+        assert results[0].error.startswith("FileNotFoundError")
+        assert results[1].error is None
+
+        resource.refresh_from_db()
+        assert os.path.exists(resource.desktop.path) is True
+        assert os.path.exists(resource.mobile.path) is False
+
+        resource.delete_file()
+        resource.delete()
+        broken.delete_file()
+        broken.delete()
+
+    @staticmethod
+    def recut_instance(task):
+        # файлы удаляются в обход кэша содержимого каталогов
+        parallel._get_listing().clear()
+        return parallel.recut_instance(task)
+
+    def test_select_missing(self):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        os.remove(resource.mobile.path)
+        resource.variations_manifest.pop("mobile")
+        resource.save_variations_manifest()
+
+        label = DummyVersatileImageResource._meta.label
+        result = self.recut_instance(
+            parallel.RecutTask(label, resource.pk, select=parallel.SELECT_MISSING)
+        )
+        assert result.recut is True
+
+        resource.refresh_from_db()
+        assert set(resource.variations_manifest) == {"desktop", "mobile", "square"}
+        assert os.path.exists(resource.mobile.path) is True
+
+        result = self.recut_instance(
+            parallel.RecutTask(label, resource.pk, select=parallel.SELECT_MISSING)
+        )
+        assert result.recut is False
+
+        # запись в манифесте есть, а файла нет
+        os.remove(resource.square.path)
+        result = self.recut_instance(
+            parallel.RecutTask(label, resource.pk, select=parallel.SELECT_MISSING)
+        )
+        assert result.recut is True
+        assert os.path.exists(resource.square.path) is True
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_select_missing_or_changed(self):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        # запись в манифесте есть, а файла нет
+        os.remove(resource.square.path)
+
+        # устаревшая вариация
+        resource.variations_manifest["mobile"]["fingerprint"] = "outdated"
+        resource.save_variations_manifest()
+
+        label = DummyVersatileImageResource._meta.label
+        task = parallel.RecutTask(label, resource.pk, select=parallel.SELECT_MISSING_OR_CHANGED)
+        recut = []
+
+        def signal_handler(sender, instance, name, **kwargs):
+            recut.append(name)
+
+        signals.variation_created.connect(signal_handler)
+        try:
+            result = self.recut_instance(task)
+        finally:
+            signals.variation_created.disconnect(signal_handler)
+        assert result.recut is True
+        assert sorted(recut) == ["mobile", "square"]
+        assert os.path.exists(resource.square.path) is True
+
+        # исходный файл отсутствует - экземпляр пропускается без ошибки
+        os.remove(resource.path)
+        os.remove(resource.desktop.path)
+        result = self.recut_instance(task)
+        assert result.recut is False
+        assert result.error is None
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_pool(self, monkeypatch, tmp_path):
+        init_log = tmp_path / "init.log"
+        init_worker = parallel._init_worker
+
+        def logging_init_worker():
+            init_worker()
+            with open(init_log, "a") as fp:
+                fp.write("{} {}\n".format(os.getpid(), settings.RECUT_WORKERS))
+
+        close_calls = []
+        close_all = parallel.connections.close_all
+
+        def counting_close_all():
+            close_calls.append(True)
+            close_all()
+
+        monkeypatch.setattr(parallel, "_init_worker", logging_init_worker)
+        monkeypatch.setattr(parallel.connections, "close_all", counting_close_all)
+
+        resources = []
+        for _ in range(3):
+            resource = DummyVersatileImageResource()
+            resource.attach(NATURE_FILEPATH)
+            resource.save()
+            resource.delete_variations()
+            resources.append(resource)
+
+        broken = DummyVersatileImageResource()
+        broken.attach(NATURE_FILEPATH)
+        broken.save()
+        os.remove(broken.path)
+
+        label = DummyVersatileImageResource._meta.label
+        consumed = []
+
+        def generate_tasks():
+            for instance in [*resources, broken]:
+                consumed.append(instance.pk)
+                yield parallel.RecutTask(label, instance.pk, names=("desktop",))
+
+        results = parallel.recut_parallel(generate_tasks(), jobs=2, batch_size=2)
+
+        assert close_calls == [True]
+        assert sorted(consumed) == sorted(instance.pk for instance in [*resources, broken])
+
+        # итоговая статистика собрана по всем порциям
+        assert len(results) == 4
+        assert sorted(result.task.pk for result in results if result.recut) == sorted(
+            resource.pk for resource in resources
+        )
+        errors = [result for result in results if result.error]
+        assert len(errors) == 1
+        assert errors[0].task.pk == broken.pk
+        assert errors[0].error.startswith("FileNotFoundError")
+
+        for resource in resources:
+            assert os.path.exists(resource.desktop.path) is True
+
+        # каждый процесс-исполнитель инициализирован и режет вариации последовательно
+        lines = init_log.read_text().splitlines()
+        assert len(lines) == 2
+        assert {line.split()[1] for line in lines} == {"1"}
+
+        for resource in resources:
+            resource.delete_file()
+            resource.delete()
+        broken.delete_file()
+        broken.delete()
+
+
+@pytest.mark.django_db
+class TestJobsOption:
+    def test_create_missing_variations(self, capsys):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+        os.remove(resource.mobile.path)
+        resource.variations_manifest.pop("mobile")
+        resource.save_variations_manifest()
+
+        call_command("create_missing_variations", jobs=2)
+
+        output = capsys.readouterr().out
+        assert "Processed" in output
+        assert "Recut" in output
+        assert os.path.exists(resource.mobile.path) is True
+
+        resource.delete_file()
+        resource.delete()
+
+    def test_create_missing_variations_changed_only(self):
+        resource = DummyVersatileImageResource()
+        resource.attach(NATURE_FILEPATH)
+        resource.save()
+
+        # запись в манифесте есть, а файла нет
+        os.remove(resource.square.path)
+
+        call_command("create_missing_variations", jobs=2, changed_only=True)
+        assert os.path.exists(resource.square.path) is True
+
+        resource.delete_file()
+        resource.delete()
+
+    @pytest.mark.parametrize("options", [{"jobs": 0}, {"jobs": 2, "async": True}])
+    def test_invalid(self, options):
+        with pytest.raises(CommandError):
+            call_command("create_missing_variations", **options)
@@ -0,0 +1,87 @@
+from decimal import Decimal
+
+import pytest
+from django.core.files import File
+from examples.fields.standard.models import Page
+
+from paper_uploads import probe, validators
+from paper_uploads.helpers import run_validators
+from paper_uploads.models import ImageItem, UploadedImage
+
+from .dummy import CALLIPHORA_FILEPATH, DOCUMENT_FILEPATH, MEDITATION_FILEPATH
+
+
+class TestFileProbe:
+    def test_image(self):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            file = File(fp, name="calliphora.jpg")
+            file_probe = probe.probe_file(file)
+            assert file_probe.mimetype == "image/jpeg"
+            assert file_probe.image_format == "JPEG"
+            assert file_probe.image_size == (804, 1198)
+            assert file_probe.size == 254766
+            assert file_probe.header[:3] == b"\xff\xd8\xff"
+
+    def test_same_object(self):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            file = File(fp, name="calliphora.jpg")
+            assert probe.probe_file(file) is probe.probe_file(file)
+
+    def test_keep_position(self):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            file = File(fp, name="calliphora.jpg")
+            file.seek(100)
+            file_probe = probe.probe_file(file)
+            assert file_probe.mimetype == "image/jpeg"
+            assert file_probe.image_size == (804, 1198)
+            assert file.tell() == 100
+
+    def test_not_an_image(self):
+        with open(DOCUMENT_FILEPATH, "rb") as fp:
+            file_probe = probe.probe_file(File(fp, name="document.pdf"))
+            with pytest.raises(OSError):
+                file_probe.image_info
+            assert file_probe.svg_size is None
+
+    def test_svg(self):
+        with open(MEDITATION_FILEPATH, "rb") as fp:
+            file_probe = probe.probe_file(File(fp, name="Meditation.svg"))
+            assert file_probe.svg_size == (Decimal("626"), Decimal("660.0532"))
+
+
+@pytest.mark.django_db
+class TestSingleParse:
+    def test_upload(self, monkeypatch):
+        calls = {"magic": 0, "image": 0}
+        from_buffer = probe.magic.from_buffer
+        image_open = probe.Image.open
+
+        def counting_from_buffer(*args, **kwargs):
+            calls["magic"] += 1
+            return from_buffer(*args, **kwargs)
+
+        def counting_open(*args, **kwargs):
+            calls["image"] += 1
+            return image_open(*args, **kwargs)
+
+        monkeypatch.setattr(probe.magic, "from_buffer", counting_from_buffer)
+        monkeypatch.setattr(probe.Image, "open", counting_open)
+
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            file = File(fp, name="calliphora.jpg")
+            assert ImageItem.accept(file) is True
+
+            resource = UploadedImage()
+            resource.set_owner_field(Page, "image_group")
+            resource.attach(file)
+            try:
+                run_validators(file, [
+                    validators.MimeTypeValidator(allowed=["image/*"]),
+                    validators.ImageMinSizeValidator(800, 800),
+                    validators.ImageMaxSizeValidator(1000, 1200),
+                ])
+            finally:
+                resource.delete_file()
+
+        assert resource.mimetype == "image/jpeg"
+        assert calls == {"magic": 1, "image": 1}
@@ -0,0 +1,179 @@
+import pytest
+from PIL import Image, ImageChops
+from variations import processors
+
+from paper_uploads import helpers, processing
+from paper_uploads.variations import PaperVariation
+
+from .dummy import NATURE_FILEPATH
+
+
+class TestGroupByGeometry:
+    def test_webp_versions(self):
+        variations = helpers.build_variations({
+            "desktop": {
+                "size": (800, 600),
+                "versions": {"webp", "2x", "3x"}
+            },
+            "mobile": {
+                "size": (400, 300),
+            }
+        })
+        groups = processing.group_by_geometry(variations.items())
+        assert [[name for name, _ in group] for group in groups] == [
+            ["desktop", "desktop_webp"],
+            ["desktop_2x", "desktop_webp_2x"],
+            ["desktop_3x", "desktop_webp_3x"],
+            ["mobile"],
+        ]
+
+    def test_different_anchor(self):
+        variations = [
+            ("center", PaperVariation(size=(800, 600))),
+            ("top", PaperVariation(size=(800, 600), anchor=(0.5, 0))),
+        ]
+        groups = processing.group_by_geometry(variations)
+        assert len(groups) == 2
+
+    def test_shared_postprocessors(self):
+        postprocessors = [processors.Adjust(sharpness=1.2)]
+        variations = [
+            ("jpeg", PaperVariation(size=(800, 600), postprocessors=postprocessors)),
+            ("webp", PaperVariation(size=(800, 600), postprocessors=postprocessors, format="webp")),
+            ("plain", PaperVariation(size=(800, 600))),
+        ]
+        groups = processing.group_by_geometry(variations)
+        assert [[name for name, _ in group] for group in groups] == [
+            ["jpeg", "webp"],
+            ["plain"],
+        ]
+
+
+class TestGetResizeSize:
+    def test_fill(self):
+        variation = PaperVariation(size=(800, 800), clip=True, upscale=False)
+        assert processing.get_resize_size(variation, (6000, 4000)) == (1200, 800)
+
+    def test_fit(self):
+        variation = PaperVariation(size=(800, 0), clip=False, upscale=False)
+        assert processing.get_resize_size(variation, (6000, 4000)) == (800, 533)
+
+    def test_no_downscale(self):
+        variation = PaperVariation(size=(8000, 0), clip=False, upscale=True)
+        assert processing.get_resize_size(variation, (6000, 4000)) is None
+
+    def test_preprocessors(self):
+        variation = PaperVariation(
+            size=(800, 600),
+            preprocessors=[processors.Crop(width=100, height=100)]
+        )
+        assert processing.get_resize_size(variation, (6000, 4000)) is None
+
+
+class TestPlanCascade:
+    def test_chain(self):
+        variations = [
+            ("small", PaperVariation(size=(300, 200))),
+            ("large", PaperVariation(size=(1200, 800))),
+            ("medium", PaperVariation(size=(600, 400))),
+        ]
+        steps, sizes = processing.plan_cascade(variations, (6000, 4000))
+        assert steps == [
+            processing.CascadeStep((1200, 800), None),
+            processing.CascadeStep((600, 400), (1200, 800)),
+            processing.CascadeStep((300, 200), (600, 400)),
+        ]
+        assert sizes == {
+            "small": (300, 200),
+            "large": (1200, 800),
+            "medium": (600, 400),
+        }
+
+    def test_shared_size(self):
+        variations = [
+            ("jpeg", PaperVariation(size=(600, 400))),
+            ("webp", PaperVariation(size=(600, 400), format="webp")),
+        ]
+        steps, sizes = processing.plan_cascade(variations, (6000, 4000))
+        assert steps == [processing.CascadeStep((600, 400), None)]
+        assert sizes["jpeg"] == sizes["webp"] == (600, 400)
+
+    def test_never_upscale_intermediate(self):
+        # высокая узкая вариация не может строиться из широкой низкой
+        variations = [
+            ("wide", PaperVariation(size=(1200, 200), clip=True)),
+            ("tall", PaperVariation(size=(200, 1000), clip=True)),
+        ]
+        steps, sizes = processing.plan_cascade(variations, (6000, 4000))
+        assert sizes == {
+            "wide": (1200, 800),
+            "tall": (1500, 1000),
+        }
+        assert steps == [
+            processing.CascadeStep((1500, 1000), None),
+            processing.CascadeStep((1200, 800), (1500, 1000)),
+        ]
+
+    def test_skip_source_sized(self):
+        variations = [
+            ("big", PaperVariation(size=(6000, 0))),
+        ]
+        steps, sizes = processing.plan_cascade(variations, (6000, 4000))
+        assert steps == []
+        assert sizes == {"big": None}
+
+
+class TestGetReduceFactor:
+    def test_within_budget(self):
+        variations = [("small", PaperVariation(size=(300, 200)))]
+        assert processing.get_reduce_factor(variations, (6000, 4000), 24_000_000) == 1
+
+    def test_budget(self):
+        variations = [("small", PaperVariation(size=(300, 200)))]
+        assert processing.get_reduce_factor(variations, (6000, 4000), 6_000_000) == 2
+        assert processing.get_reduce_factor(variations, (6000, 4000), 1_000_000) == 5
+
+    def test_limited_by_largest_variation(self):
+        variations = [
+            ("small", PaperVariation(size=(300, 200))),
+            ("large", PaperVariation(size=(2000, 0), clip=False)),
+        ]
+        assert processing.get_reduce_factor(variations, (6000, 4000), 1_000_000) == 3
+
+    def test_full_size_required(self):
+        variations = [
+            ("small", PaperVariation(size=(300, 200))),
+            ("retina", PaperVariation(size=(8000, 0), clip=False, upscale=True)),
+        ]
+        assert processing.get_reduce_factor(variations, (6000, 4000), 1_000_000) == 1
+
+
+class TestBuildIntermediates:
+    @pytest.mark.parametrize("variation", [
+        PaperVariation(size=(640, 0), clip=False),
+        PaperVariation(size=(320, 320), clip=True),
+        PaperVariation(size=(320, 400), clip=False, upscale=True),
+        PaperVariation(size=(160, 0), clip=False, max_height=100),
+    ])
+    def test_output_matches_direct(self, variation):
+        img = Image.open(NATURE_FILEPATH)
+        img.load()
+
+        variations = [
+            ("large", PaperVariation(size=(960, 0), clip=False)),
+            ("target", variation),
+        ]
+        steps, sizes = processing.plan_cascade(variations, img.size)
+        intermediates = processing.build_intermediates(img, steps)
+        base = intermediates[sizes["target"]]
+
+        direct = variation.process(img)
+        cascaded = variation.get_processor(img.size).process(base)
+        assert cascaded.size == direct.size
+        assert cascaded.mode == direct.mode
+
+        # пиксели могут отличаться из-за повторной интерполяции
+        diff = ImageChops.difference(cascaded.convert("RGB"), direct.convert("RGB"))
+        histogram = diff.convert("L").histogram()
+        mean_error = sum(i * count for i, count in enumerate(histogram)) / sum(histogram)
+        assert mean_error < 4
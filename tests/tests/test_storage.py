@@ -0,0 +1,143 @@
+import errno
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from paper_uploads import storage
+from paper_uploads.files import TemporaryUploadedFile
+
+from .dummy import NATURE_FILEPATH
+
+
+def cross_device_link(src, dst):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+class TestMoveFile:
+    def setup_method(self):
+        with open(NATURE_FILEPATH, "rb") as fp:
+            self.content = fp.read()
+
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, "source")
+        self.target = os.path.join(self.tempdir, "target")
+        shutil.copyfile(NATURE_FILEPATH, self.source)
+
+    def teardown_method(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def read_target(self):
+        with open(self.target, "rb") as fp:
+            return fp.read()
+
+    def test_same_filesystem(self):
+        inode = os.stat(self.source).st_ino
+        storage.move_file(self.source, self.target)
+
+        assert not os.path.exists(self.source)
+        assert os.stat(self.target).st_ino == inode
+        assert self.read_target() == self.content
+
+    def test_target_exists(self):
+        with open(self.target, "wb") as fp:
+            fp.write(b"existing")
+
+        with pytest.raises(FileExistsError):
+            storage.move_file(self.source, self.target)
+
+        assert os.path.exists(self.source)
+        assert self.read_target() == b"existing"
+
+    def test_no_hard_links(self, monkeypatch):
+        def link(src, dst):
+            raise PermissionError(errno.EPERM, "Operation not permitted")
+
+        monkeypatch.setattr(os, "link", link)
+        storage.move_file(self.source, self.target)
+
+        assert not os.path.exists(self.source)
+        assert self.read_target() == self.content
+
+    @pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range() is not available")
+    def test_copy_file_range(self, monkeypatch):
+        calls = []
+        copy_file_range = os.copy_file_range
+
+        def counting_copy_file_range(*args):
+            calls.append(args)
+            return copy_file_range(*args)
+
+        monkeypatch.setattr(os, "link", cross_device_link)
+        monkeypatch.setattr(os, "copy_file_range", counting_copy_file_range)
+        storage.move_file(self.source, self.target)
+
+        assert calls
+        assert not os.path.exists(self.source)
+        assert self.read_target() == self.content
+
+    @pytest.mark.skipif(not hasattr(os, "sendfile"), reason="sendfile() is not available")
+    def test_sendfile(self, monkeypatch):
+        def copy_file_range(*args):
+            raise OSError(errno.ENOSYS, "Function not implemented")
+
+        monkeypatch.setattr(os, "link", cross_device_link)
+        monkeypatch.setattr(os, "copy_file_range", copy_file_range, raising=False)
+        storage.move_file(self.source, self.target)
+
+        assert not os.path.exists(self.source)
+        assert self.read_target() == self.content
+
+    def test_stream_copy(self, monkeypatch):
+        def unsupported(*args):
+            raise OSError(errno.EINVAL, "Invalid argument")
+
+        monkeypatch.setattr(os, "link", cross_device_link)
+        monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+        monkeypatch.setattr(os, "sendfile", unsupported, raising=False)
+        storage.move_file(self.source, self.target)
+
+        assert not os.path.exists(self.source)
+        assert self.read_target() == self.content
+
+
+class TestFileSystemStorage:
+    def test_move_temporary_file(self):
+        with tempfile.TemporaryDirectory() as location:
+            source = os.path.join(location, "upload")
+            shutil.copyfile(NATURE_FILEPATH, source)
+            inode = os.stat(source).st_ino
+
+            fs = storage.FileSystemStorage(location=location)
+            file = TemporaryUploadedFile(open(source, "rb"), name="Nature.jpeg")
+            try:
+                first = fs.save("images/Nature.jpeg", file)
+            finally:
+                file.close()
+
+            assert first == "images/Nature.jpeg"
+            assert not os.path.exists(source)
+            assert os.stat(fs.path(first)).st_ino == inode
+
+            # при совпадении имён файлу назначается другое имя
+            shutil.copyfile(NATURE_FILEPATH, source)
+            file = TemporaryUploadedFile(open(source, "rb"), name="Nature.jpeg")
+            try:
+                second = fs.save("images/Nature.jpeg", file)
+            finally:
+                file.close()
+
+            assert second != first
+            assert not os.path.exists(source)
+            assert os.path.exists(fs.path(first))
+            assert os.path.exists(fs.path(second))
+
+    def test_stream_regular_file(self):
+        with tempfile.TemporaryDirectory() as location:
+            fs = storage.FileSystemStorage(location=location)
+            with open(NATURE_FILEPATH, "rb") as fp:
+                name = fs.save("images/Nature.jpeg", fp)
+
+            assert os.path.exists(NATURE_FILEPATH)
+            assert os.stat(fs.path(name)).st_ino != os.stat(NATURE_FILEPATH).st_ino
@@ -0,0 +1,185 @@
+import threading
+
+import pytest
+
+from paper_uploads import tasks
+from paper_uploads.conf import settings
+
+
+@pytest.fixture
+def task_settings():
+    old_settings = settings.TASK_BACKEND, settings.TASK_BACKEND_OPTIONS, settings.RQ_ENABLED
+    yield settings
+    settings.TASK_BACKEND, settings.TASK_BACKEND_OPTIONS, settings.RQ_ENABLED = old_settings
+
+
+class TestGetTaskBackend:
+    def test_default(self, task_settings):
+        task_settings.TASK_BACKEND = None
+        task_settings.RQ_ENABLED = False
+        assert type(tasks.get_task_backend()) is tasks.SyncBackend
+
+    def test_rq_enabled(self, task_settings):
+        task_settings.TASK_BACKEND = None
+        task_settings.RQ_ENABLED = True
+        assert type(tasks.get_task_backend()) is tasks.RQBackend
+
+    def test_explicit(self, task_settings):
+        task_settings.TASK_BACKEND = tasks.ThreadBackend
+        task_settings.TASK_BACKEND_OPTIONS = {"max_workers": 2}
+        backend = tasks.get_task_backend()
+        assert type(backend) is tasks.ThreadBackend
+        assert backend.executor._max_workers == 2
+        assert tasks.get_task_backend() is backend
+
+
+@pytest.mark.django_db
+class TestBackends:
+    def test_sync(self, django_capture_on_commit_callbacks):
+        calls = []
+
+        def task(value):
+            calls.append(value)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            tasks.SyncBackend().enqueue(task, kwargs={"value": 1})
+            assert calls == [1]
+        assert callbacks == []
+
+    def test_thread(self, django_capture_on_commit_callbacks):
+        done = threading.Event()
+        threads = []
+
+        def task(value):
+            threads.append((threading.current_thread(), value))
+            done.set()
+
+        backend = tasks.ThreadBackend()
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            backend.enqueue(task, kwargs={"value": 42})
+            assert threads == []
+
+        assert len(callbacks) == 1
+        assert done.wait(5)
+        assert threads[0][0] is not threading.current_thread()
+        assert threads[0][1] == 42
+        backend.executor.shutdown()
+
+    def test_thread_error(self, django_capture_on_commit_callbacks):
+        done = threading.Event()
+
+        def task():
+            done.set()
+            raise ValueError
+
+        backend = tasks.ThreadBackend()
+        with django_capture_on_commit_callbacks(execute=True):
+            backend.enqueue(task, kwargs={})
+
+        assert done.wait(5)
+        backend.executor.shutdown()
+
+    def test_rq(self, rq_queues, django_capture_on_commit_callbacks):
+        backend = tasks.RQBackend(queue_name="images")
+        with django_capture_on_commit_callbacks(execute=True):
+            backend.enqueue(print, kwargs={"sep": ""})
+            assert rq_queues == {}
+
+        jobs = rq_queues["images"].get_jobs()
+        assert len(jobs) == 1
+        assert jobs[0].func is print
+        assert jobs[0].kwargs == {"sep": ""}
+
+    def test_rq_merge_pending(self, rq_queues):
+        def merge(pending, kwargs):
+            return {"names": pending["names"] + kwargs["names"]}
+
+        backend = tasks.RQBackend()
+        backend.defer_until_commit = False
+        backend.enqueue(print, kwargs={"names": ["a"]}, key="key", merge=merge)
+        backend.enqueue(print, kwargs={"names": ["b"]}, key="key", merge=merge)
+
+        queue = rq_queues[settings.RQ_QUEUE_NAME]
+        jobs = queue.get_jobs()
+        assert len(jobs) == 1
+        assert jobs[0].kwargs == {"names": ["a", "b"]}
+
+        # заменённая задача удалена из Redis
+        assert len(queue.connection.keys("rq:job:*")) == 1
+
+    def test_rq_dequeued(self, rq_queues):
+        def merge(pending, kwargs):
+            return {"names": pending["names"] + kwargs["names"]}
+
+        backend = tasks.RQBackend()
+        backend.defer_until_commit = False
+        backend.enqueue(print, kwargs={"names": ["a"]}, key="key", merge=merge)
+
+        # воркер забрал задачу из очереди, но ещё не пометил её как выполняемую
+        queue = rq_queues[settings.RQ_QUEUE_NAME]
+        started_id = queue.pop_job_id()
+
+        backend.enqueue(print, kwargs={"names": ["b"]}, key="key", merge=merge)
+
+        # выполняемая задача не изменилась
+        assert queue.fetch_job(started_id).kwargs == {"names": ["a"]}
+
+        # новая задача получила собственный ID
+        jobs = queue.get_jobs()
+        assert len(jobs) == 1
+        assert jobs[0].id != started_id
+        assert jobs[0].kwargs == {"names": ["b"]}
+
+        # завершение предыдущей задачи не затрагивает новую
+        started_job = queue.fetch_job(started_id)
+        started_job.cleanup(ttl=0)
+        assert queue.fetch_job(jobs[0].id).kwargs == {"names": ["b"]}
+
+    def test_thread_coalesce(self):
+        calls = []
+        release = threading.Event()
+
+        def task(names):
+            release.wait(5)
+            calls.append(names)
+
+        def merge(pending, kwargs):
+            return {"names": pending["names"] + kwargs["names"]}
+
+        backend = tasks.ThreadBackend()
+        backend.defer_until_commit = False
+
+        # первая задача занимает поток, остальные ожидают и объединяются
+        backend.enqueue(task, kwargs={"names": ["a"]})
+        backend.enqueue(task, kwargs={"names": ["b"]}, key="key", merge=merge)
+        backend.enqueue(task, kwargs={"names": ["c"]}, key="key", merge=merge)
+        release.set()
+
+        backend.executor.shutdown()
+        assert calls == [["a"], ["b", "c"]]
+
+    def test_thread_low_priority(self):
+        threads = []
+
+        def task():
+            threads.append(threading.current_thread().name)
+
+        backend = tasks.ThreadBackend()
+        backend.defer_until_commit = False
+        backend.enqueue(task, kwargs={}, priority="low")
+        backend.enqueue(task, kwargs={})
+        backend.low_priority_executor.shutdown()
+        backend.executor.shutdown()
+
+        assert sorted(name.rsplit("_", 1)[0] for name in threads) == [
+            "paper_uploads",
+            "paper_uploads_low",
+        ]
+
+    def test_rq_low_priority(self, rq_queues):
+        backend = tasks.RQBackend(queue_name="images", low_priority_queue_name="backfill")
+        backend.defer_until_commit = False
+        backend.enqueue(print, kwargs={}, priority="low")
+        backend.enqueue(print, kwargs={})
+        assert rq_queues["backfill"].count == 1
+        assert rq_queues["images"].count == 1
@@ -51,6 +51,16 @@ def test_cached_method():
     assert obj.calls == 2
 
 
+def test_inline_executor():
+    executor = utils.InlineExecutor()
+    future = executor.submit(lambda x, y: x * y, 6, y=7)
+    assert future.done() is True
+    assert future.result() == 42
+
+    future = executor.submit(lambda: 1 / 0)
+    assert isinstance(future.exception(), ZeroDivisionError)
+
+
 def test_checksum():
     with open(NATURE_FILEPATH, "rb") as fp:
         assert utils.checksum(fp) == "e3a7f0318daaa395af0b84c1bca249cbfd46b9994b0aceb07f74332de4b061e1"
@@ -62,6 +72,23 @@ def test_checksum_on_closed_file():
     fp.close()
 
 
+def test_content_hash(monkeypatch):
+    monkeypatch.setattr(utils.ContentHash, "block_size", 1000)
+    with open(NATURE_FILEPATH, "rb") as fp:
+        content = fp.read()
+        expected = utils.checksum(fp)
+
+    # хэши завершённых блоков позволяют продолжить расчёт
+    content_hash = utils.ContentHash()
+    content_hash.update(content[:2500])
+    assert content_hash.offset == 2000
+
+    content_hash = utils.ContentHash(content_hash.blocks)
+    for start in range(2000, len(content), 2345):
+        content_hash.update(content[start:start + 2345])
+    assert content_hash.hexdigest() == expected
+
+
 def test_remove_dulpicates():
     assert utils.remove_dulpicates(
         ["apple", "banana", "apple", "apple", "banana", "orange", "banana"]
@@ -1,5 +1,7 @@
 import pytest
+from variations import processors
 
+from paper_uploads import helpers
 from paper_uploads.variations import PaperVariation
 
 
@@ -25,3 +27,86 @@ class TestOutputFileName:
     def test_forced_format(self):
         variation = PaperVariation(name="desktop", format="webp")
         assert variation.get_output_filename("source.Jpeg") == "source.desktop.webp"
+
+
+class TestPriority:
+    def test_default_value(self):
+        assert PaperVariation().priority == "normal"
+
+    def test_invalid_value(self):
+        with pytest.raises(ValueError):
+            PaperVariation(priority="urgent")
+
+    def test_fingerprint_ignored(self):
+        assert (
+            PaperVariation(size=(800, 600), priority="low").fingerprint
+            == PaperVariation(size=(800, 600)).fingerprint
+        )
+
+    def test_versions(self):
+        variations = helpers.build_variations({
+            "desktop": {
+                "size": (800, 600),
+                "versions": {"webp", "2x", "3x"},
+            },
+            "preview": {
+                "size": (200, 150),
+                "versions": {"webp", "4x"},
+                "priority": "high",
+            },
+        })
+        assert {name: variation.priority for name, variation in variations.items()} == {
+            "desktop": "normal",
+            "desktop_webp": "low",
+            "desktop_2x": "normal",
+            "desktop_webp_2x": "low",
+            "desktop_3x": "low",
+            "desktop_webp_3x": "low",
+            "preview": "high",
+            "preview_webp": "high",
+            "preview_4x": "high",
+            "preview_webp_4x": "high",
+        }
+
+
+class TestFingerprint:
+    def test_stable(self):
+        assert PaperVariation(size=(800, 600)).fingerprint == PaperVariation(size=(800, 600)).fingerprint
+
+    def test_name_ignored(self):
+        assert (
+            PaperVariation(name="desktop", size=(800, 600)).fingerprint
+            == PaperVariation(name="mobile", size=(800, 600)).fingerprint
+        )
+
+    @pytest.mark.parametrize("options", [
+        dict(size=(800, 601)),
+        dict(size=(800, 600), clip=False),
+        dict(size=(800, 600), format="webp"),
+        dict(size=(800, 600), extra_context={"jpeg": {"quality": 50}}),
+        dict(size=(800, 600), postprocessors=[processors.Adjust(sharpness=1.2)]),
+    ])
+    def test_changed(self, options):
+        assert PaperVariation(size=(800, 600)).fingerprint != PaperVariation(**options).fingerprint
+
+    def test_processor_objects(self):
+        class Watermark:
+            def __init__(self):
+                self.adjust = processors.Adjust(contrast=1.1)
+
+            def process(self, img):
+                return self.adjust.process(img)
+
+        first = PaperVariation(size=(800, 600), postprocessors=[Watermark()])
+        second = PaperVariation(size=(800, 600), postprocessors=[Watermark()])
+        assert first.fingerprint == second.fingerprint
+
+    def test_set_order(self):
+        first = PaperVariation(size=(800, 600), extra_context={"versions": {"webp", "2x", "3x"}})
+        second = PaperVariation(size=(800, 600), extra_context={"versions": {"3x", "2x", "webp"}})
+        assert first.fingerprint == second.fingerprint
+
+    def test_unsupported_value(self):
+        variation = PaperVariation(size=(800, 600), extra_context={"jpeg": {"qtables": object()}})
+        with pytest.raises(TypeError):
+            variation.fingerprint  # noqa
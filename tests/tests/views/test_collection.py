@@ -1,12 +1,13 @@
 import json
 import os
+import uuid
 
 import pytest
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.base import ContentFile
-from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
 from django.http import JsonResponse
 from django.test import RequestFactory
 from examples.collections.custom_models.dialogs import ChangeUploadedCustomImageDialog
@@ -263,6 +264,35 @@ class TestUploadFileView:
 
         collection.delete()
 
+    def test_unsupported_first_chunk(self, storage):
+        collection = ImagesOnlyCollection(
+            pk=9563
+        )
+        collection.set_owner_field(Page, "image_collection")
+        collection.save()
+
+        with open(AUDIO_FILEPATH, "rb") as fp:
+            content = fp.read(100000)
+
+        request = RequestFactory().post("/", data={
+            "paperCollectionContentType": ContentType.objects.get_for_model(ImagesOnlyCollection, for_concrete_model=False).pk,
+            "collectionId": "9563",
+            "paperUUID": str(uuid.uuid4()),
+            "paperChunkIndex": 0,
+            "paperTotalChunkCount": 5,
+            "file": SimpleUploadedFile(os.path.basename(AUDIO_FILEPATH), content),
+        })
+        request.user = storage.user
+        request.session = {}
+        response = UploadFileView.as_view()(request)
+
+        # файл отклоняется по первой части
+        response_data = json.loads(response.content)
+        assert response_data["preventRetry"] is True
+        assert "Unsupported file" in response_data["errors"][0]
+
+        collection.delete()
+
     def test_success(self, storage):
         collection = FilesOnlyCollection(
             pk=9563
@@ -1,18 +1,37 @@
 import json
+import os
+import uuid
 
 import pytest
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models.fields.files import FieldFile
 from django.http import JsonResponse
 from django.test import RequestFactory
 from examples.fields.proxy_models.models import Page, UploadedFileProxy
 
-from paper_uploads.exceptions import InvalidContentType, InvalidObjectId
+from paper_uploads.conf import settings as paper_settings
+from paper_uploads.exceptions import (
+    ContinueUpload,
+    InvalidChunking,
+    InvalidContentType,
+    InvalidObjectId,
+    UncompleteUpload,
+)
 from paper_uploads.forms.dialogs.file import ChangeUploadedFileDialog
+from paper_uploads.models import UploadedFile
+from paper_uploads.probe import probe_file
+from paper_uploads.utils import ContentHash, checksum
+from paper_uploads.validators import MaxSizeValidator
+from paper_uploads.views import helpers
+from paper_uploads.views.base import UploadStatusView, get_upload_tempdir
 from paper_uploads.views.file import ChangeFileView, DeleteFileView, UploadFileView
 
+from ..dummy import CALLIPHORA_FILEPATH
+
 
 class TestUploadFileView:
     @staticmethod
@@ -62,7 +81,7 @@ class TestUploadFileView:
         with pytest.raises(InvalidContentType):
             storage.view.get_instance()
 
-    def test_validation_errors(self, storage):
+    def test_validation_errors(self, storage, monkeypatch):
         request = RequestFactory().post("/", data={
             "paperContentType": storage.content_type.pk,
             "paperOwnerAppLabel": "validators_fields",
@@ -72,6 +91,13 @@ class TestUploadFileView:
         request.user = storage.user
         storage.view.setup(request)
 
+        # файл, не прошедший проверку, не должен попадать в хранилище
+        def save(*args, **kwargs):
+            raise AssertionError("file must not be saved")
+
+        monkeypatch.setattr(FieldFile, "save", save)
+        monkeypatch.setattr(FieldFile, "delete", save)
+
         with pytest.raises(ValidationError, match="has an invalid extension"):
             storage.view.handle(ContentFile(b'', name="dummy.exe"))
 
@@ -256,3 +282,336 @@ class TestChangeFileView:
 
         with pytest.raises(ObjectDoesNotExist):
             storage.view.get_instance()
+
+
+class TestUploadChunks:
+    @staticmethod
+    def init_class(storage):
+        storage.user = User.objects.get(username="jon")
+        storage.view = UploadFileView()
+        yield
+
+    def test_streaming_checksum(self, storage, monkeypatch):
+        # блоки меньше частей файла, чтобы части пересекали границы блоков
+        monkeypatch.setattr(ContentHash, "block_size", 5000)
+
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            content = fp.read()
+            expected = checksum(fp)
+
+        session = {}
+        chunk_size = 7000
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        uid = str(uuid.uuid4())
+
+        for index, chunk in enumerate(chunks):
+            request = RequestFactory().post("/", data={
+                "paperUUID": uid,
+                "paperChunkIndex": index,
+                "paperTotalChunkCount": len(chunks),
+                "file": SimpleUploadedFile("calliphora.jpg", chunk),
+            })
+            request.user = storage.user
+            request.session = session
+            storage.view.setup(request)
+
+            if index < len(chunks) - 1:
+                with pytest.raises(ContinueUpload):
+                    storage.view.upload_chunk(request)
+            else:
+                file = storage.view.upload_chunk(request)
+
+        try:
+            assert file.size == len(content)
+            assert probe_file(file).checksum == expected
+            assert not os.path.exists(file.file.name + ".checksum")
+        finally:
+            file.close()
+
+    def test_out_of_order(self, storage):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            content = fp.read()
+            expected = checksum(fp)
+
+        session = {}
+        chunk_size = 100000
+        chunks = list(enumerate(
+            content[i:i + chunk_size] for i in range(0, len(content), chunk_size)
+        ))
+        chunks.reverse()
+        uid = str(uuid.uuid4())
+
+        for position, (index, chunk) in enumerate(chunks):
+            request = RequestFactory().post("/", data={
+                "paperUUID": uid,
+                "paperChunkIndex": index,
+                "paperTotalChunkCount": len(chunks),
+                "paperChunkSize": chunk_size,
+                "paperTotalFileSize": len(content),
+                "file": SimpleUploadedFile("calliphora.jpg", chunk),
+            })
+            request.user = storage.user
+            request.session = session
+            storage.view.setup(request)
+
+            if position < len(chunks) - 1:
+                with pytest.raises(ContinueUpload):
+                    storage.view.upload_chunk(request)
+            else:
+                file = storage.view.upload_chunk(request)
+
+        try:
+            assert file.read() == content
+            assert probe_file(file).checksum == expected
+        finally:
+            file.close()
+
+    def test_resume(self, storage):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            content = fp.read()
+
+        session = {}
+        chunk_size = 100000
+        uid = str(uuid.uuid4())
+
+        def send_chunk(index, data=None):
+            post = {
+                "paperUUID": uid,
+                "paperChunkIndex": index,
+                "paperTotalChunkCount": 3,
+                "paperChunkSize": chunk_size,
+                "paperTotalFileSize": len(content),
+            }
+            if data is not None:
+                post["file"] = SimpleUploadedFile("calliphora.jpg", data)
+            request = RequestFactory().post("/", data=post)
+            request.user = storage.user
+            request.session = session
+            storage.view.setup(request)
+            return storage.view.upload_chunk(request)
+
+        def get_status():
+            request = RequestFactory().get("/", data={"paperUUID": uid})
+            request.user = storage.user
+            request.session = session
+            response = UploadStatusView.as_view()(request)
+            return json.loads(response.content)
+
+        with pytest.raises(ContinueUpload):
+            send_chunk(0, content[:chunk_size])
+
+        # обрыв соединения не удаляет полученные части
+        with pytest.raises(UncompleteUpload):
+            send_chunk(1)
+
+        assert get_status() == {
+            "uuid": uid,
+            "ranges": [[0, chunk_size]],
+        }
+
+        with pytest.raises(ContinueUpload):
+            send_chunk(2, content[2 * chunk_size:])
+        assert get_status()["ranges"] == [[0, chunk_size], [2 * chunk_size, len(content)]]
+
+        file = send_chunk(1, content[chunk_size:2 * chunk_size])
+        try:
+            assert file.read() == content
+        finally:
+            file.close()
+
+    def test_validate_first_chunk(self, storage):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            content = fp.read()
+
+        chunk_size = 100000
+        uid = str(uuid.uuid4())
+
+        def send_first_chunk(fieldname, name):
+            request = RequestFactory().post("/", data={
+                "paperContentType": ContentType.objects.get_for_model(UploadedFile).pk,
+                "paperOwnerAppLabel": "validators_fields",
+                "paperOwnerModelName": "page",
+                "paperOwnerFieldName": fieldname,
+                "paperUUID": uid,
+                "paperChunkIndex": 0,
+                "paperTotalChunkCount": 3,
+                "paperChunkSize": chunk_size,
+                "paperTotalFileSize": len(content),
+                "file": SimpleUploadedFile(name, content[:chunk_size]),
+            })
+            request.user = storage.user
+            request.session = {}
+            response = UploadFileView.as_view()(request)
+            return request, json.loads(response.content)
+
+        # размер всего файла превышает лимит
+        request, response = send_first_chunk("filter_size", "calliphora.jpg")
+        assert response["preventRetry"] is True
+        assert "is too large" in response["errors"][0]
+
+        # полученная часть удаляется
+        tempdir = get_upload_tempdir(request, create=False)
+        assert not os.path.exists(os.path.join(tempdir, uid))
+
+        # MIME-тип определяется по началу файла
+        request, response = send_first_chunk("filter_mime", "calliphora.gif")
+        assert response["preventRetry"] is True
+        assert "invalid mimetype 'image/jpeg'" in response["errors"][0]
+
+        request, response = send_first_chunk("filter_ext", "calliphora.pdf")
+        assert response == {}
+
+        tempdir = get_upload_tempdir(request, create=False)
+        assert os.path.exists(os.path.join(tempdir, uid))
+
+    def test_first_chunk_validators(self):
+        def content_validator(file):
+            raise ValidationError("content")
+
+        file = SimpleUploadedFile("calliphora.jpg", b"x" * 100)
+
+        # валидатор, которому нужно всё содержимое, не запускается
+        helpers.run_first_chunk_validators(file, [content_validator])
+
+        with pytest.raises(ValidationError, match="is too large"):
+            helpers.run_first_chunk_validators(file, [content_validator, MaxSizeValidator(10)])
+
+    def test_restart_appended_upload(self, storage):
+        session = {}
+        uid = str(uuid.uuid4())
+
+        def send_chunk(index, data=None):
+            post = {
+                "paperUUID": uid,
+                "paperChunkIndex": index,
+                "paperTotalChunkCount": 3,
+            }
+            if data is not None:
+                post["file"] = SimpleUploadedFile("data.txt", data)
+            request = RequestFactory().post("/", data=post)
+            request.user = storage.user
+            request.session = session
+            storage.view.setup(request)
+            return storage.view.upload_chunk(request)
+
+        with pytest.raises(ContinueUpload):
+            send_chunk(0, b"AAA")
+        with pytest.raises(ContinueUpload):
+            send_chunk(1, b"BBB")
+        with pytest.raises(UncompleteUpload):
+            send_chunk(2)
+
+        # отменённая загрузка без смещения не сохраняется
+        tempdir = session["paper_uploads_tempdir"]
+        assert not os.path.exists(os.path.join(tempdir, uid))
+
+        # части без смещения дописываются в конец файла,
+        # поэтому загрузка начинается заново
+        with pytest.raises(ContinueUpload):
+            send_chunk(0, b"AAA")
+        with pytest.raises(ContinueUpload):
+            send_chunk(1, b"BBB")
+
+        file = send_chunk(2, b"CCC")
+        try:
+            assert file.read() == b"AAABBBCCC"
+        finally:
+            file.close()
+
+    @pytest.mark.parametrize("post", [
+        dict(paperTotalFileSize=-1),
+        dict(paperTotalFileSize=2 ** 63),
+        dict(paperChunkOffset=-1),
+        dict(paperChunkOffset=2 ** 63),
+        dict(paperChunkIndex=3),
+        dict(paperTotalChunkCount=0),
+        # часть выходит за пределы файла
+        dict(paperChunkOffset=1024),
+        dict(paperChunkIndex=1, paperChunkSize=1024),
+    ])
+    def test_invalid_chunking(self, storage, post):
+        uid = str(uuid.uuid4())
+        request = RequestFactory().post("/", data=dict({
+            "paperUUID": uid,
+            "paperChunkIndex": 0,
+            "paperTotalChunkCount": 2,
+            "paperTotalFileSize": 1536,
+            "file": SimpleUploadedFile("data.txt", b"a" * 1024),
+        }, **post))
+        request.user = storage.user
+        request.session = {}
+        storage.view.setup(request)
+
+        with pytest.raises(InvalidChunking):
+            storage.view.upload_chunk(request)
+
+        tempdir = get_upload_tempdir(request, create=False)
+        assert tempdir is None or not os.path.exists(os.path.join(tempdir, uid))
+
+    def test_append_past_total_size(self, storage):
+        session = {}
+        uid = str(uuid.uuid4())
+
+        def send_chunk(index):
+            request = RequestFactory().post("/", data={
+                "paperUUID": uid,
+                "paperChunkIndex": index,
+                "paperTotalChunkCount": 2,
+                "paperTotalFileSize": 1536,
+                "file": SimpleUploadedFile("data.txt", b"a" * 1024),
+            })
+            request.user = storage.user
+            request.session = session
+            storage.view.setup(request)
+            return storage.view.upload_chunk(request)
+
+        with pytest.raises(ContinueUpload):
+            send_chunk(0)
+        with pytest.raises(InvalidChunking):
+            send_chunk(1)
+
+    def test_max_upload_size(self, storage, monkeypatch):
+        # у поля нет ограничения размера
+        monkeypatch.setattr(paper_settings, "UPLOAD_MAX_SIZE", 2048, raising=False)
+        request = RequestFactory().post("/", data={
+            "paperUUID": str(uuid.uuid4()),
+            "paperChunkIndex": 0,
+            "paperTotalChunkCount": 3,
+            "paperChunkSize": 1024,
+            "paperTotalFileSize": 3072,
+            "file": SimpleUploadedFile("data.txt", b"a" * 1024),
+        })
+        request.user = storage.user
+        request.session = {}
+        storage.view.setup(request)
+
+        with pytest.raises(ValidationError):
+            storage.view.upload_chunk(request)
+
+        tempdir = get_upload_tempdir(request, create=False)
+        assert os.listdir(tempdir) == []
+
+    def test_size_limit(self, storage):
+        request = RequestFactory().post("/", data={
+            "paperContentType": ContentType.objects.get_for_model(UploadedFile).pk,
+            "paperOwnerAppLabel": "validators_fields",
+            "paperOwnerModelName": "page",
+            "paperOwnerFieldName": "filter_size",
+            "paperUUID": str(uuid.uuid4()),
+            "paperChunkIndex": 2,
+            "paperTotalChunkCount": 3,
+            "paperChunkSize": 1024,
+            "paperTotalFileSize": 10 ** 12,
+            "file": SimpleUploadedFile("data.txt", b"a" * 1024),
+        })
+        request.user = storage.user
+        request.session = {}
+        response = UploadFileView.as_view()(request)
+
+        # место под файл заявленного размера не выделяется
+        response_data = json.loads(response.content)
+        assert response_data["preventRetry"] is True
+        assert "is too large" in response_data["errors"][0]
+
+        tempdir = get_upload_tempdir(request, create=False)
+        assert os.listdir(tempdir) == []
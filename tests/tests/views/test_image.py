@@ -1,10 +1,12 @@
 import json
+import uuid
 
 import pytest
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import JsonResponse
 from django.test import RequestFactory
 from examples.fields.proxy_models.models import Page, UploadedImageProxy
@@ -78,6 +80,35 @@ class TestUploadFileView:
             with open(NASA_FILEPATH, "rb") as fp:
                 storage.view.handle(fp)
 
+    def test_validate_first_chunk(self, storage):
+        with open(CALLIPHORA_FILEPATH, "rb") as fp:
+            content = fp.read()
+
+        def send_first_chunk(chunk_size):
+            request = RequestFactory().post("/", data={
+                "paperContentType": storage.content_type.pk,
+                "paperOwnerAppLabel": "validators_fields",
+                "paperOwnerModelName": "page",
+                "paperOwnerFieldName": "filter_max_size",
+                "paperUUID": str(uuid.uuid4()),
+                "paperChunkIndex": 0,
+                "paperTotalChunkCount": 3,
+                "paperTotalFileSize": len(content),
+                "file": SimpleUploadedFile("calliphora.jpg", content[:chunk_size]),
+            })
+            request.user = storage.user
+            request.session = {}
+            response = UploadFileView.as_view()(request)
+            return json.loads(response.content)
+
+        # размеры изображения читаются из заголовка
+        response = send_first_chunk(16 * 1024)
+        assert response["preventRetry"] is True
+        assert "is too tall" in response["errors"][0]
+
+        # размеры не удалось прочитать - проверка откладывается
+        assert send_first_chunk(100) == {}
+
     def test_success(self, storage):
         request = RequestFactory().post("/", data={
             "paperContentType": storage.content_type.pk,